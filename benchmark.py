@@ -0,0 +1,557 @@
+import argparse
+import io
+import re
+import time
+
+import numpy as np
+
+ENTITY_RE = re.compile(r"\[([^\]]+)\]\([^)]+\)")
+
+
+def load_md_examples(path):
+    """(intent, text) pairs of a rasa markdown training data file."""
+
+    examples = []
+    intent = None
+    with io.open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("## "):
+                intent = line[len("## intent:"):] if line.startswith("## intent:") else None
+            elif intent is not None and line.startswith("- "):
+                examples.append((intent, ENTITY_RE.sub(r"\1", line[2:]).strip()))
+
+    return examples
+
+
+def latency_report(name, durations, extra=""):
+    durations = np.asarray(durations) * 1000.0
+    print(
+        "{:<14} {:>10.1f} msg/s  p50 {:>7.3f} ms  p99 {:>7.3f} ms  {}".format(
+            name,
+            len(durations) / (durations.sum() / 1000.0),
+            np.percentile(durations, 50),
+            np.percentile(durations, 99),
+            extra,
+        )
+    )
+
+
+def word_spans(tokens):
+    # character spans of the words, ignoring the spaces between them
+    spans = set()
+    start = 0
+    for t in tokens:
+        n = len(t.text.replace("_", ""))
+        spans.add((start, start + n))
+        start += n
+    return spans
+
+
+def bench_tokenizers(args):
+    from custom_code.segmenters import registered_segmenters
+    from custom_code.tokenizer import ViTokenizer
+
+    texts = [text for _, text in load_md_examples(args.data)]
+
+    results = {}
+    for backend in sorted(registered_segmenters):
+        tokenizer = ViTokenizer({"backend": backend, "cache_size": 0})
+        # the dictionary is built from the same examples it is measured on
+        tokenizer.segmenter.train(texts)
+
+        durations = []
+        for _ in range(args.repeat):
+            for text in texts:
+                start = time.perf_counter()
+                tokenizer.tokenize(text)
+                durations.append(time.perf_counter() - start)
+        results[backend] = ([tokenizer.tokenize(t) for t in texts], durations)
+
+    reference = results["underthesea"][0]
+    print("{} messages from {}, {} runs".format(len(texts), args.data, args.repeat))
+    for backend, (tokens, durations) in sorted(results.items()):
+        same = 0
+        found = correct = expected = 0
+        for ref, out in zip(reference, tokens):
+            ref_spans, out_spans = word_spans(ref), word_spans(out)
+            same += ref_spans == out_spans
+            found += len(out_spans)
+            expected += len(ref_spans)
+            correct += len(ref_spans & out_spans)
+
+        precision = correct / found if found else 0.0
+        recall = correct / expected if expected else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if correct else 0.0
+        latency_report(
+            backend,
+            durations,
+            "identical {:6.2%}  word F1 {:.4f}".format(same / len(texts), f1),
+        )
+
+
+def legacy_tfidf_tokenizer(featurizer, text):
+    # TfidfFeaturizer.tokenizer before the pattern and OOV words were frozen
+    tokens = re.compile(featurizer.token_pattern).findall(text.strip())
+
+    if featurizer.oov_token:
+        if hasattr(featurizer.tfidf, "vocabulary_"):
+            if featurizer.oov_token in featurizer.tfidf.vocabulary_:
+                tokens = [
+                    t if t in featurizer.tfidf.vocabulary_.keys() else featurizer.oov_token
+                    for t in tokens
+                ]
+        elif featurizer.oov_words:
+            tokens = [featurizer.oov_token if t in featurizer.oov_words else t for t in tokens]
+
+    return tokens
+
+
+def time_per_message(tokenize, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            tokenize(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def bench_tfidf_tokenizer(args):
+    from collections import Counter
+
+    from rasa_nlu.training_data import Message, TrainingData
+
+    from custom_code.featurizer import TfidfFeaturizer
+
+    examples = [(intent, text.lower()) for intent, text in load_md_examples(args.data)]
+    texts = [text for _, text in examples]
+    counts = Counter(w for text in texts for w in text.split())
+    # the rarest words of the data are the OOV words
+    oov_words = [w for w, _ in counts.most_common()[-args.oov_words:]]
+
+    featurizer = TfidfFeaturizer(
+        {"oov_token": "__oov__", "oov_words": oov_words, "min_df": 1}
+    )
+
+    print(
+        "{} messages from {}, {} OOV words, {} runs".format(
+            len(texts), args.data, len(featurizer.oov_words), args.repeat
+        )
+    )
+
+    def compare(phase):
+        before = time_per_message(
+            lambda t: legacy_tfidf_tokenizer(featurizer, t), texts, args.repeat
+        )
+        after = time_per_message(featurizer.tokenizer, texts, args.repeat)
+        print(
+            "{:<8} before {:8.2f} us/msg  after {:8.2f} us/msg  ({:.1f}x)".format(
+                phase, before, after, before / after
+            )
+        )
+
+    # before fitting the OOV words are replaced, after fitting the
+    # words missing from the vocabulary
+    compare("train")
+    featurizer.train(
+        TrainingData([Message(t, {"intent": i}) for i, t in examples]), None
+    )
+    assert featurizer.tfidf is not None, "TfidfFeaturizer failed to fit"
+    compare("predict")
+
+
+def with_reducer(pipeline, reducer):
+    """The pipeline with a FeatureReducer after its last featurizer."""
+
+    pipeline = [dict(c) for c in pipeline]
+    if reducer is not None:
+        last = max(
+            i
+            for i, c in enumerate(pipeline)
+            if "featurizer" in c["name"].lower() and "regex" not in c["name"].lower()
+        )
+        reducer = dict(reducer, name="custom_code.reducer.FeatureReducer")
+        pipeline.insert(last + 1, reducer)
+
+    return pipeline
+
+
+def feature_dim(interpreter, text):
+    from rasa_nlu.training_data import Message
+
+    from custom_code.batch import process_batch
+
+    message = Message(text)
+    process_batch(interpreter.pipeline, [message], interpreter.context)
+    return message.get("text_features").shape[-1]
+
+
+def bench_reduction(args):
+    from sklearn.metrics import accuracy_score, f1_score
+    from sklearn.model_selection import StratifiedKFold
+
+    from rasa_nlu import config, utils
+    from rasa_nlu.components import ComponentBuilder
+    from rasa_nlu.training_data import TrainingData, load_data
+
+    from custom_code.trainer import ViTrainer
+
+    raw = utils.read_yaml_file(args.config)
+    data = load_data(args.data)
+    examples = data.intent_examples
+    labels = [e.get("intent") for e in examples]
+    folds = StratifiedKFold(args.folds, shuffle=True, random_state=42)
+    # the spacy model is loaded once for all runs
+    builder = ComponentBuilder(use_cache=True)
+
+    print(
+        "{} examples from {}, {} folds, {} components".format(
+            len(examples), args.data, args.folds, args.n_components
+        )
+    )
+
+    variants = [("none", None)] + [
+        (method, {"method": method, "n_components": args.n_components})
+        for method in args.methods
+    ]
+    for name, reducer in variants:
+        cfg = config.RasaNLUModelConfig(
+            dict(raw, pipeline=with_reducer(raw["pipeline"], reducer))
+        )
+
+        y_true, y_pred, durations = [], [], []
+        train_time = 0.0
+        dim = None
+        for train_index, test_index in folds.split(examples, labels):
+            train_data = TrainingData(
+                [examples[i] for i in train_index],
+                data.entity_synonyms,
+                data.regex_features,
+                data.lookup_tables,
+            )
+
+            start = time.perf_counter()
+            interpreter = ViTrainer(cfg, builder).train(train_data)
+            train_time += time.perf_counter() - start
+
+            for i in test_index:
+                start = time.perf_counter()
+                result = interpreter.parse(examples[i].text)
+                durations.append(time.perf_counter() - start)
+
+                y_true.append(labels[i])
+                y_pred.append((result.get("intent") or {}).get("name"))
+
+            if dim is None:
+                dim = feature_dim(interpreter, examples[0].text)
+
+        latency_report(
+            name,
+            durations,
+            "accuracy {:.4f}  macro F1 {:.4f}  train {:7.1f} s  {} features".format(
+                accuracy_score(y_true, y_pred),
+                f1_score(y_true, y_pred, average="macro"),
+                train_time,
+                dim,
+            ),
+        )
+
+
+def print_profile(report):
+    print(
+        "{:<32} {:<14} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "component", "phase", "calls", "p50 ms", "p95 ms", "p99 ms", "memory MB"
+        )
+    )
+    for name, phases in report.items():
+        for phase, stats in sorted(phases.items()):
+            print(
+                "{:<32} {:<14} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.1f}".format(
+                    name,
+                    phase,
+                    stats["count"],
+                    stats["p50_ms"],
+                    stats["p95_ms"],
+                    stats["p99_ms"],
+                    stats["memory"] / 1024.0 ** 2,
+                )
+            )
+
+
+def bench_profile(args):
+    import json
+
+    if args.from_dump:
+        with io.open(args.from_dump, "r", encoding="utf-8") as f:
+            print_profile(json.load(f))
+        return
+
+    from custom_code import profiler
+
+    # before loading, the registry only instruments classes resolved
+    # while profiling is enabled
+    profiler.enable()
+
+    from rasa_nlu.model import Interpreter
+
+    interpreter = Interpreter.load(args.model)
+    texts = [text for _, text in load_md_examples(args.data)]
+    for _ in range(args.repeat):
+        for text in texts:
+            interpreter.parse(text)
+
+    print("{} messages from {}, {} runs".format(len(texts), args.data, args.repeat))
+    print_profile(profiler.profiler.report())
+    if args.dump:
+        profiler.profiler.dump(args.dump)
+
+
+def sales_action_calls(senders):
+    """Action calls of action_sales_response for senders with a chosen
+    product."""
+
+    from custom_code import actions
+
+    calls = []
+    for i in range(senders):
+        sender_id = "bench-{}".format(i)
+        actions.current_products.set(
+            sender_id,
+            {
+                "pname": "sme",
+                "org_field": "thương_mại",
+                "ppack": "standard",
+                "pscopes": 11.0,
+                "pprice": 6950000,
+                "puprice": 2000000,
+            },
+        )
+        calls.append(
+            {
+                "next_action": "action_sales_response",
+                "sender_id": sender_id,
+                "tracker": {
+                    "sender_id": sender_id,
+                    "slots": {},
+                    "latest_message": {
+                        "text": "có khuyến mãi không",
+                        "intent": {"name": "ask_sales", "confidence": 1.0},
+                        "intent_ranking": [],
+                        "entities": [],
+                    },
+                    "events": [],
+                },
+                "domain": {},
+            }
+        )
+
+    return calls
+
+
+def bench_actions(args):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from rasa_core_sdk import Tracker
+    from rasa_core_sdk.executor import CollectingDispatcher
+
+    from custom_code import actions
+    from custom_code.async_server import AsyncActionExecutor
+    from custom_code.backends import FakePromotionsBackend
+
+    actions.promotions_backend = FakePromotionsBackend(
+        lambda: actions.reference_data.snapshot.promotions,
+        args.latency,
+        args.latency / 4,
+    )
+    calls = sales_action_calls(args.senders)
+    action = actions.action_sales_response()
+
+    def run_sync(call):
+        start = time.perf_counter()
+        dispatcher = CollectingDispatcher()
+        action.run(dispatcher, Tracker.from_dict(call["tracker"]), call["domain"])
+        return time.perf_counter() - start, dispatcher.messages
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        results = list(pool.map(run_sync, calls))
+    sync_seconds = time.perf_counter() - start
+
+    executor = AsyncActionExecutor()
+    executor.register_action(action)
+
+    async def run_async(call):
+        start = time.perf_counter()
+        response = await executor.run(call)
+        return time.perf_counter() - start, response["responses"]
+
+    async def run_all():
+        return await asyncio.gather(*[run_async(c) for c in calls])
+
+    loop = asyncio.new_event_loop()
+    start = time.perf_counter()
+    async_results = loop.run_until_complete(run_all())
+    async_seconds = time.perf_counter() - start
+    loop.close()
+    executor.close()
+
+    assert [r for _, r in results] == [r for _, r in async_results]
+
+    print(
+        "{} senders, promotions lookup of {:.0f} ms".format(
+            args.senders, args.latency * 1000.0
+        )
+    )
+    for name, seconds, durations in [
+        ("sync {} thr".format(args.workers), sync_seconds, [d for d, _ in results]),
+        ("asyncio", async_seconds, [d for d, _ in async_results]),
+    ]:
+        durations = np.asarray(durations) * 1000.0
+        print(
+            "{:<14} {:>10.1f} senders/s  p50 {:>8.1f} ms  p99 {:>8.1f} ms".format(
+                name,
+                len(calls) / seconds,
+                np.percentile(durations, 50),
+                np.percentile(durations, 99),
+            )
+        )
+
+
+def typo(text, rng):
+    """text with one random deletion, substitution or transposition"""
+
+    i = rng.randrange(len(text) - 1)
+    edit = rng.choice(["delete", "substitute", "transpose"])
+    if edit == "delete":
+        return text[:i] + text[i + 1 :]
+    elif edit == "substitute":
+        return text[:i] + rng.choice("abcdeghiklmnopqrstuvxy") + text[i + 1 :]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2 :]
+
+
+def bench_fuzzy_slots(args):
+    import random
+
+    from custom_code.fuzzy import fold
+    from custom_code.reference_data import ReferenceData
+
+    data = ReferenceData.load(args.data_dir)
+    rng = random.Random(args.seed)
+
+    # (mapping, its fuzzy index, key) of every key of the slot mappings
+    keys = [(data.products, data.product_index, k) for k in data.products]
+    keys += [(data.packages, data.package_index, k) for k in data.packages]
+    for product, scope_names in data.scopes.items():
+        keys += [(scope_names, data.scope_indexes[product], k) for k in scope_names]
+
+    queries = {
+        "exact": [(m, index, k, k) for m, index, k in keys],
+        "no diacritics": [(m, index, fold(k), k) for m, index, k in keys],
+        "typo": [
+            (m, index, typo(fold(k), rng), k) for m, index, k in keys if len(k) > 8
+        ],
+    }
+
+    print(
+        "{:<14} {:>6}  {:>13} {:>10}  {:>13} {:>10}".format(
+            "queries", "count", "exact found", "us/lookup", "fuzzy found", "us/lookup"
+        )
+    )
+    for name, group in queries.items():
+        row = [name, len(group)]
+        for lookup in [
+            lambda m, index, text: m.get(text),
+            lambda m, index, text: index.get(text),
+        ]:
+            found = sum(
+                1 for m, index, text, key in group if lookup(m, index, text) == m[key]
+            )
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for m, index, text, _ in group:
+                    lookup(m, index, text)
+            seconds = (time.perf_counter() - start) / (args.repeat * len(group))
+            row += ["{:.1%}".format(found / len(group)), seconds * 1e6]
+
+        print("{:<14} {:>6}  {:>13} {:>10.2f}  {:>13} {:>10.2f}".format(*row))
+
+
+commands = {
+    "tokenizers": bench_tokenizers,
+    "tfidf-tokenizer": bench_tfidf_tokenizer,
+    "reduction": bench_reduction,
+    "profile": bench_profile,
+    "actions": bench_actions,
+    "fuzzy-slots": bench_fuzzy_slots,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the NLU pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+
+    tokenizers = subparsers.add_parser(
+        "tokenizers",
+        help="throughput and agreement with underthesea of the "
+        "ViTokenizer segmentation backends",
+    )
+    tokenizers.add_argument("--data", default="data/nlu.md")
+    tokenizers.add_argument("--repeat", type=int, default=3)
+
+    tfidf_tokenizer = subparsers.add_parser(
+        "tfidf-tokenizer",
+        help="per message cost of TfidfFeaturizer.tokenizer "
+        "before and after freezing the OOV handling",
+    )
+    tfidf_tokenizer.add_argument("--data", default="data/nlu.md")
+    tfidf_tokenizer.add_argument("--oov-words", type=int, default=200)
+    tfidf_tokenizer.add_argument("--repeat", type=int, default=20)
+
+    reduction = subparsers.add_parser(
+        "reduction",
+        help="cross validated intent accuracy, training time and parse "
+        "latency with and without a FeatureReducer",
+    )
+    reduction.add_argument("--config", default="nlu_config.yml")
+    reduction.add_argument("--data", default="data/nlu.md")
+    reduction.add_argument("--folds", type=int, default=3)
+    reduction.add_argument("--n-components", type=int, default=256)
+    reduction.add_argument(
+        "--methods", nargs="+", default=["svd", "select", "random"]
+    )
+
+    profile = subparsers.add_parser(
+        "profile",
+        help="per component latency percentiles and load memory of a "
+        "trained model, or of a dump written with NLU_PROFILE_FILE",
+    )
+    profile.add_argument("--model", default="models/nlu/default/chat")
+    profile.add_argument("--data", default="data/nlu.md")
+    profile.add_argument("--repeat", type=int, default=3)
+    profile.add_argument("--dump", help="write the profile to this json file")
+    profile.add_argument("--from-dump", help="print a profile json file instead")
+
+    actions = subparsers.add_parser(
+        "actions",
+        help="throughput of action_sales_response for many concurrent "
+        "senders, on a thread pool and on one event loop",
+    )
+    actions.add_argument("--senders", type=int, default=500)
+    actions.add_argument("--workers", type=int, default=8)
+    actions.add_argument(
+        "--latency", type=float, default=0.05, help="seconds per promotions lookup"
+    )
+
+    fuzzy_slots = subparsers.add_parser(
+        "fuzzy-slots",
+        help="share of slot values without diacritics or with a typo "
+        "resolved, and lookup time, of the exact and fuzzy mappings",
+    )
+    fuzzy_slots.add_argument("--data-dir", default="custom_code")
+    fuzzy_slots.add_argument("--repeat", type=int, default=200)
+    fuzzy_slots.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+    else:
+        commands[args.command](args)
@@ -1,12 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 import datetime
-import json
 import logging
-import time
-from typing import Text, List, Dict, Any
+import os
+from typing import Text, List, Dict, Any, Optional
 
-import pandas as pd
 from rasa_core_sdk import Action, Tracker, ActionExecutionRejection
 from rasa_core_sdk.events import (
     SlotSet,
@@ -17,45 +15,77 @@ from rasa_core_sdk.events import (
     FollowupAction,
 )
 from rasa_core_sdk.executor import CollectingDispatcher
-from rasa_core_sdk.forms import FormAction, REQUESTED_SLOT
+from rasa_core_sdk.forms import REQUESTED_SLOT
 from tabulate import tabulate
 
-logger = logging.getLogger(__name__)
+from custom_code.async_actions import (
+    AsyncAction,
+    AsyncFormAction,
+    lookup,
+    run_blocking,
+)
+from custom_code.backends import FakePromotionsBackend
+from custom_code.reference_data import ReferenceDataManager
+from custom_code.sessions import create_session_store
+from custom_code.tracing import traced
 
-NOW = datetime.datetime.now()
+logger = logging.getLogger(__name__)
 
 # time to keeping product
 PRODUCT_KEPT_TIME = 3000
 
-# TODO: replace all mappings with ml model(s)
-# intents mapping
-vi_intents_mapping = json.load(open("custom_code/vi_intents.json", "r"))
+# max number of kept products, the least recently used ones are dropped
+MAX_SESSIONS = 10000
 
-# packages mapping
-packages_mapping = json.load(open("custom_code/package_mapping.json", "r"))
+# where products are kept, memory:// (default), sqlite:///sessions.db to
+# share them between the worker processes of a host or redis://host:6379/0
+# (see custom_code.sessions)
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory://")
 
-# scopes mapping
-scopes_mapping = json.load(open("custom_code/scope_mapping.json", "r"))
+# seconds between checks for changed mappings or catalogue, 0 to never
+# reload them
+REFERENCE_DATA_RELOAD = float(os.environ.get("REFERENCE_DATA_RELOAD", 5))
 
-# entities mapping
-product_mapping = json.load(open("custom_code/product_mapping.json", "r"))
+# seconds an action waits for a backend lookup
+LOOKUP_TIMEOUT = float(os.environ.get("ACTION_LOOKUP_TIMEOUT", 2))
 
-for k, v in scopes_mapping.items():
-    for x in v:
-        product_mapping[x] = k
+# TODO: replace all mappings with ml model(s)
+# intents, packages, scopes and entities mappings and the product catalogue,
+# take one snapshot per request (see custom_code.reference_data)
+reference_data = ReferenceDataManager(
+    "custom_code", interval=REFERENCE_DATA_RELOAD
+).start()
 
-# product dataframe
-productdf = pd.read_csv("custom_code/data.csv")
+# TODO: query the sales db
+promotions_backend = FakePromotionsBackend(lambda: reference_data.snapshot.promotions)
 
 # current products (sender_id as key)
-current_products = {}
+current_products = create_session_store(
+    SESSION_STORE, PRODUCT_KEPT_TIME, max_size=MAX_SESSIONS
+)
+
+
+def get_current_product(sender_id: Text) -> Optional[Dict[Text, Any]]:
+    """Product chosen by the sender in product_form, None if there is none
+    or it was chosen more than PRODUCT_KEPT_TIME seconds ago."""
+
+    return current_products.get(sender_id)
 
 
 def cvt_number(num):
     return "{0:,}".format(num).replace(",", ".")
 
 
+def format_date(date):
+    return "{}/{}/{}".format(date.day, date.month, date.year)
+
+
 def intent_ranking_tabular(tracker: Tracker):
+    # the table is only built to be logged, see custom_code.tracing for
+    # the ranking of sampled action runs
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
     try:
         logger.debug(
             "message: {}\n".format(tracker.latest_message["text"])
@@ -73,7 +103,8 @@ def intent_ranking_tabular(tracker: Tracker):
         logger.error("No intent on {}".format(tracker.latest_message["text"]))
 
 
-class product_form(FormAction):
+@traced
+class product_form(AsyncFormAction):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
 
@@ -143,6 +174,7 @@ class product_form(FormAction):
     def validate(
         self, dispatcher, tracker, domain
     ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        data = reference_data.snapshot
         slot_values = self.extract_other_slots(dispatcher, tracker, domain)
         new_slot_values = {}
 
@@ -165,7 +197,7 @@ class product_form(FormAction):
                 value = value.strip().lower()
 
             if slot == "pname":
-                pvalue = product_mapping.get(value, value)
+                pvalue = data.product_index.get(value, value)
 
                 # confusing case (sme)
                 # if value == "kế_toán":
@@ -182,15 +214,14 @@ class product_form(FormAction):
 
                     # predict pscopes and ppack if value is scope's name
                     try:
-                        svalue = scopes_mapping[pvalue][value]
+                        svalue = data.scope_indexes[pvalue][value]
 
                         if svalue is not None:  # ["11", "13", "16"]
-                            r = productdf.loc[
-                                (productdf["pname"] == pvalue)
-                                & (productdf["pscopes"] >= float(svalue))
-                            ]
-                            if len(r) > 0:
-                                new_slot_values["ppack"] = r.iloc[0]["ppack"]
+                            product = data.catalogue.find(
+                                pvalue, min_pscopes=float(svalue)
+                            )
+                            if product is not None:
+                                new_slot_values["ppack"] = product.ppack
 
                         new_slot_values["pscopes"] = svalue
 
@@ -198,7 +229,7 @@ class product_form(FormAction):
                         pass
 
             elif slot == "org_field":
-                pvalue = packages_mapping.get(value, value)
+                pvalue = data.package_index.get(value, value)
 
                 if pvalue not in ["standard", "professional", "enterprise"]:
                     dispatcher.utter_template("utter_ask_org_field", tracker)
@@ -214,15 +245,12 @@ class product_form(FormAction):
                         pname = slot_values.get("pname", None)
 
                     if pname is not None:
-                        r = productdf.loc[
-                            (productdf["pname"] == pname)
-                            & (productdf["ppack"] == pvalue)
-                        ]
-                        if len(r) > 0:
-                            new_slot_values["pscopes"] = str(r.iloc[0]["pscopes"])
+                        product = data.catalogue.find(pname, pvalue)
+                        if product is not None:
+                            new_slot_values["pscopes"] = str(product.pscopes)
 
             elif slot == "ppack":
-                value = packages_mapping.get(value, value)
+                value = data.package_index.get(value, value)
 
                 if value not in ["standard", "professional", "enterprise"]:
                     dispatcher.utter_template("utter_ask_org_field", tracker)
@@ -235,19 +263,16 @@ class product_form(FormAction):
                     # required pname
                     pname = tracker.get_slot("pname")
                     if pname is not None:
-                        r = productdf.loc[
-                            (productdf["pname"] == pname)
-                            & (productdf["ppack"] == value)
-                        ]
-                        if len(r) > 0:
-                            new_slot_values["pscopes"] = str(r.iloc[0]["pscopes"])
+                        product = data.catalogue.find(pname, value)
+                        if product is not None:
+                            new_slot_values["pscopes"] = str(product.pscopes)
 
             elif slot == "pscopes":
                 new_slot_values["called_pscopes"] = True
 
-                r = productdf.loc[productdf["pscopes"] >= float(value)]
-                if len(r) > 0:
-                    new_slot_values["ppack"] = r.iloc[0]["ppack"]
+                product = data.catalogue.find(min_pscopes=float(value))
+                if product is not None:
+                    new_slot_values["ppack"] = product.ppack
 
             slot_values = {**slot_values, **new_slot_values}
             # skip asking pscopes ("16")
@@ -264,6 +289,7 @@ class product_form(FormAction):
     def submit(
         self, dispatcher, tracker, domain
     ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        catalogue = reference_data.snapshot.catalogue
         pname = tracker.get_slot("pname")
         ppack = tracker.get_slot("ppack")
         org_field = tracker.get_slot("org_field")
@@ -274,20 +300,12 @@ class product_form(FormAction):
         except Exception as e:
             pscopes = 0  # ???
 
-        r = productdf.loc[
-            (productdf["pname"] == pname)
-            & (productdf["ppack"] == ppack)
-            & (productdf["pscopes"] >= pscopes)
-        ]
+        product = catalogue.find(pname, ppack, pscopes)
 
-        if len(r) == 0:
-            r = productdf.loc[
-                (productdf["pname"] == pname) & (productdf["pscopes"] >= pscopes)
-            ]
-
-        if len(r) > 0:
-            r = r.iloc[0]
+        if product is None:
+            product = catalogue.find(pname, min_pscopes=pscopes)
 
+        if product is not None:
             # TODO: show prices with intents
             # if tracker.latest_message["intent"]["name"] in [
             #     "change_product",
@@ -298,24 +316,26 @@ class product_form(FormAction):
                 "Em tư vấn cho anh/chị gói {} đáp ứng tốt nghiệp vụ kế toán của doanh nghiệp {}. "
                 "Gói sản phẩm {} {} có giá là {} VNĐ."
                 "".format(
-                    r["ppack"].upper(),
+                    product.ppack.upper(),
                     org_field.replace("_", " "),
                     pname.upper(),
-                    r["ppack"].upper(),
-                    cvt_number(r["pprice"]),
+                    product.ppack.upper(),
+                    cvt_number(product.pprice),
                 )
             )
 
             # save product to df
-            current_products[tracker.sender_id] = {
-                "pname": r["pname"],
-                "org_field": org_field,
-                "ppack": r["ppack"],
-                "pscopes": pscopes,
-                "pprice": r["pprice"],
-                "puprice": r["puprice"],
-                "timestamp": time.time(),
-            }
+            current_products.set(
+                tracker.sender_id,
+                {
+                    "pname": product.pname,
+                    "org_field": org_field,
+                    "ppack": product.ppack,
+                    "pscopes": pscopes,
+                    "pprice": product.pprice,
+                    "puprice": product.puprice,
+                },
+            )
 
         else:
             # deadend
@@ -325,13 +345,21 @@ class product_form(FormAction):
             SlotSet(x, None) for x in self.required_slots(tracker)
         ]
 
-    def run(
+    async def submit_async(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        # saving the product may wait on the session store
+        return await run_blocking(self.submit, dispatcher, tracker, domain)
+
+    async def run_async(
         self, dispatcher, tracker, domain
     ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
         # activate the form
         events = self._activate_if_required(tracker)
         # validate user input
-        events.extend(self._validate_if_required(dispatcher, tracker, domain))
+        events.extend(
+            await self._validate_if_required_async(dispatcher, tracker, domain)
+        )
 
         # check that the form wasn't deactivated in validation
         if Form(None) not in events:
@@ -349,7 +377,9 @@ class product_form(FormAction):
                 events.extend(next_slot_events)
             else:
                 # there is nothing more to request, so we can submit
-                events.extend(self.submit(dispatcher, temp_tracker, domain))
+                events.extend(
+                    await self.submit_async(dispatcher, temp_tracker, domain)
+                )
                 # deactivate the form after submission
                 events.extend(self.deactivate())
 
@@ -358,6 +388,7 @@ class product_form(FormAction):
         return events
 
 
+@traced
 class action_change_product(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -370,16 +401,9 @@ class action_change_product(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -406,6 +430,7 @@ class action_change_product(Action):
             ]
 
 
+@traced
 class action_buy(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -418,16 +443,9 @@ class action_buy(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             # dispatcher.utter_message(
             #     "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             # )
@@ -446,6 +464,7 @@ class action_buy(Action):
         return []
 
 
+@traced
 class action_extended_price_response(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -458,16 +477,9 @@ class action_extended_price_response(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -485,6 +497,7 @@ class action_extended_price_response(Action):
         return []
 
 
+@traced
 class action_trial_response(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -497,16 +510,9 @@ class action_trial_response(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -525,11 +531,12 @@ class action_trial_response(Action):
         return []
 
 
-class action_sales_response(Action):
+@traced
+class action_sales_response(AsyncAction):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
 
-    def run(
+    async def run_async(
         self,
         dispatcher,  # type: CollectingDispatcher
         tracker,  # type: Tracker
@@ -537,16 +544,9 @@ class action_sales_response(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = await run_blocking(get_current_product, tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -554,13 +554,31 @@ class action_sales_response(Action):
             # callback to response
             return [ActionReverted(), Form("product_form")]  # callback
 
-        if NOW.month == 4 and NOW.year == 2019:  # query in sales_db
+        promotions = await lookup(
+            promotions_backend.promotions(curr["pname"], datetime.datetime.now()),
+            LOOKUP_TIMEOUT,
+            name="promotions of {}".format(curr["pname"]),
+        )
+
+        if promotions is None:
             dispatcher.utter_message(
-                "Trong thời gian từ 1/4/2019-30/4/2019, sản phẩm {} có chương trình khuyến mại sau:\n"
-                "1. Tặng voucher trị giá 2.950.000 đ cho doanh nghiệp mới thành lập 3 tháng cuối năm 2018 và 2019\n"
-                "2. Tặng 500 hóa đơn khi mua MISA SME.NET 2019 kèm dịch vụ hóa đơn điện tử meInvoice.vn\n"
-                "3. Tặng voucher 2.000.000 đ cho doanh nghiệp nâng cấp từ gói Starter lên gói cao hơn"
-                "".format(curr["pname"].upper())
+                "Hiện tại em chưa tra cứu được chương trình khuyến mại của sản phẩm {}, "
+                "anh/chị vui lòng hỏi lại sau ạ".format(curr["pname"].upper())
+            )
+
+        elif promotions:
+            dispatcher.utter_message(
+                "Trong thời gian từ {}-{}, sản phẩm {} có chương trình khuyến mại sau:\n"
+                "{}"
+                "".format(
+                    format_date(min(p.start for p in promotions)),
+                    format_date(max(p.last_day for p in promotions)),
+                    curr["pname"].upper(),
+                    "\n".join(
+                        "{}. {}".format(i, p.text)
+                        for i, p in enumerate(promotions, 1)
+                    ),
+                )
             )
 
         else:
@@ -573,6 +591,7 @@ class action_sales_response(Action):
         return []
 
 
+@traced
 class action_ask_training(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -585,16 +604,9 @@ class action_ask_training(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -625,6 +637,7 @@ class action_ask_training(Action):
         return []
 
 
+@traced
 class action_training_response(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -675,6 +688,7 @@ class action_training_response(Action):
         return []
 
 
+@traced
 class action_complain_price_response(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -687,16 +701,9 @@ class action_complain_price_response(Action):
     ):  # type: (...) -> List[Dict[Text, Any]]
         intent_ranking_tabular(tracker)
 
-        curr = current_products.get(tracker.sender_id, None)
+        curr = get_current_product(tracker.sender_id)
         logger.debug(curr)
-        if curr is None or time.time() - curr["timestamp"] >= PRODUCT_KEPT_TIME:
-            # remove product
-            try:
-                current_products.pop(tracker.sender_id)
-
-            except Exception as e:
-                pass
-
+        if curr is None:
             dispatcher.utter_message(
                 "Anh/chị chưa chọn sản phẩm nào, mời anh/chị chọn sản phẩm"
             )
@@ -724,6 +731,7 @@ class action_complain_price_response(Action):
         return []
 
 
+@traced
 class action_reset(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -737,17 +745,14 @@ class action_reset(Action):
 
         dispatcher.utter_template("utter_thanks", tracker)
 
-        try:
-            # remove current product
-            current_products.pop(tracker.sender_id)
-
-        except Exception as e:
-            pass
+        # remove current product
+        current_products.pop(tracker.sender_id)
 
         return [Restarted()]
 
 
 # two-stage fallback actions
+@traced
 class action_default_ask_affirmation(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -772,7 +777,7 @@ class action_default_ask_affirmation(Action):
 
         dispatcher.utter_button_message(
             "Có phải anh/chị muốn {}".format(
-                vi_intents_mapping.get(last_intent, last_intent)
+                reference_data.snapshot.intents.get(last_intent, last_intent)
             ),
             buttons=[
                 {"title": "Đúng", "payload": affirm_payload},
@@ -784,6 +789,7 @@ class action_default_ask_affirmation(Action):
         return [UserUtteranceReverted(), ActionReverted()]
 
 
+@traced
 class action_default_ask_rephrase(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -800,6 +806,7 @@ class action_default_ask_rephrase(Action):
 
 
 # fallback action
+@traced
 class action_default_fallback(Action):
     def name(self):  # type: () -> Text
         return self.__class__.__name__
@@ -0,0 +1,138 @@
+"""Base classes of actions doing their work as coroutines.
+
+An `AsyncAction` implements `run_async` instead of `run`, so it can await
+slow lookups (promotions, prices, ...) side by side and with a timeout
+each (`lookup`) instead of blocking a worker thread while they are
+pending, and hands blocking calls (e.g. the session store) to a thread
+(`run_blocking`) so they don't stall the event loop. Run by
+`custom_code.async_server`, many conversations share one event loop.
+Their synchronous `run` still works in the rasa_core_sdk action server,
+one event loop per call."""
+
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Text
+
+from rasa_core_sdk import Action, Tracker
+from rasa_core_sdk.events import Form
+from rasa_core_sdk.executor import CollectingDispatcher
+from rasa_core_sdk.forms import FormAction
+
+logger = logging.getLogger(__name__)
+
+
+def run_sync(coroutine: Awaitable) -> Any:
+    """Result of a coroutine, in a new event loop of this thread."""
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def run_blocking(func: Callable, *args: Any) -> Any:
+    """Result of a blocking call, made in the default thread pool of the
+    event loop so the other coroutines run meanwhile."""
+
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(func, *args)
+    )
+
+
+async def lookup(
+    awaitable: Awaitable,
+    timeout: Optional[float],
+    default: Any = None,
+    name: Text = "lookup",
+) -> Any:
+    """Result of a lookup, `default` if it takes more than `timeout`
+    seconds or fails."""
+
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        logger.warning("{} timed out after {}s".format(name, timeout))
+    except Exception:
+        logger.exception("{} failed".format(name))
+
+    return default
+
+
+class AsyncAction(Action):
+    async def run_async(
+        self,
+        dispatcher,  # type: CollectingDispatcher
+        tracker,  # type: Tracker
+        domain,  # type:  Dict[Text, Any]
+    ):  # type: (...) -> List[Dict[Text, Any]]
+        raise NotImplementedError("An async action must implement its run_async method")
+
+    def run(
+        self,
+        dispatcher,  # type: CollectingDispatcher
+        tracker,  # type: Tracker
+        domain,  # type:  Dict[Text, Any]
+    ):  # type: (...) -> List[Dict[Text, Any]]
+        return run_sync(self.run_async(dispatcher, tracker, domain))
+
+
+class AsyncFormAction(FormAction):
+    """`FormAction` with awaitable `validate_async` and `submit_async`,
+    which call the synchronous `validate` and `submit` unless they are
+    overridden."""
+
+    async def validate_async(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        return self.validate(dispatcher, tracker, domain)
+
+    async def submit_async(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        return self.submit(dispatcher, tracker, domain)
+
+    async def _validate_if_required_async(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        if tracker.latest_action_name == "action_listen" and tracker.active_form.get(
+            "validate", True
+        ):
+            logger.debug("Validating user input '{}'".format(tracker.latest_message))
+            return await self.validate_async(dispatcher, tracker, domain)
+
+        logger.debug("Skipping validation")
+        return []
+
+    async def run_async(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        # same steps as FormAction.run
+        events = self._activate_if_required(tracker)
+        events.extend(
+            await self._validate_if_required_async(dispatcher, tracker, domain)
+        )
+
+        if Form(None) not in events:
+            temp_tracker = tracker.copy()
+            for e in events:
+                if e["event"] == "slot":
+                    temp_tracker.slots[e["name"]] = e["value"]
+
+            next_slot_events = self.request_next_slot(dispatcher, temp_tracker, domain)
+
+            if next_slot_events is not None:
+                events.extend(next_slot_events)
+            else:
+                events.extend(await self.submit_async(dispatcher, temp_tracker, domain))
+                events.extend(self.deactivate())
+
+        return events
+
+    def run(
+        self, dispatcher, tracker, domain
+    ):  # type: (CollectingDispatcher, Tracker, Dict[Text, Any]) -> List[Dict]
+        return run_sync(self.run_async(dispatcher, tracker, domain))
@@ -0,0 +1,222 @@
+"""Action server on asyncio, a stand-in for `rasa_core_sdk.endpoint`.
+
+Serves the same webhook (POST /webhook with the action call of rasa
+core, answered with the events and responses) and GET /health. Actions
+with a `run_async` (see `custom_code.async_actions`) run on the event
+loop, so one process serves many conversations while their lookups are
+pending. The synchronous ones run in a pool of `workers` threads.
+
+    python -m custom_code.async_server --actions custom_code.actions --port 5055"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import asyncio
+import importlib
+import inspect
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Text, Tuple
+
+from rasa_core_sdk import Action, ActionExecutionRejection, Tracker
+from rasa_core_sdk.executor import ActionExecutor, CollectingDispatcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVER_PORT = 5055
+
+# largest request body accepted, trackers of long conversations are big
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class AsyncActionExecutor(object):
+    def __init__(self, workers: int = 8) -> None:
+        self.actions = {}  # type: Dict[Text, Action]
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def register_action(self, action: Action) -> None:
+        self.actions[action.name()] = action
+        logger.debug("Registered action '{}'".format(action.name()))
+
+    def register_package(self, package: Text) -> None:
+        """Register the actions defined in a module."""
+
+        module = importlib.import_module(package)
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if (
+                issubclass(cls, Action)
+                and cls.__module__ == module.__name__
+                and not inspect.isabstract(cls)
+            ):
+                self.register_action(cls())
+
+    async def run(self, action_call: Dict[Text, Any]) -> Dict[Text, Any]:
+        action_name = action_call.get("next_action")
+        action = self.actions.get(action_name)
+        if action is None:
+            raise Exception(
+                "No registered Action found for name '{}'.".format(action_name)
+            )
+
+        tracker = Tracker.from_dict(action_call.get("tracker"))
+        domain = action_call.get("domain", {})
+        dispatcher = CollectingDispatcher()
+
+        if hasattr(action, "run_async"):
+            events = await action.run_async(dispatcher, tracker, domain)
+        else:
+            events = await asyncio.get_running_loop().run_in_executor(
+                self._pool, action.run, dispatcher, tracker, domain
+            )
+
+        # drop what isn't an event like the rasa_core_sdk action server
+        events = ActionExecutor.validate_events(events or [], action_name)
+
+        return {"events": events, "responses": dispatcher.messages}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+class ActionServer(object):
+    """Minimal HTTP/1.1 server with keep-alive for the webhook."""
+
+    def __init__(
+        self,
+        executor: AsyncActionExecutor,
+        host: Text = "0.0.0.0",
+        port: int = DEFAULT_SERVER_PORT,
+    ) -> None:
+        self.executor = executor
+        self.host = host
+        self.port = port
+        self._server = None  # type: Optional[asyncio.AbstractServer]
+
+    async def _route(
+        self, method: Text, path: Text, body: bytes
+    ) -> Tuple[int, Dict[Text, Any]]:
+        path = path.split("?", 1)[0]
+
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+
+        if path != "/webhook" or method != "POST":
+            return 404, {"error": "Not found"}
+
+        try:
+            action_call = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return 400, {"error": "Invalid json"}
+
+        try:
+            return 200, await self.executor.run(action_call)
+        except ActionExecutionRejection as e:
+            logger.error(str(e.message))
+            return 400, {"error": e.message, "action_name": e.action_name}
+        except Exception as e:
+            logger.exception(
+                "Running action '{}' failed".format(action_call.get("next_action"))
+            )
+            return 500, {"error": str(e)}
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                method, path, version = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    status, payload, body = 400, {"error": "Request too large"}, None
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._route(method.upper(), path, body)
+
+                keep_alive = (
+                    body is not None
+                    and headers.get("connection", "").lower() != "close"
+                    and not version.strip().upper().endswith("1.0")
+                )
+
+                content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    "HTTP/1.1 {} {}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Content-Length: {}\r\n"
+                    "Connection: {}\r\n\r\n".format(
+                        status,
+                        _REASONS[status],
+                        len(content),
+                        "keep-alive" if keep_alive else "close",
+                    ).encode("latin-1")
+                    + content
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free one
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Action server listening on {}:{}".format(self.host, self.port))
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.executor.close()
+
+    def serve_forever(self) -> None:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.start())
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.stop())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Asyncio action server")
+    parser.add_argument("--actions", default="custom_code.actions")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_SERVER_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="threads running the actions without run_async",
+    )
+    cmdline_args = parser.parse_args()
+
+    action_executor = AsyncActionExecutor(cmdline_args.workers)
+    action_executor.register_package(cmdline_args.actions)
+
+    ActionServer(action_executor, cmdline_args.host, cmdline_args.port).serve_forever()
@@ -0,0 +1,46 @@
+"""Backends the actions query, with local fakes until the real services
+are connected."""
+
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+import datetime
+import random
+from typing import Callable, List, Text
+
+from custom_code.promotions import Campaign, PromotionsEngine
+
+
+class FakeBackend(object):
+    """Answers after `latency` (+- `jitter`) seconds like a remote
+    database."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+
+    async def _wait(self) -> None:
+        if self.latency or self.jitter:
+            delay = self.latency + random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(max(delay, 0.0))
+
+
+class FakePromotionsBackend(FakeBackend):
+    """Promotions of the products from the local campaigns of
+    `engine()`."""
+
+    def __init__(
+        self,
+        engine: Callable[[], PromotionsEngine],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+    ) -> None:
+        super(FakePromotionsBackend, self).__init__(latency, jitter)
+        self.engine = engine
+
+    async def promotions(self, pname: Text, now: datetime.datetime) -> List[Campaign]:
+        """Campaigns of a product running at `now`."""
+
+        await self._wait()
+        return self.engine().active(pname, now)
+
@@ -0,0 +1,110 @@
+"""Run many messages through a trained NLU model at once.
+
+Used for offline evaluation and bulk re-labeling of historical messages:
+components with a `process_batch` method (e.g. `TfidfFeaturizer`) get
+the whole batch in one call, all others process the messages one by
+one, exactly as `Interpreter.parse` does."""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Text
+
+from rasa_nlu.components import Component
+from rasa_nlu.model import Interpreter
+from rasa_nlu.training_data import Message, load_data
+
+logger = logging.getLogger(__name__)
+
+
+def process_batch(
+    pipeline: List[Component], messages: List[Message], context: Dict[Text, Any]
+) -> None:
+    for component in pipeline:
+        if hasattr(component, "process_batch"):
+            component.process_batch(messages, **context)
+        else:
+            for message in messages:
+                component.process(message, **context)
+
+
+def parse_batch(
+    interpreter: Interpreter,
+    texts: Iterable[Text],
+    batch_size: int = 512,
+    time: Optional[Text] = None,
+    only_output_properties: bool = True,
+) -> List[Dict[Text, Any]]:
+    """Parse texts like `Interpreter.parse`, `batch_size` at a time."""
+
+    texts = list(texts)
+    results = []
+
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start : start + batch_size]
+        messages = [
+            Message(text, interpreter.default_output_attributes(), time=time)
+            for text in batch
+            if text
+        ]
+
+        process_batch(interpreter.pipeline, messages, interpreter.context)
+
+        parsed = iter(messages)
+        for text in batch:
+            output = interpreter.default_output_attributes()
+            if text:
+                output.update(
+                    next(parsed).as_dict(only_output_properties=only_output_properties)
+                )
+            else:
+                output["text"] = ""
+            results.append(output)
+
+    return results
+
+
+def read_texts(path: Text) -> List[Dict[Text, Any]]:
+    """Examples of rasa training data, or one message per line of text."""
+
+    if path.endswith((".md", ".json")):
+        return [
+            {"text": e.text, "intent": e.get("intent")}
+            for e in load_data(path).training_examples
+        ]
+
+    with io.open(path, "r", encoding="utf-8") as f:
+        return [{"text": line.strip(), "intent": None} for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse a file of messages with a trained NLU model"
+    )
+    parser.add_argument("model", help="model directory, e.g. models/nlu/default/chat")
+    parser.add_argument("input", help="rasa training data or a text file")
+    parser.add_argument("output", help="jsonl file for the parse results")
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    interpreter = Interpreter.load(args.model)
+    examples = read_texts(args.input)
+    parsed = parse_batch(interpreter, [e["text"] for e in examples], args.batch_size)
+
+    labeled = correct = 0
+    with io.open(args.output, "w", encoding="utf-8") as f:
+        for example, result in zip(examples, parsed):
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+            if example["intent"] is not None:
+                labeled += 1
+                predicted = (result.get("intent") or {}).get("name")
+                correct += example["intent"] == predicted
+
+    if labeled:
+        print(
+            "Intent accuracy: {:.4f} ({}/{})".format(correct / labeled, correct, labeled)
+        )
@@ -0,0 +1,123 @@
+"""Immutable, indexed product catalogue of the actions.
+
+Answers the lookups of `product_form` ("the first product named pname,
+of package ppack, with at least pscopes scopes") the way a boolean mask
+over the csv followed by `iloc[0]` does, i.e. the first matching row in
+file order, but with a dict lookup and a binary search instead of a scan
+of every row, and without pandas."""
+
+from __future__ import absolute_import, division, print_function
+
+import csv
+import io
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Text, Tuple
+
+Product = NamedTuple(
+    "Product",
+    [
+        ("pname", Text),
+        ("ppack", Text),
+        ("pscopes", Any),
+        ("pprice", Any),
+        ("puprice", Any),
+    ],
+)
+
+# matches every value of a field in `Catalogue.find`
+ANY = object()
+
+
+class ScopeIndex(object):
+    """Products sorted by pscopes, with the first product in file order
+    of every suffix, so the first one with at least x scopes is a binary
+    search away."""
+
+    def __init__(self, rows: List[Tuple[int, Product]]) -> None:
+        rows = sorted(rows, key=lambda row: (row[1].pscopes, row[0]))
+        self._scopes = [product.pscopes for _, product in rows]
+
+        self._first = [None] * len(rows)  # type: List[Optional[Product]]
+        first = None  # type: Optional[Tuple[int, Product]]
+        for i in range(len(rows) - 1, -1, -1):
+            if first is None or rows[i][0] < first[0]:
+                first = rows[i]
+            self._first[i] = first[1]
+
+    def first(self, min_pscopes: Any = None) -> Optional[Product]:
+        if min_pscopes is None:
+            i = 0
+        elif min_pscopes != min_pscopes:
+            # nan, nothing is greater or equal
+            return None
+        else:
+            i = bisect_left(self._scopes, min_pscopes)
+
+        return self._first[i] if i < len(self._first) else None
+
+    def __len__(self) -> int:
+        return len(self._first)
+
+
+class Catalogue(object):
+    def __init__(self, products: Iterable[Product]) -> None:
+        self.products = tuple(products)
+
+        rows = defaultdict(list)  # type: Dict[Tuple[Any, Any], List]
+        for i, product in enumerate(self.products):
+            for key in [
+                (product.pname, product.ppack),
+                (product.pname, ANY),
+                (ANY, product.ppack),
+                (ANY, ANY),
+            ]:
+                rows[key].append((i, product))
+
+        self._indexes = {
+            key: ScopeIndex(key_rows) for key, key_rows in rows.items()
+        }  # type: Dict[Tuple[Any, Any], ScopeIndex]
+
+    @classmethod
+    def from_csv(cls, path: Text) -> "Catalogue":
+        with io.open(path, "r", encoding="utf-8", newline="") as f:
+            records = list(csv.DictReader(f))
+
+        columns = {
+            field: _column_type([r[field] for r in records])
+            for field in Product._fields
+        }
+        return cls(
+            Product(**{field: columns[field](r[field]) for field in Product._fields})
+            for r in records
+        )
+
+    def find(
+        self, pname: Any = ANY, ppack: Any = ANY, min_pscopes: Any = None
+    ) -> Optional[Product]:
+        """First product, in file order, with the given pname and ppack
+        and at least `min_pscopes` scopes, None if there is none."""
+
+        index = self._indexes.get((pname, ppack))
+        if index is None:
+            return None
+
+        return index.first(min_pscopes)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+
+def _column_type(values: List[Text]) -> Callable[[Text], Any]:
+    """int or float if all values of a column are numbers, like
+    `pandas.read_csv` infers them."""
+
+    for number in [int, float]:
+        try:
+            for value in values:
+                number(value)
+        except ValueError:
+            continue
+        return number
+
+    return str
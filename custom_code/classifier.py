@@ -0,0 +1,89 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+from typing import Any, Dict, Optional, Text, Tuple
+
+import numpy as np
+import scipy.sparse
+from rasa_nlu.classifiers.embedding_intent_classifier import EmbeddingIntentClassifier
+from rasa_nlu.classifiers.sklearn_intent_classifier import SklearnIntentClassifier
+from rasa_nlu.config import RasaNLUModelConfig
+from rasa_nlu.training_data import Message, TrainingData
+
+from custom_code.feature_store import dense_text_features, training_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class ViSklearnIntentClassifier(SklearnIntentClassifier):
+    """`SklearnIntentClassifier` that trains on sparse text_features
+    without densifying them, the SVC handles csr input directly, and on
+    the matrix of the feature store without stacking it again."""
+
+    def train(
+        self, training_data, cfg, **kwargs
+    ):  # type: (TrainingData, RasaNLUModelConfig, **Any) -> None
+        labels = [e.get("intent") for e in training_data.intent_examples]
+
+        if len(set(labels)) < 2:
+            logger.warning(
+                "Can not train an intent classifier. "
+                "Need at least 2 different classes. "
+                "Skipping training of intent classifier."
+            )
+        else:
+            y = self.transform_labels_str2num(labels)
+            X = training_matrix(
+                training_data.intent_examples, kwargs.get("feature_store")
+            )
+
+            self.clf = self._create_classifier(kwargs.get("num_threads", 1), y)
+            self.clf.fit(X, y)
+
+
+class ViEmbeddingIntentClassifier(EmbeddingIntentClassifier):
+    """`EmbeddingIntentClassifier` accepting sparse text_features.
+
+    The network needs dense input, so the features are densified only
+    here: once for the training matrix and per message in `process`.
+    The matrix of the feature store is used as is."""
+
+    def train(
+        self, training_data, cfg=None, **kwargs
+    ):  # type: (TrainingData, Optional[RasaNLUModelConfig], **Any) -> None
+        self._feature_store = kwargs.get("feature_store")
+        try:
+            super(ViEmbeddingIntentClassifier, self).train(
+                training_data, cfg, **kwargs
+            )
+        finally:
+            self._feature_store = None
+
+    def _prepare_data_for_training(
+        self, training_data: TrainingData, intent_dict: Dict[Text, int]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        X = training_matrix(
+            training_data.intent_examples,
+            getattr(self, "_feature_store", None),
+            dense=True,
+        )
+        intents_for_X = np.array(
+            [intent_dict[e.get("intent")] for e in training_data.intent_examples]
+        )
+        Y = np.stack(
+            [self.encoded_all_intents[intent_idx] for intent_idx in intents_for_X]
+        )
+
+        return X, Y, intents_for_X
+
+    def process(self, message, **kwargs):  # type: (Message, **Any) -> None
+        features = message.get("text_features")
+
+        if scipy.sparse.issparse(features):
+            message.set("text_features", dense_text_features(features))
+            try:
+                super(ViEmbeddingIntentClassifier, self).process(message, **kwargs)
+            finally:
+                message.set("text_features", features)
+        else:
+            super(ViEmbeddingIntentClassifier, self).process(message, **kwargs)
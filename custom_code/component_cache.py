@@ -0,0 +1,277 @@
+"""Components shared by all interpreters of the process.
+
+We serve several NLU models side by side (per tenant variants of the chat
+model) and most of their components are identical, above all `SpacyNLP`
+with the whole vi_fasttext vector table. `SharedComponentBuilder` loads a
+component only if no identical one is loaded yet and hands out the loaded
+one otherwise.
+
+Two components are identical if they have the same class, the same meta
+in metadata.json and the same content of the files the meta refers to:
+the `file` written by `persist`, a file of the model directory or the
+prefix of files like the tensorflow checkpoints, is replaced by a hash
+of the file contents, so the names of the files don't matter."""
+
+from __future__ import absolute_import, division, print_function
+
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+from rasa_nlu.components import Component, ComponentBuilder, MissingArgumentError
+from rasa_nlu.model import Interpreter, Metadata
+
+from custom_code.feature_cache import fingerprint
+from custom_code.profiler import rss_bytes
+from custom_code.pruning import prune_interpreter
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(object):
+    __slots__ = ["key", "name", "component", "refcount", "memory", "seconds"]
+
+    def __init__(
+        self,
+        key: Text,
+        name: Text,
+        component: Component,
+        memory: Optional[int],
+        seconds: float,
+    ) -> None:
+        self.key = key
+        self.name = name
+        self.component = component
+        self.refcount = 0
+        # growth of the resident memory while loading it
+        self.memory = memory
+        self.seconds = seconds
+
+
+class SharedComponentCache(object):
+    """Loaded components by key, with the number of interpreters using
+    each of them. A component is dropped when the last one releases it."""
+
+    def __init__(self) -> None:
+        # loads hold the lock, so the memory growth is the component's
+        self._lock = threading.RLock()
+        self._entries = {}  # type: Dict[Text, CacheEntry]
+        self._keys = {}  # type: Dict[int, Text]
+        self._file_hashes = {}  # type: Dict[Tuple[Text, int, int], Text]
+
+    def _hash_file(self, path: Text) -> Text:
+        st = os.stat(path)
+        stamp = (path, st.st_size, st.st_mtime_ns)
+        if stamp not in self._file_hashes:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            self._file_hashes[stamp] = h.hexdigest()
+
+        return self._file_hashes[stamp]
+
+    def _resolve_file(self, value: Any, model_dir: Text) -> Any:
+        if not isinstance(value, str) or not value or model_dir is None:
+            return value
+
+        path = os.path.join(model_dir, value)
+        if os.path.isfile(path):
+            return {"file": self._hash_file(path)}
+
+        # e.g. the checkpoint files of the embedding classifier
+        prefixed = sorted(glob.glob(glob.escape(path) + "*"))
+        if prefixed:
+            return {
+                "files": [
+                    [p[len(path) :], self._hash_file(p)]
+                    for p in prefixed
+                    if os.path.isfile(p)
+                ]
+            }
+
+        return value
+
+    def key(
+        self, component_class: type, component_meta: Dict[Text, Any], model_dir: Text
+    ) -> Text:
+        meta = dict(component_meta)
+        if "file" in meta:
+            with self._lock:
+                meta["file"] = self._resolve_file(meta["file"], model_dir)
+
+        return fingerprint(
+            component_class.__module__, component_class.__name__, meta
+        )
+
+    def acquire(self, key: Text, load: Callable[[], Component]) -> Component:
+        """The component of `key`, loaded by `load` if there is none."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                before = rss_bytes()
+                start = time.time()
+                component = load()
+                seconds = time.time() - start
+                after = rss_bytes()
+
+                memory = after - before if before is not None else None
+                entry = CacheEntry(key, component.name, component, memory, seconds)
+                self._entries[key] = entry
+                self._keys[id(component)] = key
+
+                logger.debug(
+                    "Loaded shared component {} in {:.3f}s".format(entry.name, seconds)
+                )
+            else:
+                logger.debug("Reusing shared component {}".format(entry.name))
+
+            entry.refcount += 1
+            return entry.component
+
+    def release(self, component: Component) -> None:
+        with self._lock:
+            key = self._keys.get(id(component))
+            if key is None:
+                return
+
+            entry = self._entries[key]
+            entry.refcount -= 1
+            if entry.refcount <= 0:
+                del self._entries[key]
+                del self._keys[id(component)]
+                logger.debug("Dropped shared component {}".format(entry.name))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def report(self) -> List[Dict[Text, Any]]:
+        """Loaded components, their users and the memory they save."""
+
+        with self._lock:
+            entries = list(self._entries.values())
+
+        return [
+            {
+                "name": e.name,
+                "key": e.key[:12],
+                "refcount": e.refcount,
+                "memory": e.memory,
+                "saved": e.memory * (e.refcount - 1) if e.memory else 0,
+                "seconds": round(e.seconds, 3),
+            }
+            for e in sorted(entries, key=lambda e: -(e.memory or 0))
+        ]
+
+    def log_report(self, level: int = logging.INFO) -> None:
+        if not logger.isEnabledFor(level):
+            return
+
+        report = self.report()
+        mb = 1024.0 ** 2
+        for r in report:
+            logger.log(
+                level,
+                "{:<32} {} used by {:>2}  {:>9.1f} MB  saved {:>9.1f} MB".format(
+                    r["name"],
+                    r["key"],
+                    r["refcount"],
+                    (r["memory"] or 0) / mb,
+                    r["saved"] / mb,
+                )
+            )
+        logger.log(
+            level,
+            "{} shared components, {:.1f} MB loaded, {:.1f} MB saved".format(
+                len(report),
+                sum(r["memory"] or 0 for r in report) / mb,
+                sum(r["saved"] for r in report) / mb,
+            )
+        )
+
+
+# the cache of the process
+shared_cache = SharedComponentCache()
+
+
+class SharedComponentBuilder(ComponentBuilder):
+    """`ComponentBuilder` loading components through a shared cache.
+
+    Unlike the cache of `ComponentBuilder`, which only knows `SpacyNLP`
+    and lives as long as the builder, every component is shared and by
+    every builder of the process."""
+
+    def __init__(self, cache: Optional[SharedComponentCache] = None) -> None:
+        super(SharedComponentBuilder, self).__init__(use_cache=True)
+        self.cache = cache if cache is not None else shared_cache
+
+    def load_component(
+        self,
+        component_meta: Dict[Text, Any],
+        model_dir: Text,
+        model_metadata: Metadata,
+        **context: Any
+    ) -> Component:
+        from rasa_nlu import registry
+
+        component_name = component_meta.get("class", component_meta["name"])
+        component_class = registry.get_component_class(component_name)
+        key = self.cache.key(component_class, component_meta, model_dir)
+
+        try:
+            return self.cache.acquire(
+                key,
+                lambda: registry.load_component_by_meta(
+                    component_meta, model_dir, model_metadata, None, **context
+                ),
+            )
+        except MissingArgumentError as e:
+            raise Exception(
+                "Failed to load component from file `{}`. "
+                "{}".format(component_meta.get("file"), e)
+            )
+
+
+def load_interpreter(
+    model_dir: Text,
+    builder: Optional[SharedComponentBuilder] = None,
+    prune: bool = True,
+) -> Interpreter:
+    """`Interpreter.load` sharing the components with all interpreters
+    loaded by this function, without the components that can't produce
+    output if `prune` (see `custom_code.pruning`)."""
+
+    from rasa_nlu import registry
+
+    builder = builder or SharedComponentBuilder()
+    interpreter = Interpreter.load(model_dir, builder)
+    registry.log_import_report(logging.DEBUG)
+
+    if prune:
+        for component in prune_interpreter(interpreter):
+            builder.cache.release(component)
+
+    builder.cache.log_report(logging.DEBUG)
+    return interpreter
+
+
+def release_interpreter(
+    interpreter: Interpreter, cache: Optional[SharedComponentCache] = None
+) -> None:
+    """Release the components of an interpreter that is not used anymore."""
+
+    cache = cache if cache is not None else shared_cache
+    for component in interpreter.pipeline:
+        cache.release(component)
+
+    cache.log_report(logging.DEBUG)
@@ -0,0 +1,173 @@
+"""On-disk cache of per-example component outputs.
+
+Entries are content addressed: the key of an example's outputs is a hash
+of the producing component's config and fitted state and of what it
+reads of the example, its text and the keys (or values) of its input
+attributes. Retraining with the same key finds the outputs in the cache,
+so only new or edited examples are processed again (see
+`custom_code.trainer.ViTrainer`)."""
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Text
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(*parts: Any) -> Text:
+    """Stable hash of json serializable values and raw bytes."""
+
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\x00")
+
+    return h.hexdigest()
+
+
+class ComponentStats(object):
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[Text, Any]:
+        total = self.hits + self.misses
+        return {
+            "examples": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.hits / total if total else 0.0,
+            "bytes_written": self.bytes_written,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+class FeatureCache(object):
+    """Least recently used files of pickled values in `cache_dir`.
+
+    The total size of the entries is kept below `max_size` bytes, a hit
+    refreshes the modification time of its file, which orders the
+    eviction across runs."""
+
+    def __init__(self, cache_dir: Text, max_size: int = 2 * 1024 ** 3) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        self.size = 0
+        self.evictions = 0
+        self.stats = defaultdict(ComponentStats)  # type: Dict[Text, ComponentStats]
+
+        self._entries = OrderedDict()  # key -> size, least recent first
+        self._scan()
+
+    def _path(self, key: Text) -> Text:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _scan(self) -> None:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_mtime, name, st.st_size))
+
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self.size += size
+
+    def get(self, key: Text, component: Text) -> Optional[Any]:
+        if key not in self._entries:
+            self.stats[component].misses += 1
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path, None)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # removed by another process or incomplete, recompute it
+            self._forget(key)
+            self.stats[component].misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats[component].hits += 1
+        return value
+
+    def put(self, key: Text, value: Any, component: Text) -> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_size:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first, readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._forget(key)
+        self._entries[key] = len(data)
+        self.size += len(data)
+        self.stats[component].bytes_written += len(data)
+
+        self._evict()
+
+    def _forget(self, key: Text) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self.size -= size
+
+    def _evict(self) -> None:
+        while self.size > self.max_size and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def add_time(self, component: Text, seconds: float) -> None:
+        self.stats[component].seconds += seconds
+
+    def report(self) -> Dict[Text, Any]:
+        return {
+            "cache_dir": self.cache_dir,
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "evictions": self.evictions,
+            "components": {
+                name: stats.as_dict() for name, stats in self.stats.items()
+            },
+        }
+
+    def log_report(self) -> None:
+        for name, stats in self.report()["components"].items():
+            logger.info(
+                "Feature cache {}: {hits}/{examples} examples skipped "
+                "({skipped:.1%}), {seconds}s spent, {bytes_written} bytes "
+                "written".format(name, **stats)
+            )
+        logger.info(
+            "Feature cache holds {} entries, {} of {} bytes, {} evicted"
+            "".format(len(self._entries), self.size, self.max_size, self.evictions)
+        )
+
@@ -0,0 +1,179 @@
+"""text_features of the training examples as one preallocated matrix.
+
+Featurizers that support it (`ViSpacyFeaturizer`, `TfidfFeaturizer`
+without `sparse`) hand the features of all intent examples to the
+`FeatureStore` of `custom_code.trainer.ViTrainer` at once, instead of
+concatenating them to the text_features of every single example. The
+store allocates a single float32 matrix with the columns of all of them,
+writes every block into its column slice and gives the examples row
+views of it, the Vi* classifiers then train on the matrix directly."""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+from collections import OrderedDict
+from typing import Any, List, Optional, Text, Tuple
+
+import numpy as np
+import scipy.sparse
+from rasa_nlu.training_data import Message
+
+logger = logging.getLogger(__name__)
+
+
+def stack_text_features(examples: List[Message], dense: bool = False) -> Any:
+    """Stack the text_features of examples into one matrix.
+
+    The result is a csr matrix if any example has sparse features
+    (see the `sparse` option of `TfidfFeaturizer`) and dense ones are
+    not requested, a numpy array otherwise."""
+
+    return stack_rows([e.get("text_features") for e in examples], dense)
+
+
+def stack_rows(rows: List[Any], dense: bool = False) -> Any:
+    if any(scipy.sparse.issparse(r) for r in rows):
+        X = scipy.sparse.vstack(
+            [r if scipy.sparse.issparse(r) else np.atleast_2d(r) for r in rows],
+            format="csr",
+        )
+        return X.toarray() if dense else X
+
+    return np.stack(rows)
+
+
+def dense_text_features(features: Any) -> np.ndarray:
+    if scipy.sparse.issparse(features):
+        return features.toarray().squeeze(axis=0)
+    return features
+
+
+def training_matrix(
+    examples: List[Message],
+    feature_store: Optional["FeatureStore"] = None,
+    dense: bool = False,
+) -> Any:
+    """text_features of the examples, the matrix of the feature store of
+    `ViTrainer` if it holds them, stacked otherwise."""
+
+    if feature_store is not None:
+        X = feature_store.matrix_of(examples)
+        if X is not None:
+            return X
+
+    return stack_text_features(examples, dense)
+
+
+class FeatureStore(object):
+    """Column blocks of the text_features of `examples`.
+
+    `add` only keeps a reference to a block, the matrix is allocated by
+    `materialize` once the total number of columns is known."""
+
+    def __init__(self, examples: List[Message], dtype: Any = np.float32) -> None:
+        self.examples = examples
+        self.dtype = dtype
+
+        # featurizer name -> its columns of the matrix
+        self.columns = OrderedDict()  # type: OrderedDict[Text, slice]
+
+        self._blocks = []  # type: List[Tuple[Text, Any]]
+        self._matrix = None  # type: Optional[np.ndarray]
+        self._rows = []  # type: List[np.ndarray]
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._blocks)
+
+    def add(self, name: Text, features: Any) -> None:
+        """Append the features of all examples, one row per example."""
+
+        if features.shape[0] != len(self.examples):
+            raise ValueError(
+                "Features of {} have {} rows, the feature store has {} "
+                "examples".format(name, features.shape[0], len(self.examples))
+            )
+
+        if not self._blocks:
+            # features set by featurizers that don't use the store, e.g.
+            # the regex featurizer, come first like they would if combined
+            existing = [e.get("text_features") for e in self.examples]
+            if self._is_current(existing):
+                self._blocks.extend(
+                    (n, self._matrix[:, s]) for n, s in self.columns.items()
+                )
+            elif any(f is not None for f in existing):
+                self._blocks.append(("text_features", stack_rows(existing)))
+
+        self._blocks.append((name, features))
+
+    def materialize(self) -> Optional[np.ndarray]:
+        """Copy the blocks into one matrix, the examples get row views of
+        it as text_features."""
+
+        if not self._blocks:
+            return self._matrix
+
+        n = len(self.examples)
+        dim = sum(block.shape[1] for _, block in self._blocks)
+        matrix = np.empty((n, dim), dtype=self.dtype)
+
+        self.columns = OrderedDict()
+        start = 0
+        for name, block in self._blocks:
+            end = start + block.shape[1]
+            columns = matrix[:, start:end]
+            if scipy.sparse.issparse(block):
+                # scatter the nonzeros, no dense copy of the block
+                block = block.tocoo()
+                columns.fill(0)
+                columns[block.row, block.col] = block.data
+            else:
+                columns[...] = block
+            self.columns[name] = slice(start, end)
+            start = end
+
+        logger.debug(
+            "Feature store of {} examples and {} columns: {}".format(
+                n,
+                dim,
+                ", ".join(
+                    "{} {}".format(name, s.stop - s.start)
+                    for name, s in self.columns.items()
+                ),
+            )
+        )
+
+        self._blocks = []
+        self._matrix = matrix
+        self._rows = list(matrix)
+        for example, row in zip(self.examples, self._rows):
+            example.set("text_features", row)
+
+        return matrix
+
+    def replace(self, name: Text, features: Any) -> np.ndarray:
+        """Replace all columns, e.g. by a projection of them."""
+
+        self._blocks = [(name, features)]
+        return self.materialize()
+
+    def _is_current(self, features: List[Any]) -> bool:
+        return self._matrix is not None and all(
+            f is row for f, row in zip(features, self._rows)
+        )
+
+    def matrix_of(self, examples: List[Message]) -> Optional[np.ndarray]:
+        """The matrix, if it still holds the text_features of `examples`.
+
+        Returns None if the features were changed outside of the store
+        or `examples` are not the examples of the store."""
+
+        self.materialize()
+
+        if len(examples) != len(self._rows):
+            return None
+        if not self._is_current([e.get("text_features") for e in examples]):
+            return None
+
+        return self._matrix
@@ -1,21 +1,296 @@
 from __future__ import absolute_import, division, print_function
 
+import itertools
 import logging
 import os
 import re
-from typing import Any, Dict, List, Optional, Text
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text, Tuple, Union
 
 import numpy as np
+import scipy.sparse
 from rasa_nlu import utils
 from rasa_nlu.config import RasaNLUModelConfig
 from rasa_nlu.featurizers import Featurizer
+from rasa_nlu.featurizers.spacy_featurizer import SpacyFeaturizer
 from rasa_nlu.model import Metadata
 from rasa_nlu.training_data import Message, TrainingData
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from custom_code.feature_cache import fingerprint
+from custom_code.string_table import StringTable, map_file
 
 logger = logging.getLogger(__name__)
 
 
+class StreamingTfidfVectorizer(object):
+    """TF-IDF vectorizer fitted in bounded memory.
+
+    Words are hashed into `n_features` columns instead of being kept in a
+    vocabulary, and only the document frequency of every column is
+    accumulated while fitting, so documents can be streamed in chunks and
+    `partial_fit` updates the IDF weights when new data arrives."""
+
+    def __init__(
+            self,
+            tokenizer: Callable[[Text], List[Text]],
+            n_features: int = 2 ** 18,
+            strip_accents: Optional[Text] = None,
+            lowercase: bool = True,
+            stop_words: Optional[Union[Text, List[Text]]] = None,
+            ngram_range: Tuple[int, int] = (1, 1),
+            min_df: Union[int, float] = 1,
+            max_df: Union[int, float] = 1.0,
+            binary: bool = False,
+            dtype: Any = np.float32,
+            norm: Optional[Text] = "l2",
+            use_idf: bool = True,
+            smooth_idf: bool = True,
+            sublinear_tf: bool = False,
+    ) -> None:
+        self.hasher = HashingVectorizer(
+            tokenizer=tokenizer,
+            token_pattern=None,
+            n_features=n_features,
+            strip_accents=strip_accents,
+            lowercase=lowercase,
+            stop_words=stop_words,
+            ngram_range=ngram_range,
+            binary=binary,
+            norm=None,
+            alternate_sign=False,
+            dtype=dtype,
+        )
+        self.n_features = n_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.norm = norm
+        self.use_idf = use_idf
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+
+        self.n_docs = 0
+        self.df = np.zeros(n_features, dtype=np.int64)
+        self.weights_ = None
+
+    def partial_fit(self, raw_documents: Iterable[Text]) -> "StreamingTfidfVectorizer":
+        # noinspection PyPep8Naming
+        X = self.hasher.transform(raw_documents)
+
+        # rows of the hashed matrix have no duplicate columns
+        self.df += np.bincount(X.indices, minlength=self.n_features)
+        self.n_docs += X.shape[0]
+        self._update_weights()
+
+        return self
+
+    def fit(
+            self, raw_documents: Iterable[Text], chunk_size: int = 10000
+    ) -> "StreamingTfidfVectorizer":
+        self.n_docs = 0
+        self.df[:] = 0
+
+        documents = iter(raw_documents)
+        while True:
+            chunk = list(itertools.islice(documents, chunk_size))
+            if not chunk:
+                break
+            self.partial_fit(chunk)
+
+        if not self.n_docs:
+            raise ValueError("empty training data")
+
+        return self
+
+    def _update_weights(self) -> None:
+        min_df = self.min_df if isinstance(self.min_df, int) else self.min_df * self.n_docs
+        max_df = self.max_df if isinstance(self.max_df, int) else self.max_df * self.n_docs
+
+        # columns outside of [min_df, max_df] are dropped by a zero weight
+        weights = ((self.df >= min_df) & (self.df <= max_df)).astype(np.float32)
+
+        if self.use_idf:
+            n_docs = self.n_docs + int(self.smooth_idf)
+            df = self.df + int(self.smooth_idf)
+            # columns never seen while fitting have no IDF, without
+            # smoothing they are dropped like TfidfVectorizer's unknown words
+            weights *= np.where(df > 0, np.log(n_docs / np.maximum(df, 1)) + 1, 0)
+
+        self.weights_ = weights
+
+    def transform(self, raw_documents: Iterable[Text]) -> scipy.sparse.csr_matrix:
+        # noinspection PyPep8Naming
+        X = self.hasher.transform(raw_documents)
+
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+
+        X.data *= self.weights_[X.indices]
+        X.eliminate_zeros()
+
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+
+        return X
+
+
+class MappedTfidfVectorizer(object):
+    """Read-only TF-IDF vectorizer backed by memory mapped arrays.
+
+    The vocabulary is a sorted `StringTable` with the column of every
+    term in a parallel numpy array, next to the IDF vector. Loading maps
+    the files instead of unpickling a `TfidfVectorizer`, so it is almost
+    free and forked workers share the pages. Terms are found by binary
+    search instead of a dict lookup."""
+
+    def __init__(
+            self,
+            vocabulary: StringTable,
+            columns: np.ndarray,
+            idf: Optional[np.ndarray],
+            analyzer: Callable[[Text], List[Text]],
+            binary: bool = False,
+            dtype: Any = np.float32,
+            norm: Optional[Text] = "l2",
+            sublinear_tf: bool = False,
+    ) -> None:
+        self.vocabulary_ = vocabulary
+        self.columns = columns
+        self.idf_ = idf
+        self.analyzer = analyzer
+        self.binary = binary
+        self.dtype = dtype
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    @staticmethod
+    def save(
+            vocabulary: Dict[Text, int],
+            idf: Optional[np.ndarray],
+            vocabulary_path: Text,
+            columns_path: Text,
+            idf_path: Optional[Text],
+    ) -> None:
+        terms = sorted(vocabulary, key=lambda t: t.encode("utf-8"))
+
+        with open(vocabulary_path, "wb") as f:
+            f.write(StringTable.encode(terms))
+        np.save(columns_path, np.array([vocabulary[t] for t in terms], dtype=np.int32))
+        if idf_path is not None:
+            np.save(idf_path, idf)
+
+    @classmethod
+    def load(
+            cls,
+            vocabulary_path: Text,
+            columns_path: Text,
+            idf_path: Optional[Text],
+            **kwargs: Any
+    ) -> "MappedTfidfVectorizer":
+        return cls(
+            StringTable(map_file(vocabulary_path)),
+            np.load(columns_path, mmap_mode="r", allow_pickle=False),
+            np.load(idf_path, mmap_mode="r", allow_pickle=False) if idf_path else None,
+            **kwargs
+        )
+
+    def vocabulary_dict(self) -> Dict[Text, int]:
+        return {t: int(c) for t, c in zip(self.vocabulary_, self.columns)}
+
+    def transform(self, raw_documents: Iterable[Text]) -> scipy.sparse.csr_matrix:
+        indptr = [0]
+        indices = []
+        values = []
+        for doc in raw_documents:
+            counts = {}
+            for term in self.analyzer(doc):
+                i = self.vocabulary_.index(term)
+                if i >= 0:
+                    column = self.columns[i]
+                    counts[column] = counts.get(column, 0) + 1
+
+            indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(indices))
+
+        # noinspection PyPep8Naming
+        X = scipy.sparse.csr_matrix(
+            (
+                np.asarray(values, dtype=self.dtype),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int32),
+            ),
+            shape=(len(indptr) - 1, len(self.columns)),
+        )
+        X.sort_indices()
+
+        if self.binary:
+            X.data.fill(1)
+
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+
+        if self.idf_ is not None:
+            X.data *= self.idf_[X.indices]
+
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+
+        return X
+
+
+class ViSpacyFeaturizer(SpacyFeaturizer):
+    """`SpacyFeaturizer` writing the document vectors of the training
+    examples into the feature store of `ViTrainer`, if there is one."""
+
+    # per example outputs and inputs, see `custom_code.trainer.ViTrainer`
+    cached_attributes = ["text_features"]
+    cached_inputs = ["spacy_doc"]
+
+    def fit(
+            self, training_data, cfg=None, **kwargs
+    ):  # type: (TrainingData, Optional[RasaNLUModelConfig], **Any) -> None
+        pass
+
+    def fingerprint(self) -> Text:
+        # the spacy model is part of the keys of the spacy_doc inputs
+        return fingerprint(self.component_config)
+
+    @staticmethod
+    def cached_examples(training_data):  # type: (TrainingData) -> List[Message]
+        return training_data.intent_examples
+
+    def uses_feature_store(self) -> bool:
+        return True
+
+    def features(self, messages):  # type: (List[Message]) -> np.ndarray
+        """The document vectors alone, one row per message."""
+
+        docs = [m.get("spacy_doc") for m in messages]
+        X = np.empty((len(docs), docs[0].vocab.vectors_length), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            X[i] = doc.vector
+
+        return X
+
+    def train(
+            self, training_data, cfg=None, **kwargs
+    ):  # type: (TrainingData, Optional[RasaNLUModelConfig], **Any) -> None
+        feature_store = kwargs.get("feature_store")
+        examples = training_data.intent_examples
+
+        if feature_store is not None and examples:
+            feature_store.add(self.name, self.features(examples))
+        else:
+            super(ViSpacyFeaturizer, self).train(training_data, cfg, **kwargs)
+
+    def process_batch(self, messages, **kwargs):  # type: (List[Message], **Any) -> None
+        for message in messages:
+            self.process(message, **kwargs)
+
+
 class TfidfFeaturizer(Featurizer):
     provides = ["text_features"]
 
@@ -42,6 +317,19 @@ class TfidfFeaturizer(Featurizer):
         # out-of-words
         "oov_token": None,
         "oov_words": [],
+        # keep text_features as a sparse csr row, classifiers that need
+        # dense input densify it themselves (see `custom_code.classifier`)
+        "sparse": False,
+        # fit a hashing vectorizer in chunks instead of building the whole
+        # vocabulary in memory, its features are always kept sparse
+        "streaming": False,
+        # number of hashed feature columns of the streaming mode
+        "n_features": 2 ** 18,
+        # number of examples vectorized at once in the streaming mode
+        "chunk_size": 10000,
+        # "mmap" persists the vocabulary and idf as plain arrays that are
+        # memory mapped at load, "pickle" the whole component
+        "persist_format": "mmap",
     }
 
     def __init__(self, component_config: Dict[Text, Any] = None) -> None:
@@ -67,6 +355,10 @@ class TfidfFeaturizer(Featurizer):
         self.sublinear_tf = self.component_config["sublinear_tf"]
         self.oov_token = self.component_config["oov_token"]
         self.oov_words = self.component_config["oov_words"]
+        self.streaming = self.component_config["streaming"]
+        self.n_features = self.component_config["n_features"]
+        self.chunk_size = self.component_config["chunk_size"]
+        self.sparse = self.component_config["sparse"] or self.streaming
 
         if self.oov_words and not self.oov_token:
             logger.error(
@@ -103,6 +395,35 @@ class TfidfFeaturizer(Featurizer):
                 )
 
         self.tfidf = None
+        self._freeze()
+
+    def __setstate__(self, state: Dict[Text, Any]) -> None:
+        self.__dict__.update(state)
+
+        # components pickled before an option was added use its default
+        self.component_config = dict(self.defaults, **self.component_config)
+        self.streaming = self.component_config["streaming"]
+        self.n_features = self.component_config["n_features"]
+        self.chunk_size = self.component_config["chunk_size"]
+        self.sparse = self.component_config["sparse"] or self.streaming
+        self._freeze()
+
+    def _freeze(self) -> None:
+        """Precompute what `tokenizer` needs on every call.
+
+        Runs whenever the OOV words or the fitted vocabulary change. The
+        vocabulary dict of the vectorizer is already a hash table, so it is
+        referenced as is instead of being copied into a set."""
+
+        self._token_re = re.compile(self.token_pattern)
+        self._oov_words = frozenset(self.oov_words)
+
+        vocabulary = getattr(self.tfidf, "vocabulary_", None)
+        self._is_fitted = vocabulary is not None
+        if self._is_fitted and self.oov_token and self.oov_token in vocabulary:
+            self._vocabulary = vocabulary
+        else:
+            self._vocabulary = None
 
     @classmethod
     def required_packages(cls):  # type: () -> List[Text]
@@ -110,19 +431,19 @@ class TfidfFeaturizer(Featurizer):
 
     def tokenizer(self, text: Text) -> List[Text]:
         # split text to tokens
-        tokens = re.compile(self.token_pattern).findall(text.strip())
+        tokens = self._token_re.findall(text.strip())
 
         if self.oov_token:
-            if hasattr(self.tfidf, "vocabulary_"):
+            oov_token = self.oov_token
+            if self._is_fitted:
                 # TfidfVectorizer is trained, process for prediction
-                if self.oov_token in self.tfidf.vocabulary_:
-                    tokens = [
-                        t if t in self.tfidf.vocabulary_.keys() else self.oov_token
-                        for t in tokens
-                    ]
-            elif self.oov_words:
+                vocabulary = self._vocabulary
+                if vocabulary is not None:
+                    tokens = [t if t in vocabulary else oov_token for t in tokens]
+            elif self._oov_words:
                 # TfidfVectorizer is not trained, process for train
-                tokens = [self.oov_token if t in self.oov_words else t for t in tokens]
+                oov_words = self._oov_words
+                tokens = [oov_token if t in oov_words else t for t in tokens]
 
         return tokens
 
@@ -141,6 +462,32 @@ class TfidfFeaturizer(Featurizer):
                 "".format(self.oov_token)
             )
 
+    def _combine_with_existing_sparse_features(
+            self, message: Message, additional_features: scipy.sparse.csr_matrix
+    ) -> scipy.sparse.csr_matrix:
+        if message.get("text_features") is not None:
+            existing = message.get("text_features")
+            if not scipy.sparse.issparse(existing):
+                existing = scipy.sparse.csr_matrix(np.atleast_2d(existing))
+
+            return scipy.sparse.hstack(
+                [existing, additional_features], format="csr"
+            )
+        else:
+            return additional_features
+
+    def _set_text_features(self, message: Message, features: Any) -> None:
+        if self.sparse:
+            message.set(
+                "text_features",
+                self._combine_with_existing_sparse_features(message, features),
+            )
+        else:
+            message.set(
+                "text_features",
+                self._combine_with_existing_text_features(message, features),
+            )
+
     @staticmethod
     def get_message_text(message: Message) -> Text:
         if message.get("spacy_doc"):  # if lemmatize is possible
@@ -150,14 +497,29 @@ class TfidfFeaturizer(Featurizer):
         else:
             return message.text
 
-    def train(
-            self, training_data, cfg, **kwargs
-    ):  # type: (TrainingData, RasaNLUModelConfig, **Any) -> None
+    def _fit(self, training_data, **kwargs):
+        # type: (TrainingData, **Any) -> Optional[scipy.sparse.csr_matrix]
+        """Fit the vectorizer, returns the features of the intent
+        examples if fitting computed them anyway."""
+
         spacy_nlp = kwargs.get("spacy_nlp")
         if spacy_nlp is not None:
             # create spacy lemma_ for OOV_words
             self.oov_words = [t.lemma_ for w in self.oov_words for t in spacy_nlp(w)]
 
+        if self.streaming:
+            lem_exs = (
+                self.get_message_text(example)
+                for example in training_data.intent_examples
+            )
+            if self.oov_token and not self.oov_words:
+                # the check needs the texts twice
+                lem_exs = list(lem_exs)
+                self.check_oov_present(lem_exs)
+
+            self.fit_stream(lem_exs)
+            return None
+
         # define tfidfvectorizer
         self.tfidf = TfidfVectorizer(
             strip_accents=self.strip_accents,
@@ -178,6 +540,7 @@ class TfidfFeaturizer(Featurizer):
             smooth_idf=self.smooth_idf,
             sublinear_tf=self.sublinear_tf,
         )
+        self._freeze()
 
         lem_exs = [
             self.get_message_text(example) for example in training_data.intent_examples
@@ -187,17 +550,105 @@ class TfidfFeaturizer(Featurizer):
 
         try:
             # noinspection PyPep8Naming
-            X = self.tfidf.fit_transform(lem_exs).toarray()
+            X = self.tfidf.fit_transform(lem_exs)
         except ValueError:
             self.tfidf = None
+            self._freeze()
+            return None
+
+        self._freeze()
+
+        return X
+
+    def train(
+            self, training_data, cfg, **kwargs
+    ):  # type: (TrainingData, RasaNLUModelConfig, **Any) -> None
+        # noinspection PyPep8Naming
+        X = self._fit(training_data, **kwargs)
+        if self.tfidf is None:
+            return
+
+        examples = training_data.intent_examples
+
+        feature_store = kwargs.get("feature_store")
+        if feature_store is not None and self.uses_feature_store():
+            if X is None:
+                X = self.features(examples)
+            feature_store.add(self.name, X)
+            return
+
+        if X is None:
+            for start in range(0, len(examples), self.chunk_size):
+                self.process_batch(examples[start : start + self.chunk_size])
             return
 
-        for i, example in enumerate(training_data.intent_examples):
+        if not self.sparse:
+            X = X.toarray()
+
+        for i, example in enumerate(examples):
             # create bag for each example
-            example.set(
-                "text_features",
-                self._combine_with_existing_text_features(example, X[i]),
-            )
+            self._set_text_features(example, X[i])
+
+    def uses_feature_store(self) -> bool:
+        """Whether `train` hands the features to the feature store of
+        `ViTrainer` instead of setting them on every example."""
+
+        return not self.sparse
+
+    def features(self, messages):  # type: (List[Message]) -> scipy.sparse.csr_matrix
+        """The TF-IDF features alone, one row per message."""
+
+        return self.tfidf.transform([self.get_message_text(m) for m in messages])
+
+    def _streaming_vectorizer(self) -> StreamingTfidfVectorizer:
+        return StreamingTfidfVectorizer(
+            tokenizer=self.tokenizer,
+            n_features=self.n_features,
+            strip_accents=self.strip_accents,
+            lowercase=self.lowercase,
+            stop_words=self.stop_words,
+            ngram_range=self.ngram_range,
+            min_df=self.min_df,
+            max_df=self.max_df,
+            binary=self.binary,
+            dtype=np.float32,
+            norm=self.norm,
+            use_idf=self.use_idf,
+            smooth_idf=self.smooth_idf,
+            sublinear_tf=self.sublinear_tf,
+        )
+
+    def fit_stream(self, texts: Iterable[Text]) -> None:
+        """Fit the streaming vectorizer on texts, `chunk_size` at a time.
+
+        `texts` may be any iterable, e.g. a generator over exported logs,
+        it is consumed once."""
+
+        self.tfidf = self._streaming_vectorizer()
+        self._freeze()
+
+        try:
+            self.tfidf.fit(texts, self.chunk_size)
+        except ValueError:
+            self.tfidf = None
+            self._freeze()
+
+    def partial_fit(self, texts: Iterable[Text]) -> None:
+        """Update the document frequencies of the streaming vectorizer."""
+
+        if not self.streaming:
+            raise ValueError("partial_fit needs the streaming mode of TfidfFeaturizer")
+
+        if self.tfidf is None:
+            self.tfidf = self._streaming_vectorizer()
+            self._freeze()
+
+        texts = iter(texts)
+        while True:
+            chunk = list(itertools.islice(texts, self.chunk_size))
+            if not chunk:
+                break
+            self.tfidf.partial_fit(chunk)
 
     def process(self, message, **kwargs):  # type: (Message, **Any) -> None
         if self.tfidf is None:
@@ -209,18 +660,96 @@ class TfidfFeaturizer(Featurizer):
         else:
             message_text = self.get_message_text(message)
 
-            bag = self.tfidf.transform([message_text]).toarray().squeeze()
-            message.set(
-                "text_features", self._combine_with_existing_text_features(message, bag)
+            bag = self.tfidf.transform([message_text])
+            if not self.sparse:
+                bag = bag.toarray().squeeze()
+
+            self._set_text_features(message, bag)
+
+    def process_batch(self, messages, **kwargs):  # type: (List[Message], **Any) -> None
+        """Featurize many messages with a single `transform` call."""
+
+        if self.tfidf is None:
+            logger.error(
+                "There is no trained TfidfFeaturizer: "
+                "component is either not trained or "
+                "didn't receive enough training data"
             )
+        elif messages:
+            # noinspection PyPep8Naming
+            X = self.features(messages)
+            if not self.sparse:
+                X = X.toarray()
+
+            for i, message in enumerate(messages):
+                self._set_text_features(message, X[i])
+
+    def _can_persist_mapped(self) -> bool:
+        return (
+                self.component_config["persist_format"] == "mmap"
+                and self.analyzer == "word"
+                and hasattr(self.tfidf, "vocabulary_")
+                and not isinstance(self.tfidf, StreamingTfidfVectorizer)
+        )
 
     def persist(self, file_name, model_dir):  # type: (Text, Text) -> Optional[Dict[Text, Any]]
+        if self._can_persist_mapped():
+            return self._persist_mapped(file_name, model_dir)
+
         file_name = self.__class__.__name__ + ".pkl"  # TfidfFeaturizer.pkl
 
         utils.pycloud_pickle(os.path.join(model_dir, file_name), self)
 
         return {"file": file_name}
 
+    def _persist_mapped(self, file_name, model_dir):  # type: (Text, Text) -> Dict[Text, Any]
+        if isinstance(self.tfidf, MappedTfidfVectorizer):
+            vocabulary = self.tfidf.vocabulary_dict()
+        else:
+            vocabulary = self.tfidf.vocabulary_
+        idf = self.tfidf.idf_ if self.use_idf else None
+
+        files = {
+            "vocabulary_file": file_name + "_vocabulary.bin",
+            "columns_file": file_name + "_columns.npy",
+            "idf_file": file_name + "_idf.npy" if idf is not None else None,
+        }
+        MappedTfidfVectorizer.save(
+            vocabulary,
+            idf,
+            *[os.path.join(model_dir, f) if f else None for f in files.values()]
+        )
+
+        # the OOV words are lemmatized during training
+        return dict(files, file=None, oov_words=list(self.oov_words))
+
+    @classmethod
+    def _load_mapped(cls, meta, model_dir):
+        # type: (Dict[Text, Any], Text) -> TfidfFeaturizer
+        featurizer = cls(meta)
+
+        analyzer = TfidfVectorizer(
+            strip_accents=featurizer.strip_accents,
+            lowercase=featurizer.lowercase,
+            tokenizer=featurizer.tokenizer,
+            token_pattern=None,
+            stop_words=featurizer.stop_words,
+            ngram_range=featurizer.ngram_range,
+        ).build_analyzer()
+
+        featurizer.tfidf = MappedTfidfVectorizer.load(
+            os.path.join(model_dir, meta["vocabulary_file"]),
+            os.path.join(model_dir, meta["columns_file"]),
+            os.path.join(model_dir, meta["idf_file"]) if meta.get("idf_file") else None,
+            analyzer=analyzer,
+            binary=featurizer.binary,
+            norm=featurizer.norm,
+            sublinear_tf=featurizer.sublinear_tf,
+        )
+        featurizer._freeze()
+
+        return featurizer
+
     @classmethod
     def load(
             cls,
@@ -233,6 +762,9 @@ class TfidfFeaturizer(Featurizer):
         if cached_component:
             return cached_component
 
+        elif meta.get("vocabulary_file"):
+            return cls._load_mapped(meta, model_dir)
+
         else:
             return utils.pycloud_unpickle(
                 os.path.join(model_dir, cls.__name__ + ".pkl")
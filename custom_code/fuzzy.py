@@ -0,0 +1,175 @@
+"""Fuzzy lookup of slot values in the mappings of the actions.
+
+Users often type Vietnamese without diacritics ("ke toan") or with a
+typo ("tai san co dihn"). `FuzzyIndex` resolves such values to the
+canonical value of the closest key of a mapping:
+
+1. the exact key,
+2. the key with the same diacritic-folded form (lower case, no tone or
+   vowel marks, "đ" -> "d", "_" -> " "),
+3. the folded key within a small edit distance, searched in a BK-tree
+   of the folded keys, so only a few keys are compared.
+
+Folded forms and edit distance matches shared by keys of different
+values are ambiguous and resolve to nothing rather than to a guess."""
+
+from __future__ import absolute_import, division, print_function
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Text, Tuple
+
+_SPACES = re.compile(r"[\s_]+")
+
+# marker of folded forms and matches of different values
+_AMBIGUOUS = object()
+
+
+def fold(text: Text) -> Text:
+    """Lower case text without diacritics, words separated by one space."""
+
+    text = text.lower().replace("đ", "d")
+    text = "".join(
+        c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn"
+    )
+    return _SPACES.sub(" ", text).strip()
+
+
+def levenshtein(a: Text, b: Text) -> int:
+    """Edit distance of two strings."""
+
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ca != cb),
+                )
+            )
+        previous = current
+
+    return previous[-1]
+
+
+class BKTree(object):
+    """Words by edit distance, a search skips the subtrees that can't be
+    within the distance (triangle inequality)."""
+
+    def __init__(self, words: Iterable[Text] = ()) -> None:
+        # [word, {distance to word: child node}]
+        self._root = None  # type: Optional[List[Any]]
+        for word in words:
+            self.add(word)
+
+    def add(self, word: Text) -> None:
+        if self._root is None:
+            self._root = [word, {}]
+            return
+
+        node = self._root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                return
+            node = child
+
+    def search(self, word: Text, max_distance: int) -> List[Tuple[int, Text]]:
+        """(distance, word) of the words within `max_distance`."""
+
+        found = []
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = levenshtein(word, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0]))
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+
+        return found
+
+
+def default_max_distance(folded: Text) -> int:
+    # one typo in a short word already makes another word
+    if len(folded) <= 4:
+        return 0
+    elif len(folded) <= 8:
+        return 1
+    return 2
+
+
+class FuzzyIndex(object):
+    def __init__(
+        self, mapping: Mapping[Text, Any], include_values: bool = False
+    ) -> None:
+        """Index of the keys of `mapping`, and of its values (mapped to
+        themselves) if `include_values`."""
+
+        self._exact = dict(mapping)  # type: Dict[Text, Any]
+        if include_values:
+            for value in set(mapping.values()):
+                self._exact.setdefault(value, value)
+
+        self._folded = {}  # type: Dict[Text, Any]
+        for key, value in self._exact.items():
+            folded = fold(key)
+            if self._folded.get(folded, value) != value:
+                self._folded[folded] = _AMBIGUOUS
+            else:
+                self._folded[folded] = value
+
+        self._tree = BKTree(self._folded)
+
+    def resolve(self, text: Text) -> Optional[Any]:
+        """Canonical value of the closest key, None if there is none or
+        several values are equally close."""
+
+        value = self._exact.get(text)
+        if value is not None:
+            return value
+
+        folded = fold(text)
+        value = self._folded.get(folded)
+        if value is None:
+            max_distance = default_max_distance(folded)
+            if max_distance == 0:
+                return None
+
+            matches = self._tree.search(folded, max_distance)
+            if not matches:
+                return None
+
+            closest = min(distance for distance, _ in matches)
+            values = {self._folded[k] for distance, k in matches if distance == closest}
+            value = values.pop() if len(values) == 1 else _AMBIGUOUS
+
+        return None if value is _AMBIGUOUS else value
+
+    def __getitem__(self, text: Text) -> Any:
+        value = self.resolve(text) if isinstance(text, str) else None
+        if value is None:
+            raise KeyError(text)
+        return value
+
+    def get(self, text: Text, default: Any = None) -> Any:
+        """Like `dict.get` of the mapping, with fuzzy matching of the key."""
+
+        if not isinstance(text, str):
+            return default
+
+        value = self.resolve(text)
+        return value if value is not None else default
+
+    def __len__(self) -> int:
+        return len(self._exact)
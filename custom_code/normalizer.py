@@ -0,0 +1,179 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import re
+from typing import Dict, List, Optional, Text
+
+from custom_code.string_table import StringTable, map_file
+
+NUMBER_PATTERN = u"\$?#?\d+(?:\.\d+)?%?"
+NUMBER_TOKEN = "__NUMBER__"
+
+PUNCTUATION_CHARS = re.escape(u"[].,;\"'?():`~-!@")
+PUNCTUATION_TOKEN = "__PUNC__"
+
+# words of the raw text, with numbers split off as their own words
+_WORD_RE = re.compile(u"\S+")
+_WORD_OR_NUMBER_RE = re.compile(
+    u"(?P<number>{0})|(?:(?!{0})\S)+".format(NUMBER_PATTERN)
+)
+
+# words of the segmented text, with punctuation split off
+_WORD_OR_PUNCTUATION_RE = re.compile(
+    u"(?P<punctuation>\.\.\.|[{0}])|[^\s{0}]+".format(PUNCTUATION_CHARS)
+)
+
+# separates a key from its value in the correction table
+_KEY_END = u"\x00"
+
+
+class CorrectionMapping(object):
+    """Mapping from (multi-)word typos to their corrections.
+
+    Entries are kept as one sorted `StringTable` of "key\\x00value"
+    strings, so a compiled mapping file is memory mapped instead of parsed
+    and can be shared between worker processes. Keys are lowercase words
+    separated by single spaces."""
+
+    def __init__(self, table: StringTable) -> None:
+        self.table = table
+
+    @staticmethod
+    def normalize_key(key: Text) -> Text:
+        return " ".join(key.lower().split())
+
+    @classmethod
+    def encode(cls, mapping: Dict[Text, Text]) -> bytes:
+        entries = {}
+        for key, value in mapping.items():
+            key = cls.normalize_key(key)
+            if key:
+                entries[key] = value
+
+        return StringTable.encode(k + _KEY_END + v for k, v in entries.items())
+
+    @classmethod
+    def from_dict(cls, mapping: Dict[Text, Text]) -> "CorrectionMapping":
+        return cls(StringTable(cls.encode(mapping)))
+
+    @classmethod
+    def load(cls, path: Text) -> "CorrectionMapping":
+        """Load a json mapping or memory map a compiled one."""
+
+        if path.endswith(".json"):
+            with open(path, "r") as f:
+                return cls.from_dict(json.load(f))
+        else:
+            return cls(StringTable(map_file(path)))
+
+    @classmethod
+    def compile(cls, mapping: Dict[Text, Text], path: Text) -> None:
+        with open(path, "wb") as f:
+            f.write(cls.encode(mapping))
+
+    def get(self, key: Text, default: Optional[Text] = None) -> Optional[Text]:
+        entry = self.table.first_with_prefix(key + _KEY_END)
+        if entry is None:
+            return default
+        return entry[len(key) + 1 :]
+
+    def has_prefix(self, prefix: Text) -> bool:
+        return self.table.has_prefix(prefix)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+class Normalizer(object):
+    """Compiled text normalization of `ViTokenizer`.
+
+    `normalize` prepares the raw text for word segmentation: numbers are
+    replaced and the longest (multi-)word corrections are applied in one
+    scan over the words. `words` splits the segmented text, dropping or
+    replacing punctuation in the same pass."""
+
+    def __init__(
+        self,
+        mapping: Optional[CorrectionMapping] = None,
+        replace_numbers: bool = False,
+        use_punctuation: bool = False,
+        replace_punctuation: bool = False,
+    ) -> None:
+        if mapping is None:
+            mapping = CorrectionMapping.from_dict({})
+
+        self.mapping = mapping
+        self.replace_numbers = replace_numbers
+        self.use_punctuation = use_punctuation
+        self.replace_punctuation = replace_punctuation
+
+        self._word_re = _WORD_OR_NUMBER_RE if replace_numbers else _WORD_RE
+
+    def correct(self, words: List[Text]) -> List[Text]:
+        """Replace the longest matching word sequences by their corrections."""
+
+        if not len(self.mapping):
+            return words
+
+        lowered = [w.lower() for w in words]
+        corrected = []
+
+        i = 0
+        while i < len(words):
+            match = None
+            key = lowered[i]
+            j = i + 1
+            while True:
+                value = self.mapping.get(key)
+                if value is not None:
+                    match = (j, value)
+                if j == len(words) or not self.mapping.has_prefix(key + " "):
+                    break
+                key = key + " " + lowered[j]
+                j += 1
+
+            if match is None:
+                corrected.append(words[i])
+                i += 1
+            else:
+                corrected.append(match[1])
+                i = match[0]
+
+        return corrected
+
+    def normalize(self, text: Text) -> Text:
+        if self.replace_numbers:
+            words = [
+                NUMBER_TOKEN if m.group("number") else m.group()
+                for m in self._word_re.finditer(text)
+            ]
+        else:
+            words = self._word_re.findall(text)
+
+        return " ".join(self.correct(words))
+
+    def words(self, text: Text) -> List[Text]:
+        if self.use_punctuation and not self.replace_punctuation:
+            return _WORD_RE.findall(text)
+
+        words = []
+        for m in _WORD_OR_PUNCTUATION_RE.finditer(text):
+            if not m.group("punctuation"):
+                words.append(m.group())
+            elif self.use_punctuation:
+                words.append(PUNCTUATION_TOKEN)
+
+        return words
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile a json correction mapping for ViTokenizer."
+    )
+    parser.add_argument("mapping", help="json file with the word mapping")
+    parser.add_argument("output", help="path of the compiled mapping")
+    args = parser.parse_args()
+
+    with open(args.mapping, "r") as f:
+        CorrectionMapping.compile(json.load(f), args.output)
@@ -0,0 +1,203 @@
+"""Opt-in latency and memory profile of the NLU components.
+
+With `NLU_PROFILE=1` in the environment (or `enable()` before a model is
+loaded), every component class resolved by the registry gets timing
+wrappers around `train`, `process` and `process_batch` and around its
+`load`, which also records how much the resident memory grew. Disabled,
+classes are returned untouched, so nothing is added to a parse.
+
+The latest `window` durations of every component and phase are kept for
+the p50/p95/p99 of `report()`. `dump()` writes the report as json (to
+`NLU_PROFILE_FILE` at exit if that is set), `python benchmark.py profile`
+reads it."""
+
+from __future__ import absolute_import, division, print_function
+
+import atexit
+import functools
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional, Text
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# methods timed per call, `load` is timed as well
+PROFILED_METHODS = ["train", "process", "process_batch"]
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of the process, None where it is not known."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IOError, ValueError):
+        return None
+
+
+class Histogram(object):
+    """Count and total of all durations, percentiles of the latest ones."""
+
+    def __init__(self, window: int) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.memory = 0
+        self.durations = deque(maxlen=window)
+
+    def add(self, seconds: float, memory: Optional[int] = None) -> None:
+        self.count += 1
+        self.total += seconds
+        self.durations.append(seconds)
+        if memory is not None:
+            self.memory += memory
+
+    def as_dict(self) -> Dict[Text, Any]:
+        ms = np.asarray(self.durations) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0, 0, 0)
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000.0,
+            "mean_ms": self.total * 1000.0 / self.count if self.count else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "memory": self.memory,
+        }
+
+
+class Profiler(object):
+    def __init__(self, window: int = 10000) -> None:
+        self.enabled = False
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)  # type: Dict[Text, Dict[Text, Histogram]]
+        # (id of the instance or class, method) being timed by this thread,
+        # calls through super() are only counted once
+        self._active = threading.local()
+
+    def record(
+        self, name: Text, phase: Text, seconds: float, memory: Optional[int] = None
+    ) -> None:
+        with self._lock:
+            phases = self._histograms[name]
+            if phase not in phases:
+                phases[phase] = Histogram(self.window)
+            phases[phase].add(seconds, memory)
+
+    def _enter(self, key: Any) -> bool:
+        active = getattr(self._active, "keys", None)
+        if active is None:
+            active = self._active.keys = set()
+        if key in active:
+            return False
+        active.add(key)
+        return True
+
+    def _exit(self, key: Any) -> None:
+        self._active.keys.discard(key)
+
+    def _timed(self, method: Text, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(component, *args, **kwargs):
+            key = (id(component), method)
+            if not self._enter(key):
+                return func(component, *args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(component, *args, **kwargs)
+            finally:
+                self._exit(key)
+                self.record(component.name, method, time.perf_counter() - start)
+
+        wrapper.profiled = True
+        return wrapper
+
+    def _timed_load(self, func: Callable) -> classmethod:
+        @functools.wraps(func)
+        def wrapper(cls, *args, **kwargs):
+            key = (id(cls), "load")
+            if not self._enter(key):
+                return func(cls, *args, **kwargs)
+
+            before = rss_bytes()
+            start = time.perf_counter()
+            try:
+                return func(cls, *args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                after = rss_bytes()
+                self._exit(key)
+                self.record(
+                    cls.__name__,
+                    "load",
+                    seconds,
+                    after - before if before is not None else None,
+                )
+
+        wrapper.profiled = True
+        return classmethod(wrapper)
+
+    def instrument(self, component_class: type) -> type:
+        """Add the timing wrappers to a component class, if enabled."""
+
+        if not self.enabled:
+            return component_class
+
+        for method in PROFILED_METHODS:
+            func = getattr(component_class, method, None)
+            if func is not None and not getattr(func, "profiled", False):
+                setattr(component_class, method, self._timed(method, func))
+
+        load = getattr(component_class, "load", None)
+        if load is not None and not getattr(load, "profiled", False):
+            component_class.load = self._timed_load(load.__func__)
+
+        return component_class
+
+    def report(self) -> Dict[Text, Dict[Text, Dict[Text, Any]]]:
+        """component name -> phase -> count, mean, percentiles and memory"""
+
+        with self._lock:
+            return {
+                name: {phase: h.as_dict() for phase, h in phases.items()}
+                for name, phases in self._histograms.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def dump(self, path: Text) -> None:
+        with io.open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.report(), indent=2, sort_keys=True))
+
+
+profiler = Profiler()
+
+
+def enable(window: Optional[int] = None) -> None:
+    """Profile the components resolved from now on."""
+
+    if window is not None:
+        profiler.window = window
+    profiler.enabled = True
+
+
+def instrument(component_class: type) -> type:
+    return profiler.instrument(component_class)
+
+
+if os.environ.get("NLU_PROFILE", "").lower() in ["1", "true", "yes"]:
+    enable()
+
+    if os.environ.get("NLU_PROFILE_FILE"):
+        atexit.register(profiler.dump, os.environ["NLU_PROFILE_FILE"])
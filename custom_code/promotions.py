@@ -0,0 +1,161 @@
+"""Promotion campaigns of the products, indexed by time.
+
+Campaigns are loaded from a json list of
+    {"product": "sme", "start": "2019-04-01", "end": "2019-04-30", "text": "..."}
+where a date without a time spans the whole day (the end date is
+included). Per product, a centered interval tree answers "which campaigns
+run at t" in O(log n + k) for k running campaigns, however many overlap,
+instead of checking every campaign."""
+
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import io
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Text
+
+TIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"]
+
+
+def _parse_time(value: Text, end: bool = False) -> datetime.datetime:
+    """Start of a date or a time, after the end of a date if `end`."""
+
+    try:
+        day = datetime.datetime.strptime(value, "%Y-%m-%d")
+        return day + datetime.timedelta(days=1) if end else day
+    except ValueError:
+        pass
+
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+
+    raise ValueError("Invalid campaign time '{}'".format(value))
+
+
+class Campaign(object):
+    """A campaign running from `start` until before `end`."""
+
+    __slots__ = ["index", "product", "start", "end", "text"]
+
+    def __init__(
+        self,
+        index: int,
+        product: Text,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        text: Text,
+    ) -> None:
+        self.index = index
+        self.product = product
+        self.start = start
+        self.end = end
+        self.text = text
+
+    @property
+    def last_day(self) -> datetime.date:
+        return (self.end - datetime.timedelta(microseconds=1)).date()
+
+    def __repr__(self) -> Text:
+        return "Campaign({!r}, {}, {})".format(self.product, self.start, self.end)
+
+
+class _Node(object):
+    __slots__ = ["center", "by_start", "by_end", "left", "right"]
+
+    def __init__(self, campaigns: List[Campaign]) -> None:
+        # the median start, its campaign stays here, so both sides
+        # have less than half of the campaigns
+        starts = sorted(c.start for c in campaigns)
+        self.center = starts[len(starts) // 2]
+
+        here = [c for c in campaigns if c.start <= self.center < c.end]
+        self.by_start = sorted(here, key=lambda c: c.start)
+        self.by_end = sorted(here, key=lambda c: c.end, reverse=True)
+
+        left = [c for c in campaigns if c.end <= self.center]
+        right = [c for c in campaigns if c.start > self.center]
+        self.left = _Node(left) if left else None
+        self.right = _Node(right) if right else None
+
+
+class IntervalIndex(object):
+    def __init__(self, campaigns: Iterable[Campaign]) -> None:
+        # campaigns of no time never run
+        campaigns = [c for c in campaigns if c.start < c.end]
+        self._root = _Node(campaigns) if campaigns else None
+        self.size = len(campaigns)
+
+    def at(self, t: datetime.datetime) -> List[Campaign]:
+        """Campaigns running at `t`, in the order of the data file."""
+
+        running = []
+        node = self._root
+        while node is not None:
+            if t < node.center:
+                # all of them end after t
+                for c in node.by_start:
+                    if c.start > t:
+                        break
+                    running.append(c)
+                node = node.left
+            else:
+                # all of them started before t
+                for c in node.by_end:
+                    if c.end <= t:
+                        break
+                    running.append(c)
+                node = node.right
+
+        running.sort(key=lambda c: c.index)
+        return running
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class PromotionsEngine(object):
+    def __init__(self, campaigns: Iterable[Campaign]) -> None:
+        by_product = defaultdict(list)  # type: Dict[Text, List[Campaign]]
+        for c in campaigns:
+            by_product[c.product].append(c)
+
+        self._indexes = {
+            product: IntervalIndex(product_campaigns)
+            for product, product_campaigns in by_product.items()
+        }  # type: Dict[Text, IntervalIndex]
+
+    @classmethod
+    def from_records(cls, records: List[Dict[Text, Any]]) -> "PromotionsEngine":
+        return cls(
+            Campaign(
+                i,
+                r["product"],
+                _parse_time(r["start"]),
+                _parse_time(r["end"], end=True),
+                r["text"],
+            )
+            for i, r in enumerate(records)
+        )
+
+    @classmethod
+    def from_json(cls, path: Text) -> "PromotionsEngine":
+        with io.open(path, "r", encoding="utf-8") as f:
+            return cls.from_records(json.load(f))
+
+    def active(
+        self, product: Text, t: Optional[datetime.datetime] = None
+    ) -> List[Campaign]:
+        """Campaigns of a product running at `t`, now by default."""
+
+        index = self._indexes.get(product)
+        if index is None:
+            return []
+
+        return index.at(t if t is not None else datetime.datetime.now())
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._indexes.values())
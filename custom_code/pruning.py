@@ -0,0 +1,172 @@
+"""Drop components that cannot produce any output from a loaded model.
+
+A trained model keeps every component of its pipeline, even those that
+learned nothing: a `RegexFeaturizer` without patterns (its file is just
+"[]"), an `EntitySynonymMapper` without synonyms (`file: null`), a
+`CRFEntityExtractor` without a tagger, or a `SpacyEntityExtractor` on a
+spaCy model without an NER pipe, like the vectors only vi_fasttext.
+They still run on every message. `prune_interpreter` finds them from
+metadata.json and the loaded spaCy model and removes them from the
+interpreter's pipeline."""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+from rasa_nlu.components import Component
+from rasa_nlu.model import Interpreter, Metadata
+from rasa_nlu.training_data import Message
+
+logger = logging.getLogger(__name__)
+
+
+def _read_json(model_dir: Text, file_name: Optional[Text]) -> Any:
+    """Content of a persisted file, an empty list if there is no file and
+    None if it is not json, i.e. its content is unknown."""
+
+    if not file_name or not os.path.exists(os.path.join(model_dir, file_name)):
+        return []
+
+    try:
+        with io.open(os.path.join(model_dir, file_name), encoding="utf-8") as f:
+            return json.load(f)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _no_regex_patterns(
+    meta: Dict[Text, Any], model_dir: Text, context: Dict[Text, Any]
+) -> Optional[Text]:
+    patterns = _read_json(model_dir, meta.get("file"))
+    if patterns is not None and len(patterns) == 0:
+        return "no regex patterns"
+    return None
+
+
+def _no_synonyms(
+    meta: Dict[Text, Any], model_dir: Text, context: Dict[Text, Any]
+) -> Optional[Text]:
+    synonyms = _read_json(model_dir, meta.get("file"))
+    if synonyms is not None and len(synonyms) == 0:
+        return "no entity synonyms"
+    return None
+
+
+def _no_entity_tagger(
+    meta: Dict[Text, Any], model_dir: Text, context: Dict[Text, Any]
+) -> Optional[Text]:
+    if not meta.get("file"):
+        return "no entities to tag in the training data"
+    if not os.path.isfile(os.path.join(model_dir, meta["file"])):
+        return "tagger model '{}' was not persisted".format(meta["file"])
+    return None
+
+
+def _no_ner_pipe(
+    meta: Dict[Text, Any], model_dir: Text, context: Dict[Text, Any]
+) -> Optional[Text]:
+    spacy_nlp = context.get("spacy_nlp")
+    if spacy_nlp is not None and "ner" not in spacy_nlp.pipe_names:
+        return "spaCy model '{}' has no NER pipe".format(
+            spacy_nlp.meta.get("name", "")
+        )
+    return None
+
+
+# component name -> reason why it can't produce output, or None if it can
+pruning_rules = {
+    "RegexFeaturizer": _no_regex_patterns,
+    "EntitySynonymMapper": _no_synonyms,
+    "CRFEntityExtractor": _no_entity_tagger,
+    "SpacyEntityExtractor": _no_ner_pipe,
+}  # type: Dict[Text, Callable[[Dict[Text, Any], Text, Dict[Text, Any]], Optional[Text]]]
+
+
+def analyze(
+    metadata: Metadata, context: Optional[Dict[Text, Any]] = None
+) -> List[Tuple[int, Text, Text]]:
+    """Index, name and reason of the components of a model that can't
+    produce output."""
+
+    context = context or {}
+    no_ops = []
+    for i, meta in enumerate(metadata.get("pipeline", [])):
+        rule = pruning_rules.get(meta["name"])
+        reason = rule(meta, metadata.model_dir, context) if rule else None
+        if reason:
+            no_ops.append((i, meta["name"], reason))
+
+    return no_ops
+
+
+def _sample_texts(metadata: Metadata, sample_size: int) -> List[Text]:
+    data = _read_json(metadata.model_dir, metadata.get("training_data"))
+    if not data:
+        return []
+
+    examples = data.get("rasa_nlu_data", {}).get("common_examples", [])
+    return [e["text"] for e in examples[:sample_size] if e.get("text")]
+
+
+def per_message_latency(
+    interpreter: Interpreter, indices: List[int], texts: List[Text]
+) -> Dict[int, float]:
+    """Mean seconds the components at `indices` spend on a message."""
+
+    totals = {i: 0.0 for i in indices}
+    for text in texts:
+        message = Message(text, interpreter.default_output_attributes())
+        for i, component in enumerate(interpreter.pipeline):
+            start = time.perf_counter()
+            component.process(message, **interpreter.context)
+            if i in totals:
+                totals[i] += time.perf_counter() - start
+
+    return {i: total / len(texts) for i, total in totals.items()} if texts else {}
+
+
+def prune_interpreter(
+    interpreter: Interpreter, sample_size: int = 20
+) -> List[Component]:
+    """Remove the no-op components from the interpreter's pipeline.
+
+    The time they took is measured on up to `sample_size` messages of
+    the training data of the model first, to log what pruning saves."""
+
+    metadata = interpreter.model_metadata
+    if metadata is None:
+        return []
+
+    no_ops = analyze(metadata, interpreter.context)
+    if not no_ops:
+        return []
+
+    texts = _sample_texts(metadata, sample_size)
+    latency = per_message_latency(interpreter, [i for i, _, _ in no_ops], texts)
+
+    for i, name, reason in no_ops:
+        if i in latency:
+            saved = ", saves {:.3f} ms per message".format(latency[i] * 1000.0)
+        else:
+            saved = ""
+        logger.info("Pruned {} ({}){}".format(name, reason, saved))
+
+    if latency:
+        logger.info(
+            "Pruning {} components saves {:.3f} ms per message".format(
+                len(no_ops), sum(latency.values()) * 1000.0
+            )
+        )
+
+    pruned_indices = {i for i, _, _ in no_ops}
+    pruned = [c for i, c in enumerate(interpreter.pipeline) if i in pruned_indices]
+    interpreter.pipeline[:] = [
+        c for i, c in enumerate(interpreter.pipeline) if i not in pruned_indices
+    ]
+
+    return pruned
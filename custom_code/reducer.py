@@ -0,0 +1,245 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Text
+
+import numpy as np
+import scipy.sparse
+from rasa_nlu.components import Component
+from rasa_nlu.config import RasaNLUModelConfig
+from rasa_nlu.model import Metadata
+from rasa_nlu.training_data import Message, TrainingData
+
+from custom_code.feature_store import stack_text_features, training_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureReducer(Component):
+    """Reduces the text_features to `n_components` dimensions.
+
+    Meant to follow the last featurizer: the spacy vectors and the
+    uncapped TF-IDF vocabulary make wide inputs for the classifiers,
+    whose training time and per message cost grow with the width.
+
+    Methods:
+        svd: truncated SVD of the features (works on sparse input)
+        select: the `n_components` features scoring best on `score_func`
+        random: sparse random projection, only its seed is persisted"""
+
+    provides = ["text_features"]
+
+    requires = ["text_features"]
+
+    defaults = {
+        # "svd", "select" or "random"
+        "method": "svd",
+        # number of output dimensions, at most the number of input ones
+        "n_components": 256,
+        # "f_classif" or "chi2" for the select method, chi2 needs
+        # non-negative features, i.e. no spacy vectors
+        "score_func": "f_classif",
+        "random_state": 42,
+    }
+
+    def __init__(self, component_config: Dict[Text, Any] = None) -> None:
+        super(FeatureReducer, self).__init__(component_config)
+
+        self.method = self.component_config["method"]
+        self.n_components = self.component_config["n_components"]
+        self.score_func = self.component_config["score_func"]
+        self.random_state = self.component_config["random_state"]
+
+        if self.method not in ["svd", "select", "random"]:
+            raise ValueError(
+                "Unknown reduction method '{}', choose one of "
+                "'svd', 'select' or 'random'".format(self.method)
+            )
+
+        # number of input features, None until trained
+        self.n_features = None  # type: Optional[int]
+        # input features x output dimensions, for svd and random
+        self.projection = None  # type: Optional[Any]
+        # indices of the kept input features, for select
+        self.selected = None  # type: Optional[np.ndarray]
+
+    @property
+    def n_output(self) -> Optional[int]:
+        if self.selected is not None:
+            return len(self.selected)
+        elif self.projection is not None:
+            return self.projection.shape[1]
+        else:
+            return None
+
+    @classmethod
+    def required_packages(cls):  # type: () -> List[Text]
+        return ["sklearn"]
+
+    def _random_projection(self, n_features: int, n_components: int) -> Any:
+        from sklearn.random_projection import SparseRandomProjection
+
+        # fitting only draws the random matrix for the input shape
+        projection = SparseRandomProjection(
+            n_components=n_components, random_state=self.random_state
+        )
+        projection.fit(scipy.sparse.csr_matrix((1, n_features), dtype=np.float32))
+
+        return projection.components_.T.tocsr().astype(np.float32)
+
+    def fit(self, X: Any, labels: List[Text]) -> None:
+        n_examples, self.n_features = X.shape
+
+        if self.method == "svd":
+            from sklearn.decomposition import TruncatedSVD
+
+            n_components = min(self.n_components, self.n_features - 1, n_examples)
+            svd = TruncatedSVD(n_components, random_state=self.random_state)
+            svd.fit(X)
+            self.projection = svd.components_.T.astype(np.float32)
+
+            logger.info(
+                "Truncated SVD keeps {:.1%} of the variance of the "
+                "text_features".format(svd.explained_variance_ratio_.sum())
+            )
+
+        elif self.method == "select":
+            from sklearn.feature_selection import SelectKBest, chi2, f_classif
+
+            score_funcs = {"chi2": chi2, "f_classif": f_classif}
+            n_components = min(self.n_components, self.n_features)
+            selector = SelectKBest(score_funcs[self.score_func], k=n_components)
+            selector.fit(X, labels)
+            self.selected = np.flatnonzero(selector.get_support()).astype(np.int32)
+
+        else:
+            n_components = min(self.n_components, self.n_features)
+            self.projection = self._random_projection(self.n_features, n_components)
+
+        logger.info(
+            "Reducing text_features from {} to {} dimensions with "
+            "'{}'".format(self.n_features, n_components, self.method)
+        )
+
+    def transform(self, X: Any) -> np.ndarray:
+        """Reduced features of a matrix, one row per message."""
+
+        if self.selected is not None:
+            X = X[:, self.selected]
+            return X.toarray() if scipy.sparse.issparse(X) else np.asarray(X)
+
+        from sklearn.utils.extmath import safe_sparse_dot
+
+        # the random projection is sparse, dense @ sparse needs this
+        # noinspection PyPep8Naming
+        X_reduced = safe_sparse_dot(X, self.projection, dense_output=True)
+
+        return np.asarray(X_reduced, dtype=np.float32)
+
+    def train(
+        self, training_data, cfg, **kwargs
+    ):  # type: (TrainingData, RasaNLUModelConfig, **Any) -> None
+        examples = training_data.intent_examples
+        if not examples:
+            return
+
+        feature_store = kwargs.get("feature_store")
+        X = training_matrix(examples, feature_store)
+
+        self.fit(X, [e.get("intent") for e in examples])
+
+        # noinspection PyPep8Naming
+        X_reduced = self.transform(X)
+        if feature_store is not None:
+            feature_store.replace(self.name, X_reduced)
+        else:
+            for example, row in zip(examples, X_reduced):
+                example.set("text_features", row)
+
+    def _reduce(self, features: Any) -> Any:
+        if features.shape[-1] != self.n_features:
+            logger.error(
+                "FeatureReducer was trained on {} features, got {}. "
+                "Features are not reduced.".format(self.n_features, features.shape[-1])
+            )
+            return features
+
+        if scipy.sparse.issparse(features):
+            return self.transform(features)[0]
+
+        return self.transform(np.atleast_2d(features))[0]
+
+    def process(self, message, **kwargs):  # type: (Message, **Any) -> None
+        features = message.get("text_features")
+        if self.n_features is not None and features is not None:
+            message.set("text_features", self._reduce(features))
+
+    def process_batch(self, messages, **kwargs):  # type: (List[Message], **Any) -> None
+        """Reduce the features of many messages with one product."""
+
+        messages = [m for m in messages if m.get("text_features") is not None]
+        if self.n_features is None or not messages:
+            return
+
+        X = stack_text_features(messages)
+        if X.shape[1] != self.n_features:
+            for message in messages:
+                self.process(message, **kwargs)
+            return
+
+        for message, row in zip(messages, self.transform(X)):
+            message.set("text_features", row)
+
+    def persist(self, file_name, model_dir):  # type: (Text, Text) -> Optional[Dict[Text, Any]]
+        if self.n_features is None or self.method == "random":
+            # the random matrix is drawn again from the seed at load
+            reducer_file = None
+        else:
+            reducer_file = file_name + "_reducer.npy"
+            if self.selected is not None:
+                values = self.selected
+            else:
+                values = self.projection
+            np.save(os.path.join(model_dir, reducer_file), values, allow_pickle=False)
+
+        return {
+            "reducer_file": reducer_file,
+            "n_features": self.n_features,
+            "n_output": self.n_output,
+        }
+
+    @classmethod
+    def load(
+        cls,
+        meta: Dict[Text, Any] = None,
+        model_dir: Text = None,
+        model_metadata: Metadata = None,
+        cached_component: Optional["FeatureReducer"] = None,
+        **kwargs: Any
+    ) -> "FeatureReducer":
+        if cached_component:
+            return cached_component
+
+        reducer = cls(meta)
+        reducer.n_features = meta.get("n_features")
+
+        if reducer.n_features is None:
+            return reducer
+
+        if reducer.method == "random":
+            reducer.projection = reducer._random_projection(
+                reducer.n_features, meta["n_output"]
+            )
+        else:
+            values = np.load(
+                os.path.join(model_dir, meta["reducer_file"]),
+                mmap_mode="r",
+                allow_pickle=False,
+            )
+            if reducer.method == "select":
+                reducer.selected = values
+            else:
+                reducer.projection = values
+
+        return reducer
@@ -0,0 +1,200 @@
+"""Reference data of the actions: the intent names, the package, scope and
+product mappings, the product catalogue and the promotion campaigns, as
+immutable snapshots.
+
+`ReferenceDataManager` watches the files and builds a new snapshot in a
+background thread when one changes. The new snapshot replaces the old
+one with a single assignment, so a request holding `manager.snapshot`
+keeps a complete, consistent version until it is done and never waits
+for a rebuild. A snapshot that fails to build (e.g. a file caught half
+written) is skipped and the previous one stays in use."""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Text, Tuple
+
+from custom_code.catalogue import Catalogue
+from custom_code.fuzzy import FuzzyIndex
+from custom_code.promotions import PromotionsEngine
+
+logger = logging.getLogger(__name__)
+
+# attribute of the snapshot -> file in the data directory
+REFERENCE_FILES = OrderedDict(
+    [
+        ("intents", "vi_intents.json"),
+        ("packages", "package_mapping.json"),
+        ("scopes", "scope_mapping.json"),
+        ("products", "product_mapping.json"),
+        ("catalogue", "data.csv"),
+        ("promotions", "promotions.json"),
+    ]
+)
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    elif isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _read_json(path: Text) -> Any:
+    with io.open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def file_stamps(directory: Text) -> Dict[Text, Optional[Tuple[int, int]]]:
+    """mtime and size of the reference files, None for missing ones"""
+
+    stamps = {}
+    for file_name in REFERENCE_FILES.values():
+        try:
+            st = os.stat(os.path.join(directory, file_name))
+            stamps[file_name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[file_name] = None
+    return stamps
+
+
+class ReferenceData(object):
+    """One version of the reference data, never modified once built."""
+
+    def __init__(
+        self,
+        version: int,
+        intents: Mapping[Text, Text],
+        packages: Mapping[Text, Text],
+        scopes: Mapping[Text, Mapping[Text, Text]],
+        products: Mapping[Text, Text],
+        catalogue: Catalogue,
+        promotions: PromotionsEngine,
+        stamps: Dict[Text, Optional[Tuple[int, int]]],
+    ) -> None:
+        self.version = version
+        self.intents = intents
+        self.packages = packages
+        self.scopes = scopes
+        # product synonyms and scope names -> product
+        self.products = products
+        self.catalogue = catalogue
+        self.promotions = promotions
+
+        # the mappings with fuzzy, diacritic-insensitive keys
+        self.product_index = FuzzyIndex(products, include_values=True)
+        self.package_index = FuzzyIndex(packages, include_values=True)
+        self.scope_indexes = {
+            product: FuzzyIndex(scope_names) for product, scope_names in scopes.items()
+        }  # type: Dict[Text, FuzzyIndex]
+        self.stamps = stamps
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, directory: Text, version: int = 1) -> "ReferenceData":
+        # stamps first, a file changing while it is read is seen as
+        # changed at the next check
+        stamps = file_stamps(directory)
+
+        def path(attribute):
+            return os.path.join(directory, REFERENCE_FILES[attribute])
+
+        scopes = _read_json(path("scopes"))
+
+        products = _read_json(path("products"))
+        for product, scope_names in scopes.items():
+            for scope_name in scope_names:
+                products[scope_name] = product
+
+        return cls(
+            version,
+            intents=_freeze(_read_json(path("intents"))),
+            packages=_freeze(_read_json(path("packages"))),
+            scopes=_freeze(scopes),
+            products=_freeze(products),
+            catalogue=Catalogue.from_csv(path("catalogue")),
+            promotions=PromotionsEngine.from_json(path("promotions")),
+            stamps=stamps,
+        )
+
+
+class ReferenceDataManager(object):
+    """Current snapshot of the reference data of a directory, rebuilt
+    when its files change, checked every `interval` seconds once
+    `start`ed."""
+
+    def __init__(self, directory: Text, interval: float = 5.0) -> None:
+        self.directory = directory
+        self.interval = interval
+
+        # the first snapshot must load, there is nothing to fall back to
+        self._snapshot = ReferenceData.load(directory)
+        self._failed_stamps = None  # type: Optional[Dict]
+
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def snapshot(self) -> ReferenceData:
+        return self._snapshot
+
+    def reload(self, force: bool = False) -> bool:
+        """Build and swap in a new snapshot if the files changed, True if
+        the snapshot was replaced."""
+
+        with self._reload_lock:
+            stamps = file_stamps(self.directory)
+            if not force and stamps in (self._snapshot.stamps, self._failed_stamps):
+                return False
+
+            version = self._snapshot.version + 1
+            start = time.time()
+            try:
+                snapshot = ReferenceData.load(self.directory, version)
+            except Exception:
+                self._failed_stamps = stamps
+                logger.exception(
+                    "Failed to load the reference data, keeping version "
+                    "{}".format(self._snapshot.version)
+                )
+                return False
+
+            self._snapshot = snapshot
+            self._failed_stamps = None
+            logger.info(
+                "Loaded version {} of the reference data in {:.3f}s".format(
+                    version, time.time() - start
+                )
+            )
+            return True
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Failed to check the reference data files")
+
+    def start(self) -> "ReferenceDataManager":
+        if self._thread is None and self.interval > 0:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._watch, name="reference-data", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,37 +1,22 @@
 """This is a somewhat delicate package. It contains all registered components
 and preconfigured templates.
 
-Hence, it imports all of the components. To avoid cycles, no component should
-import this in module scope."""
+Components are registered by the module that defines them and only imported
+when they are looked up, so resolving a pipeline imports the components it
+uses and nothing else (e.g. no TensorFlow for a pipeline without the
+embedding classifier). To avoid cycles, no component should import this in
+module scope."""
 
+import importlib
 import logging
+import time
 import typing
-from typing import Any, Dict, List, Optional, Text, Type
-
-from rasa_nlu import utils
-from rasa_nlu.classifiers.embedding_intent_classifier import EmbeddingIntentClassifier
-from rasa_nlu.classifiers.keyword_intent_classifier import KeywordIntentClassifier
-from rasa_nlu.classifiers.mitie_intent_classifier import MitieIntentClassifier
-from rasa_nlu.classifiers.sklearn_intent_classifier import SklearnIntentClassifier
-from rasa_nlu.extractors.crf_entity_extractor import CRFEntityExtractor
-from rasa_nlu.extractors.duckling_http_extractor import DucklingHTTPExtractor
-from rasa_nlu.extractors.entity_synonyms import EntitySynonymMapper
-from rasa_nlu.extractors.mitie_entity_extractor import MitieEntityExtractor
-from rasa_nlu.extractors.spacy_entity_extractor import SpacyEntityExtractor
-from rasa_nlu.featurizers.count_vectors_featurizer import CountVectorsFeaturizer
-from rasa_nlu.featurizers.mitie_featurizer import MitieFeaturizer
-from rasa_nlu.featurizers.ngram_featurizer import NGramFeaturizer
-from rasa_nlu.featurizers.regex_featurizer import RegexFeaturizer
-from rasa_nlu.featurizers.spacy_featurizer import SpacyFeaturizer
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Text, Tuple, Type
+
 from rasa_nlu.model import Metadata
-from rasa_nlu.tokenizers.jieba_tokenizer import JiebaTokenizer
-from rasa_nlu.tokenizers.mitie_tokenizer import MitieTokenizer
-from rasa_nlu.tokenizers.spacy_tokenizer import SpacyTokenizer
-from rasa_nlu.tokenizers.whitespace_tokenizer import WhitespaceTokenizer
-from rasa_nlu.utils.mitie_utils import MitieNLP
-from rasa_nlu.utils.spacy_utils import SpacyNLP
-from rasa_nlu.tokenizer import ViTokenizer
-from rasa_nlu.featurizer import TfidfFeaturizer
+
+from custom_code import profiler
 
 if typing.TYPE_CHECKING:
     from rasa_nlu.components import Component
@@ -40,40 +25,133 @@ if typing.TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-# Classes of all known components. If a new component should be added,
-# its class name should be listed here.
-component_classes = [
-    # utils
-    SpacyNLP,
-    MitieNLP,
-    # tokenizers
-    MitieTokenizer,
-    SpacyTokenizer,
-    WhitespaceTokenizer,
-    JiebaTokenizer,
-    # extractors
-    SpacyEntityExtractor,
-    MitieEntityExtractor,
-    CRFEntityExtractor,
-    DucklingHTTPExtractor,
-    EntitySynonymMapper,
-    # featurizers
-    SpacyFeaturizer,
-    MitieFeaturizer,
-    NGramFeaturizer,
-    RegexFeaturizer,
-    CountVectorsFeaturizer,
-    # classifiers
-    SklearnIntentClassifier,
-    MitieIntentClassifier,
-    KeywordIntentClassifier,
-    EmbeddingIntentClassifier,
-    ViTokenizer,
-    TfidfFeaturizer,
-]
+# Modules of all known components. If a new component should be added,
+# its class name should be listed here with the module it is defined in.
+component_modules = OrderedDict(
+    [
+        # utils
+        ("SpacyNLP", "rasa_nlu.utils.spacy_utils"),
+        ("MitieNLP", "rasa_nlu.utils.mitie_utils"),
+        # tokenizers
+        ("MitieTokenizer", "rasa_nlu.tokenizers.mitie_tokenizer"),
+        ("SpacyTokenizer", "rasa_nlu.tokenizers.spacy_tokenizer"),
+        ("WhitespaceTokenizer", "rasa_nlu.tokenizers.whitespace_tokenizer"),
+        ("JiebaTokenizer", "rasa_nlu.tokenizers.jieba_tokenizer"),
+        # extractors
+        ("SpacyEntityExtractor", "rasa_nlu.extractors.spacy_entity_extractor"),
+        ("MitieEntityExtractor", "rasa_nlu.extractors.mitie_entity_extractor"),
+        ("CRFEntityExtractor", "rasa_nlu.extractors.crf_entity_extractor"),
+        ("DucklingHTTPExtractor", "rasa_nlu.extractors.duckling_http_extractor"),
+        ("EntitySynonymMapper", "rasa_nlu.extractors.entity_synonyms"),
+        # featurizers
+        ("SpacyFeaturizer", "rasa_nlu.featurizers.spacy_featurizer"),
+        ("MitieFeaturizer", "rasa_nlu.featurizers.mitie_featurizer"),
+        ("NGramFeaturizer", "rasa_nlu.featurizers.ngram_featurizer"),
+        ("RegexFeaturizer", "rasa_nlu.featurizers.regex_featurizer"),
+        ("CountVectorsFeaturizer", "rasa_nlu.featurizers.count_vectors_featurizer"),
+        # classifiers
+        ("SklearnIntentClassifier", "rasa_nlu.classifiers.sklearn_intent_classifier"),
+        ("MitieIntentClassifier", "rasa_nlu.classifiers.mitie_intent_classifier"),
+        ("KeywordIntentClassifier", "rasa_nlu.classifiers.keyword_intent_classifier"),
+        (
+            "EmbeddingIntentClassifier",
+            "rasa_nlu.classifiers.embedding_intent_classifier",
+        ),
+        ("ViTokenizer", "rasa_nlu.tokenizer"),
+        ("TfidfFeaturizer", "rasa_nlu.featurizer"),
+        ("ViSpacyFeaturizer", "rasa_nlu.featurizer"),
+        ("FeatureReducer", "rasa_nlu.reducer"),
+        ("ViSklearnIntentClassifier", "rasa_nlu.classifier"),
+        ("ViEmbeddingIntentClassifier", "rasa_nlu.classifier"),
+    ]
+)
+
+# Seconds spent importing each component, by name or module path. The
+# first component of a library pays for importing it, later ones from the
+# same library are cheap.
+import_times = OrderedDict()  # type: OrderedDict[Text, float]
+
+
+def _timed_import(module_path: Text, class_name: Text, key: Text) -> Type["Component"]:
+    start = time.time()
+    module = importlib.import_module(module_path)
+    import_times[key] = time.time() - start
+
+    logger.debug("Imported {} in {:.3f}s".format(key, import_times[key]))
+    # adds timing wrappers if NLU_PROFILE is set, see `custom_code.profiler`
+    return profiler.instrument(getattr(module, class_name))
+
+
+class LazyComponentTable(typing.Mapping[Text, Type["Component"]]):
+    """Component classes by name, each imported on its first lookup.
+
+    Membership tests and iterating over the names import nothing."""
+
+    def __init__(self, modules: Dict[Text, Text]) -> None:
+        self._modules = modules
+        self._classes = {}  # type: Dict[Text, Type[Component]]
+
+    def __getitem__(self, name: Text) -> Type["Component"]:
+        if name not in self._classes:
+            self._classes[name] = _timed_import(self._modules[name], name, name)
+        return self._classes[name]
+
+    def __contains__(self, name: Any) -> bool:
+        return name in self._modules
+
+    def __iter__(self) -> Iterator[Text]:
+        return iter(self._modules)
+
+    def __len__(self) -> int:
+        return len(self._modules)
+
+
+class LazyComponentList(typing.Sequence[Type["Component"]]):
+    """The classes of a `LazyComponentTable` in registration order."""
+
+    def __init__(self, table: LazyComponentTable) -> None:
+        self._table = table
+
+    def __getitem__(self, index: Any) -> Any:
+        names = list(self._table)
+        if isinstance(index, slice):
+            return [self._table[name] for name in names[index]]
+        return self._table[names[index]]
+
+    def __len__(self) -> int:
+        return len(self._table)
+
 
 # Mapping from a components name to its class to allow name based lookup.
-registered_components = {c.name: c for c in component_classes}
+registered_components = LazyComponentTable(component_modules)
+
+# Classes of components given by module path, e.g. `custom_code.tokenizer.ViTokenizer`
+path_components = {}  # type: Dict[Text, Type[Component]]
+
+# Classes of all known components, iterating imports all of them.
+component_classes = LazyComponentList(registered_components)
+
+
+def import_report() -> List[Tuple[Text, float]]:
+    """Components imported so far and their import time, slowest first."""
+
+    return sorted(import_times.items(), key=lambda item: item[1], reverse=True)
+
+
+def log_import_report(level: int = logging.INFO) -> None:
+    if not logger.isEnabledFor(level):
+        return
+
+    report = import_report()
+    logger.log(
+        level,
+        "Imported {} components in {:.3f}s".format(
+            len(report), sum(seconds for _, seconds in report)
+        ),
+    )
+    for name, seconds in report:
+        logger.log(level, "  {:<40} {:8.3f}s".format(name, seconds))
+
 
 # DEPRECATED ensures compatibility, will be remove in future versions
 old_style_names = {
@@ -141,8 +219,13 @@ def get_component_class(component_name: Text) -> Type["Component"]:
 
     if component_name not in registered_components:
         if component_name not in old_style_names:
+            if component_name in path_components:
+                return path_components[component_name]
             try:
-                return utils.class_from_module_path(component_name)
+                module_path, class_name = component_name.rsplit(".", 1)
+                component_class = _timed_import(
+                    module_path, class_name, component_name
+                )
             except Exception:
                 raise Exception(
                     "Failed to find component class for '{}'. Unknown "
@@ -153,6 +236,8 @@ def get_component_class(component_name: Text) -> Type["Component"]:
                     "`rasa_nlu.registry.py` or is a proper name of a class "
                     "in a module.".format(component_name)
                 )
+            path_components[component_name] = component_class
+            return component_class
         else:
             # DEPRECATED ensures compatibility, remove in future versions
             logger.warning(
@@ -198,3 +283,21 @@ def create_component_by_config(
     component_name = component_config.get("class", component_config["name"])
     component_class = get_component_class(component_name)
     return component_class.create(component_config, config)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from rasa_nlu import config
+
+    parser = argparse.ArgumentParser(
+        description="Import time of the components of a pipeline"
+    )
+    parser.add_argument("config", nargs="?", default="nlu_config.yml")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    for component in config.load(args.config).pipeline:
+        get_component_class(component.get("class", component["name"]))
+    log_import_report()
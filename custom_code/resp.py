@@ -0,0 +1,162 @@
+"""Minimal client of the Redis protocol (RESP) with a connection pool.
+
+Only what the session store needs: commands, pipelines of commands sent
+in one write and read back in order, and a pool of connections shared by
+the threads of a process. Works with Redis and with the stand-in of
+`custom_code.resp_server`."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import socket
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Sequence, Text
+
+
+class RespError(Exception):
+    """Error reply of the server."""
+
+
+def encode_command(args: Sequence[Any]) -> bytes:
+    parts = [b"*" + str(len(args)).encode() + b"\r\n"]
+    for arg in args:
+        if isinstance(arg, bytes):
+            value = arg
+        elif isinstance(arg, str):
+            value = arg.encode("utf-8")
+        else:
+            value = repr(arg).encode()
+        parts.append(b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n")
+
+    return b"".join(parts)
+
+
+def read_reply(f: Any) -> Any:
+    """Next reply of a buffered socket file, errors are returned."""
+
+    line = f.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the server")
+
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    elif kind == b"-":
+        return RespError(payload.decode("utf-8"))
+    elif kind == b":":
+        return int(payload)
+    elif kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        return f.read(length + 2)[:-2]
+    elif kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [read_reply(f) for _ in range(length)]
+    else:
+        raise ConnectionError("Invalid reply {!r}".format(line))
+
+
+class RespConnection(object):
+    def __init__(
+        self, host: Text = "localhost", port: int = 6379, db: int = 0, timeout: float = 5.0
+    ) -> None:
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+
+        if db:
+            self.execute("SELECT", db)
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Send all commands at once, replies in the same order."""
+
+        if not commands:
+            return []
+
+        self._sock.sendall(b"".join(encode_command(c) for c in commands))
+        replies = [read_reply(self._file) for _ in commands]
+
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+
+        return replies
+
+    def execute(self, *args: Any) -> Any:
+        return self.pipeline([args])[0]
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+        finally:
+            self._sock.close()
+
+
+class ConnectionPool(object):
+    """Up to `max_connections` connections, idle ones are reused.
+
+    A forked worker process starts with an empty pool instead of sharing
+    the sockets of its parent."""
+
+    def __init__(
+        self,
+        host: Text = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 8,
+        timeout: float = 5.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._idle = deque()  # type: deque
+        self._available = threading.BoundedSemaphore(self.max_connections)
+
+    @contextmanager
+    def connection(self) -> Iterator[RespConnection]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            available = self._available
+
+        available.acquire()
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = RespConnection(self.host, self.port, self.db, self.timeout)
+
+            try:
+                yield conn
+            except RespError:
+                # all replies were read, the connection can be reused
+                with self._lock:
+                    self._idle.append(conn)
+                raise
+            except BaseException:
+                # replies may be left unread
+                conn.close()
+                raise
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            available.release()
+
+    def close(self) -> None:
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
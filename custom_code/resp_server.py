@@ -0,0 +1,261 @@
+"""Local stand-in of a Redis server, for development and tests of the
+redis session store without a Redis installation.
+
+Keeps everything in memory of one process and only knows the commands
+the session store uses: PING, SELECT, GET, MGET, SET (with EX/PX), DEL,
+EXISTS, FLUSHDB, ZADD (with XX), ZREM, ZCARD, ZRANGE, ZRANGEBYSCORE,
+ZPOPMIN and ZREMRANGEBYSCORE.
+
+    python -m custom_code.resp_server --port 6379"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import logging
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+from custom_code.resp import RespError, read_reply
+
+logger = logging.getLogger(__name__)
+
+
+def encode_reply(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    elif isinstance(reply, RespError):
+        return b"-" + str(reply).encode("utf-8") + b"\r\n"
+    elif isinstance(reply, bool):
+        return b":" + (b"1" if reply else b"0") + b"\r\n"
+    elif isinstance(reply, int):
+        return b":" + str(reply).encode() + b"\r\n"
+    elif isinstance(reply, Text):
+        return b"+" + reply.encode("utf-8") + b"\r\n"
+    elif isinstance(reply, bytes):
+        return b"$" + str(len(reply)).encode() + b"\r\n" + reply + b"\r\n"
+    else:
+        return b"*" + str(len(reply)).encode() + b"\r\n" + b"".join(
+            encode_reply(r) for r in reply
+        )
+
+
+def _score(value: bytes) -> Tuple[float, bool]:
+    """Score bound of ZREMRANGEBYSCORE and whether it is exclusive."""
+
+    text = value.decode()
+    exclusive = text.startswith("(")
+    text = text.lstrip("(")
+    return float(text.replace("inf", "Infinity")), exclusive
+
+
+def _format_score(score: float) -> bytes:
+    return repr(int(score) if score == int(score) else score).encode()
+
+
+class Database(object):
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, expiration time or None)
+        self._values = {}  # type: Dict[bytes, Tuple[bytes, Optional[float]]]
+        # key -> member -> score
+        self._zsets = {}  # type: Dict[bytes, Dict[bytes, float]]
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= self.clock():
+            del self._values[key]
+            return None
+        return entry[0]
+
+    def execute(self, args: List[bytes]) -> Any:
+        if not args:
+            return RespError("ERR empty command")
+
+        name = args[0].decode().upper()
+        command = getattr(self, "cmd_" + name.lower(), None)
+        if command is None:
+            return RespError("ERR unknown command '{}'".format(name))
+
+        with self._lock:
+            try:
+                return command(*args[1:])
+            except (TypeError, ValueError, IndexError) as e:
+                return RespError("ERR {} {}".format(name, e))
+
+    def cmd_ping(self, *args: bytes) -> Any:
+        return args[0] if args else "PONG"
+
+    def cmd_select(self, db: bytes) -> Any:
+        return "OK"
+
+    def cmd_flushdb(self) -> Any:
+        self._values.clear()
+        self._zsets.clear()
+        return "OK"
+
+    def cmd_get(self, key: bytes) -> Any:
+        return self._get(key)
+
+    def cmd_mget(self, *keys: bytes) -> Any:
+        return [self._get(k) for k in keys]
+
+    def cmd_set(self, key: bytes, value: bytes, *options: bytes) -> Any:
+        expires = None
+        options = [o.upper() for o in options]
+        if b"EX" in options:
+            expires = self.clock() + float(options[options.index(b"EX") + 1])
+        elif b"PX" in options:
+            expires = self.clock() + float(options[options.index(b"PX") + 1]) / 1000.0
+
+        self._zsets.pop(key, None)
+        self._values[key] = (value, expires)
+        return "OK"
+
+    def cmd_del(self, *keys: bytes) -> Any:
+        deleted = 0
+        for key in keys:
+            if self._get(key) is not None:
+                del self._values[key]
+                deleted += 1
+            elif self._zsets.pop(key, None) is not None:
+                deleted += 1
+        return deleted
+
+    def cmd_exists(self, *keys: bytes) -> Any:
+        return sum(
+            1 for k in keys if self._get(k) is not None or k in self._zsets
+        )
+
+    def cmd_zadd(self, key: bytes, *args: bytes) -> Any:
+        args = list(args)
+        only_existing = bool(args) and args[0].upper() == b"XX"
+        if only_existing:
+            args = args[1:]
+
+        zset = self._zsets.setdefault(key, {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if member in zset or not only_existing:
+                added += member not in zset
+                zset[member] = float(score)
+
+        if not zset:
+            del self._zsets[key]
+        return added
+
+    def cmd_zrem(self, key: bytes, *members: bytes) -> Any:
+        zset = self._zsets.get(key, {})
+        removed = sum(1 for m in members if zset.pop(m, None) is not None)
+        if key in self._zsets and not zset:
+            del self._zsets[key]
+        return removed
+
+    def cmd_zcard(self, key: bytes) -> Any:
+        return len(self._zsets.get(key, {}))
+
+    def _sorted(self, key: bytes) -> List[Tuple[bytes, float]]:
+        return sorted(
+            self._zsets.get(key, {}).items(), key=lambda item: (item[1], item[0])
+        )
+
+    def cmd_zrange(self, key: bytes, start: bytes, stop: bytes) -> Any:
+        items = self._sorted(key)
+        start, stop = int(start), int(stop)
+        stop = len(items) + stop if stop < 0 else stop
+        return [m for m, _ in items[start : stop + 1]]
+
+    def cmd_zpopmin(self, key: bytes, count: bytes = b"1") -> Any:
+        items = self._sorted(key)[: int(count)]
+        reply = []
+        for member, score in items:
+            del self._zsets[key][member]
+            reply.extend([member, _format_score(score)])
+        if key in self._zsets and not self._zsets[key]:
+            del self._zsets[key]
+        return reply
+
+    def _range_by_score(self, key: bytes, low: bytes, high: bytes) -> List[bytes]:
+        (low, low_excl), (high, high_excl) = _score(low), _score(high)
+        return [
+            m
+            for m, s in self._sorted(key)
+            if (s > low if low_excl else s >= low)
+            and (s < high if high_excl else s <= high)
+        ]
+
+    def cmd_zrangebyscore(self, key: bytes, low: bytes, high: bytes) -> Any:
+        return self._range_by_score(key, low, high)
+
+    def cmd_zremrangebyscore(self, key: bytes, low: bytes, high: bytes) -> Any:
+        zset = self._zsets.get(key, {})
+        removed = self._range_by_score(key, low, high)
+        for m in removed:
+            del zset[m]
+        if key in self._zsets and not zset:
+            del self._zsets[key]
+        return len(removed)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        while True:
+            try:
+                args = read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+
+            if not isinstance(args, list):
+                reply = RespError("ERR expected an array of bulk strings")
+            else:
+                reply = self.server.database.execute(args)
+
+            self.wfile.write(encode_reply(reply))
+            self.wfile.flush()
+
+
+class LocalRespServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Stand-in server, port 0 picks a free port (see `port`)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: Text = "localhost", port: int = 0) -> None:
+        socketserver.TCPServer.__init__(self, (host, port), RespHandler)
+        self.database = Database()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "LocalRespServer":
+        """Serve in a background thread."""
+
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Local stand-in of a Redis server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    cmdline_args = parser.parse_args()
+
+    server = LocalRespServer(cmdline_args.host, cmdline_args.port)
+    logger.info("Serving the Redis protocol on {}:{}".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,144 @@
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import re
+from typing import Any, Iterable, List, Optional, Set, Text
+
+logger = logging.getLogger(__name__)
+
+# syllables, numbers and single punctuation marks of a raw text
+_SYLLABLE_RE = re.compile(u"\d+(?:[.,]\d+)*|\w+|[^\w\s]")
+
+
+class Segmenter(object):
+    """Vietnamese word segmentation backend of `ViTokenizer`.
+
+    `segment` returns the text with its words separated by spaces and the
+    syllables of a compound word joined by "_", the same as
+    `underthesea.word_tokenize(text, format="text")`."""
+
+    name = ""
+
+    def segment(self, text: Text) -> Text:
+        raise NotImplementedError
+
+    def train(self, texts: List[Text]) -> None:
+        pass
+
+    def state(self) -> Any:
+        """Everything besides the config that changes the segmentation."""
+
+        return None
+
+
+class UndertheseaSegmenter(Segmenter):
+    name = "underthesea"
+
+    def __init__(self) -> None:
+        from underthesea import word_tokenize
+
+        self._word_tokenize = word_tokenize
+
+    def segment(self, text: Text) -> Text:
+        return self._word_tokenize(text, format="text")
+
+    def state(self) -> Any:
+        import underthesea
+
+        return getattr(underthesea, "__version__", None)
+
+
+class PyviSegmenter(Segmenter):
+    name = "pyvi"
+
+    def __init__(self) -> None:
+        from pyvi import ViTokenizer as PyviTokenizer
+
+        self._tokenizer = PyviTokenizer
+
+    def segment(self, text: Text) -> Text:
+        return self._tokenizer.tokenize(text)
+
+    def state(self) -> Any:
+        import pyvi
+
+        return getattr(pyvi, "__version__", None)
+
+
+class DictionarySegmenter(Segmenter):
+    """Pure python longest match segmenter.
+
+    The dictionary holds the compound words (lowercase, syllables joined
+    by "_") found by underthesea in the training examples, so training
+    still needs underthesea but tokenizing at runtime does not."""
+
+    name = "dictionary"
+
+    def __init__(
+        self, vocabulary: Optional[Iterable[Text]] = None, max_word_length: int = 4
+    ) -> None:
+        self.max_word_length = max_word_length
+        self.vocabulary = set()  # type: Set[Text]
+        self.update(vocabulary or [])
+
+    def update(self, words: Iterable[Text]) -> None:
+        for word in words:
+            word = word.lower()
+            if word.count("_") < self.max_word_length:
+                self.vocabulary.add(word)
+
+    def train(self, texts: List[Text]) -> None:
+        reference = UndertheseaSegmenter()
+        for text in texts:
+            self.update(w for w in reference.segment(text).split() if "_" in w)
+
+        logger.debug(
+            "Built a dictionary of {} compound words".format(len(self.vocabulary))
+        )
+
+    def segment(self, text: Text) -> Text:
+        syllables = _SYLLABLE_RE.findall(text)
+        lowered = [s.lower() for s in syllables]
+
+        words = []
+        i = 0
+        while i < len(syllables):
+            j = min(len(syllables), i + self.max_word_length)
+            while j > i + 1 and "_".join(lowered[i:j]) not in self.vocabulary:
+                j -= 1
+
+            words.append("_".join(syllables[i:j]))
+            i = j
+
+        return " ".join(words)
+
+    def state(self) -> Any:
+        return sorted(self.vocabulary)
+
+    def persist(self, path: Text) -> None:
+        with io.open(path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self.vocabulary), f, ensure_ascii=False)
+
+    def load(self, path: Text) -> None:
+        with io.open(path, "r", encoding="utf-8") as f:
+            self.update(json.load(f))
+
+
+registered_segmenters = {
+    c.name: c for c in [UndertheseaSegmenter, PyviSegmenter, DictionarySegmenter]
+}
+
+
+def create_segmenter(name: Text, max_word_length: int = 4) -> Segmenter:
+    if name not in registered_segmenters:
+        raise ValueError(
+            "Unknown segmentation backend '{}', "
+            "choose one of {}".format(name, sorted(registered_segmenters))
+        )
+
+    if name == DictionarySegmenter.name:
+        return DictionarySegmenter(max_word_length=max_word_length)
+
+    return registered_segmenters[name]()
@@ -0,0 +1,550 @@
+"""Per conversation state of the action server, like the product chosen
+in `product_form`, which expires `ttl` seconds after it was set. Above
+`max_size` sessions the least recently used one is evicted.
+
+Backends, chosen by `create_session_store` from a url:
+    memory://                     dict of the process, expired sessions are
+                                  dropped on every access from a heap of
+                                  expiration times
+    sqlite:///sessions.db         WAL mode database file, shared by the
+                                  worker processes of one host
+    redis://localhost:6379/0      Redis (or `custom_code.resp_server`),
+                                  shared by all hosts
+
+Values must be json serializable for the sqlite and redis backends."""
+
+from __future__ import absolute_import, division, print_function
+
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text, Tuple
+from urllib.parse import urlparse
+
+from custom_code.resp import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(object):
+    """Interface of the session backends."""
+
+    def get(self, key: Text, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[Text]) -> Dict[Text, Any]:
+        """Values of the keys having a session, in one read."""
+
+        raise NotImplementedError
+
+    def set(self, key: Text, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, values: Dict[Text, Any]) -> None:
+        """Start the sessions of all keys, in one write."""
+
+        raise NotImplementedError
+
+    def pop(self, key: Text, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[Text, int]:
+        """size, and hits, misses, evictions and expirations seen by this
+        process"""
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return self.stats()["size"]
+
+    def __contains__(self, key: Text) -> bool:
+        return self.get(key) is not None
+
+
+class _Counters(object):
+    def __init__(self) -> None:
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _count(
+        self, hits: int = 0, misses: int = 0, evictions: int = 0, expirations: int = 0
+    ) -> None:
+        with self._counter_lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+            self.expirations += expirations
+
+    def _counts(self, size: int) -> Dict[Text, int]:
+        with self._counter_lock:
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class MemorySessionStore(_Counters, SessionStore):
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super(MemorySessionStore, self).__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # key -> (value, expiration time), least recently used first
+        self._sessions = OrderedDict()  # type: OrderedDict
+        # (expiration time, key), entries of keys set again since then
+        # are stale and skipped
+        self._expirations = []  # type: List[Tuple[float, Text]]
+
+    def _expire(self, now: float) -> None:
+        expired = 0
+        while self._expirations and self._expirations[0][0] <= now:
+            expires, key = heapq.heappop(self._expirations)
+            session = self._sessions.get(key)
+            if session is not None and session[1] == expires:
+                del self._sessions[key]
+                expired += 1
+        self._count(expirations=expired)
+
+        # drop the stale entries when they outnumber the sessions
+        if len(self._expirations) > 2 * len(self._sessions) + 64:
+            self._expirations = [
+                (expires, key) for key, (_, expires) in self._sessions.items()
+            ]
+            heapq.heapify(self._expirations)
+
+    def get_many(self, keys: Iterable[Text]) -> Dict[Text, Any]:
+        keys = list(keys)
+        values = {}
+        with self._lock:
+            self._expire(self.clock())
+
+            for key in keys:
+                session = self._sessions.get(key)
+                if session is not None:
+                    self._sessions.move_to_end(key)
+                    values[key] = session[0]
+
+        self._count(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def set_many(self, values: Dict[Text, Any]) -> None:
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+
+            expires = now + self.ttl
+            for key, value in values.items():
+                self._sessions[key] = (value, expires)
+                self._sessions.move_to_end(key)
+                heapq.heappush(self._expirations, (expires, key))
+
+            evicted = 0
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+                evicted += 1
+            self._count(evictions=evicted)
+
+    def pop(self, key: Text, default: Any = None) -> Any:
+        with self._lock:
+            self._expire(self.clock())
+
+            session = self._sessions.pop(key, None)
+            return session[0] if session is not None else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._expirations = []
+
+    def stats(self) -> Dict[Text, int]:
+        with self._lock:
+            self._expire(self.clock())
+            return self._counts(len(self._sessions))
+
+
+def _chunks(items: List[Any], size: int = 500) -> Iterable[List[Any]]:
+    # sqlite allows 999 parameters per statement
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class SQLiteSessionStore(_Counters, SessionStore):
+    """Sessions in a sqlite database file in WAL mode, so the worker
+    processes of a host read concurrently with one writer.
+
+    Every thread of every process has its own connection. Reads are plain
+    selects that never take the write lock: the last use of the sessions
+    read is kept in memory and written in one transaction once
+    `sweep_every` of them are pending or at the next sweep. Expired and
+    least recently used sessions are deleted every `sweep_every` writes
+    of a process, expired ones are never read in between."""
+
+    def __init__(
+        self,
+        path: Text,
+        ttl: float,
+        max_size: int = 10000,
+        clock: Callable[[], float] = time.time,
+        sweep_every: int = 64,
+        timeout: float = 30.0,
+    ) -> None:
+        super(SQLiteSessionStore, self).__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.sweep_every = sweep_every
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._writes = 0
+        # key -> last read not written to the used column yet
+        self._touched = {}  # type: Dict[Text, float]
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires REAL NOT NULL, used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_used ON sessions (used)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # connections must not be used across a fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys: Iterable[Text]) -> Dict[Text, Any]:
+        keys = list(keys)
+        now = self.clock()
+        conn = self._connection()
+
+        values = {}
+        for chunk in _chunks(keys):
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT key, value FROM sessions "
+                "WHERE key IN ({}) AND expires > ?".format(marks),
+                chunk + [now],
+            ).fetchall()
+            values.update((key, json.loads(value)) for key, value in rows)
+
+        self._count(hits=len(values), misses=len(keys) - len(values))
+
+        with self._counter_lock:
+            self._touched.update((key, now) for key in values)
+            flush = len(self._touched) >= self.sweep_every
+
+        if flush:
+            with conn:
+                self._write_touched(conn)
+
+        return values
+
+    def _write_touched(self, conn: sqlite3.Connection) -> None:
+        with self._counter_lock:
+            touched, self._touched = self._touched, {}
+
+        # a later write of a session already set a newer time
+        conn.executemany(
+            "UPDATE sessions SET used = MAX(used, ?) WHERE key = ?",
+            [(used, key) for key, used in touched.items()],
+        )
+
+    def set_many(self, values: Dict[Text, Any]) -> None:
+        now = self.clock()
+        conn = self._connection()
+
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (key, value, expires, used) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (key, json.dumps(value), now + self.ttl, now)
+                    for key, value in values.items()
+                ],
+            )
+
+        with self._counter_lock:
+            self._writes += len(values)
+            sweep = self._writes >= self.sweep_every
+            if sweep:
+                self._writes = 0
+
+        if sweep:
+            self.sweep()
+
+    def sweep(self) -> None:
+        """Delete the expired sessions and evict the least recently used
+        ones above `max_size`."""
+
+        conn = self._connection()
+        with conn:
+            self._write_touched(conn)
+
+            expired = conn.execute(
+                "DELETE FROM sessions WHERE expires <= ?", [self.clock()]
+            ).rowcount
+
+            size = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            evicted = 0
+            if size > self.max_size:
+                evicted = conn.execute(
+                    "DELETE FROM sessions WHERE key IN "
+                    "(SELECT key FROM sessions ORDER BY used LIMIT ?)",
+                    [size - self.max_size],
+                ).rowcount
+
+        self._count(evictions=evicted, expirations=expired)
+
+    def pop(self, key: Text, default: Any = None) -> Any:
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT value, expires FROM sessions WHERE key = ?", [key]
+            ).fetchone()
+            conn.execute("DELETE FROM sessions WHERE key = ?", [key])
+
+        if row is None or row[1] <= self.clock():
+            return default
+        return json.loads(row[0])
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM sessions")
+
+        with self._counter_lock:
+            self._touched = {}
+
+    def stats(self) -> Dict[Text, int]:
+        size = (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", [self.clock()])
+            .fetchone()[0]
+        )
+        return self._counts(size)
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisSessionStore(_Counters, SessionStore):
+    """Sessions as Redis keys expiring after `ttl`, with a sorted set of
+    the keys by last use for the LRU eviction and one by expiration time,
+    which drops the keys Redis expired from the first one.
+
+    Reads and writes of many keys are one pipeline, connections are
+    pooled. Like the sqlite store, evictions happen every `sweep_every`
+    writes of a process."""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int = 10000,
+        host: Text = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        prefix: Text = "sessions:",
+        max_connections: int = 8,
+        clock: Callable[[], float] = time.time,
+        sweep_every: int = 64,
+    ) -> None:
+        super(RedisSessionStore, self).__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prefix = prefix
+        self.clock = clock
+        self.sweep_every = sweep_every
+
+        self.pool = ConnectionPool(host, port, db, max_connections)
+        self._lru = prefix + "lru"
+        self._expires = prefix + "expires"
+        self._writes = 0
+
+    def _key(self, key: Text) -> Text:
+        return self.prefix + "key:" + key
+
+    def get_many(self, keys: Iterable[Text]) -> Dict[Text, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        now = self.clock()
+        with self.pool.connection() as conn:
+            replies = conn.execute("MGET", *[self._key(k) for k in keys])
+            values = {
+                key: json.loads(value.decode("utf-8"))
+                for key, value in zip(keys, replies)
+                if value is not None
+            }
+
+            if values:
+                conn.execute(
+                    "ZADD", self._lru, "XX", *[x for k in values for x in (now, k)]
+                )
+
+        self._count(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def set_many(self, values: Dict[Text, Any]) -> None:
+        if not values:
+            return
+
+        now = self.clock()
+        ttl_ms = int(self.ttl * 1000)
+        commands = [
+            ["SET", self._key(key), json.dumps(value), "PX", ttl_ms]
+            for key, value in values.items()
+        ]
+        commands.append(["ZADD", self._lru] + [x for k in values for x in (now, k)])
+        commands.append(
+            ["ZADD", self._expires] + [x for k in values for x in (now + self.ttl, k)]
+        )
+
+        with self.pool.connection() as conn:
+            conn.pipeline(commands)
+
+        with self._counter_lock:
+            self._writes += len(values)
+            sweep = self._writes >= self.sweep_every
+            if sweep:
+                self._writes = 0
+
+        if sweep:
+            self.sweep()
+
+    def sweep(self) -> None:
+        """Drop the expired keys from the LRU set and evict the least
+        recently used sessions above `max_size`."""
+
+        with self.pool.connection() as conn:
+            expired = self._expire(conn)
+            size = conn.execute("ZCARD", self._lru)
+
+            evicted = 0
+            if size > self.max_size:
+                popped = conn.execute("ZPOPMIN", self._lru, size - self.max_size)
+                members = popped[::2]
+                evicted, _ = conn.pipeline(
+                    [
+                        ["DEL"] + [self._key(m.decode("utf-8")) for m in members],
+                        ["ZREM", self._expires] + members,
+                    ]
+                )
+
+        self._count(evictions=evicted, expirations=expired)
+
+    def _expire(self, conn: Any) -> int:
+        """Drop the sessions past their expiration time from both sets."""
+
+        now = self.clock()
+        members, _ = conn.pipeline(
+            [
+                ["ZRANGEBYSCORE", self._expires, "-inf", now],
+                ["ZREMRANGEBYSCORE", self._expires, "-inf", now],
+            ]
+        )
+        if not members:
+            return 0
+
+        return conn.execute("ZREM", self._lru, *members)
+
+    def pop(self, key: Text, default: Any = None) -> Any:
+        with self.pool.connection() as conn:
+            value, _, _, _ = conn.pipeline(
+                [
+                    ["GET", self._key(key)],
+                    ["DEL", self._key(key)],
+                    ["ZREM", self._lru, key],
+                    ["ZREM", self._expires, key],
+                ]
+            )
+
+        return json.loads(value.decode("utf-8")) if value is not None else default
+
+    def clear(self) -> None:
+        with self.pool.connection() as conn:
+            members = conn.execute("ZRANGE", self._lru, 0, -1)
+            keys = [self._key(m.decode("utf-8")) for m in members]
+            conn.pipeline(
+                [["DEL", k] for k in keys + [self._lru, self._expires]]
+            )
+
+    def stats(self) -> Dict[Text, int]:
+        with self.pool.connection() as conn:
+            expired = self._expire(conn)
+            size = conn.execute("ZCARD", self._lru)
+
+        self._count(expirations=expired)
+        return self._counts(size)
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def create_session_store(
+    url: Optional[Text], ttl: float, max_size: int = 10000
+) -> SessionStore:
+    """Session store of a url like memory://, sqlite:///sessions.db
+    (sqlite:////abs/path.db for an absolute path) or
+    redis://host:port/db."""
+
+    parsed = urlparse(url or "memory://")
+
+    if parsed.scheme == "memory":
+        store = MemorySessionStore(ttl, max_size)
+    elif parsed.scheme == "sqlite":
+        store = SQLiteSessionStore(parsed.path[1:], ttl, max_size)
+    elif parsed.scheme == "redis":
+        store = RedisSessionStore(
+            ttl,
+            max_size,
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path[1:] or 0),
+        )
+    else:
+        raise ValueError(
+            "Unknown session store '{}', use a memory://, sqlite:/// or "
+            "redis:// url".format(url)
+        )
+
+    logger.debug("Using the {} session store".format(parsed.scheme))
+    return store
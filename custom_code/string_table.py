@@ -0,0 +1,137 @@
+from __future__ import absolute_import, division, print_function
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterable, Optional, Text
+
+# section layout: magic, number of strings, size of the string blob, then
+# (count + 1) little-endian uint32 offsets and the utf-8 blob
+HEADER = struct.Struct("<4sII")
+MAGIC = b"VNST"
+# the offsets have to be swapped to and from the native order
+SWAP_OFFSETS = sys.byteorder == "big"
+
+
+class StringTable(object):
+    """Sorted, immutable table of strings stored in one flat buffer.
+
+    The buffer can be a `bytes` object or a memory map of a file, lookups
+    binary search the utf-8 encoded strings in place, so a table loaded
+    from disk costs no parsing and its pages are shared between processes
+    mapping the same file."""
+
+    def __init__(self, buffer, start: int = 0) -> None:
+        magic, count, blob_size = HEADER.unpack_from(buffer, start)
+        if magic != MAGIC:
+            raise ValueError("Buffer does not contain a string table.")
+
+        offsets_start = start + HEADER.size
+        blob_start = offsets_start + (count + 1) * 4
+
+        self._buffer = buffer
+        self._start = start
+        self._count = count
+        self._offsets = memoryview(buffer)[offsets_start:blob_start].cast("I")
+        if SWAP_OFFSETS:
+            # can't swap a mapped file in place, the copy only costs 4 bytes a string
+            self._offsets = array("I", self._offsets)
+            self._offsets.byteswap()
+        self._blob_start = blob_start
+
+        # position of the first byte after this table
+        self.end = blob_start + blob_size
+
+    @staticmethod
+    def encode(strings: Iterable[Text]) -> bytes:
+        """Encode strings into a table section, sorted by their utf-8 bytes."""
+
+        encoded = sorted(s.encode("utf-8") for s in strings)
+
+        offsets = array("I", [0])
+        for s in encoded:
+            offsets.append(offsets[-1] + len(s))
+        total = offsets[-1]
+        if SWAP_OFFSETS:
+            offsets.byteswap()
+
+        return b"".join(
+            [HEADER.pack(MAGIC, len(encoded), total), offsets.tobytes()]
+            + encoded
+        )
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[Text]) -> "StringTable":
+        return cls(cls.encode(strings))
+
+    def _key(self, i: int) -> bytes:
+        return bytes(
+            self._buffer[
+                self._blob_start + self._offsets[i] : self._blob_start
+                + self._offsets[i + 1]
+            ]
+        )
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def index(self, s: Text) -> int:
+        """Position of `s` in the table, -1 if it is not present."""
+
+        key = s.encode("utf-8")
+        i = self._lower_bound(key)
+        if i < self._count and self._key(i) == key:
+            return i
+        return -1
+
+    def first_with_prefix(self, prefix: Text) -> Optional[Text]:
+        """Smallest string of the table starting with `prefix`, if any."""
+
+        key = prefix.encode("utf-8")
+        i = self._lower_bound(key)
+        if i < self._count:
+            s = self._key(i)
+            if s.startswith(key):
+                return s.decode("utf-8")
+        return None
+
+    def has_prefix(self, prefix: Text) -> bool:
+        """Whether any string of the table starts with `prefix`."""
+
+        return self.first_with_prefix(prefix) is not None
+
+    def tobytes(self) -> bytes:
+        """The encoded table, as written by `encode`."""
+
+        return bytes(self._buffer[self._start : self.end])
+
+    def __contains__(self, s: Text) -> bool:
+        return self.index(s) >= 0
+
+    def __getitem__(self, i: int) -> Text:
+        if not 0 <= i < self._count:
+            raise IndexError("string table index out of range")
+        return self._key(i).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+
+def map_file(path: Text) -> mmap.mmap:
+    """Read-only memory map of a whole file."""
+
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
@@ -1,19 +1,36 @@
 from __future__ import absolute_import, division, print_function
 
-import json
 import logging
-import re
-from typing import Any, Dict, List, Text
+import multiprocessing
+import os
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping, Sequence
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple, Union
 
 from rasa_nlu.components import Component
 from rasa_nlu.config import RasaNLUModelConfig
+from rasa_nlu.model import Metadata
 from rasa_nlu.training_data import Message, TrainingData
-from underthesea import word_tokenize
+
+from custom_code.feature_cache import fingerprint
+from custom_code.normalizer import CorrectionMapping, Normalizer
+from custom_code.segmenters import DictionarySegmenter, Segmenter, create_segmenter
 
 logger = logging.getLogger(__name__)
 
+# tokenizer of the current worker process (see `ViTokenizer.tokenize_many`)
+_worker_tokenizer = None
+
+# marks token attributes that were never set in a `TokenSequence`
+_MISSING = object()
+
 
 class Token(object):
+    __slots__ = ("offset", "text", "end", "data")
+
     def __init__(self, text, offset, data=None):
         self.offset = offset
         self.text = text
@@ -30,9 +47,212 @@ class Token(object):
         return "{} (match: {})".format(self.text, (self.offset, self.end))
 
 
-class ViTokenizer(Component):  # neednt persist
+class TokenView(object):
+    """Single token of a `TokenSequence` with the interface of `Token`."""
+
+    __slots__ = ("_sequence", "_index")
+
+    def __init__(self, sequence, index):  # type: (TokenSequence, int) -> None
+        self._sequence = sequence
+        self._index = index
+
+    @property
+    def text(self):
+        return self._sequence.texts[self._index]
+
+    @property
+    def offset(self):
+        return self._sequence.offsets[self._index]
+
+    @property
+    def end(self):
+        return self._sequence.ends[self._index]
+
+    @property
+    def data(self):  # type: () -> TokenData
+        return TokenData(self._sequence, self._index)
+
+    def set(self, prop, info):
+        self._sequence.set_attribute(self._index, prop, info)
+
+    def get(self, prop, default=None):
+        return self._sequence.get_attribute(self._index, prop, default)
+
+    def __repr__(self):
+        return "{} (match: {})".format(self.text, (self.offset, self.end))
+
+
+class TokenData(MutableMapping):
+    """Live `data` dict of a `TokenView`, reads and writes go to the sequence."""
+
+    __slots__ = ("_sequence", "_index")
+
+    def __init__(self, sequence, index):  # type: (TokenSequence, int) -> None
+        self._sequence = sequence
+        self._index = index
+
+    def __getitem__(self, prop):
+        value = self._sequence.get_attribute(self._index, prop, _MISSING)
+        if value is _MISSING:
+            raise KeyError(prop)
+        return value
+
+    def __setitem__(self, prop, info):
+        self._sequence.set_attribute(self._index, prop, info)
+
+    def __delitem__(self, prop):
+        if not self._sequence.del_attribute(self._index, prop):
+            raise KeyError(prop)
+
+    def __iter__(self):
+        return iter(self._sequence.token_props(self._index))
+
+    def __len__(self):
+        return len(self._sequence.token_props(self._index))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TokenSequence(Sequence):
+    """Compact container for all tokens of one message.
+
+    Texts, offsets and ends are kept in parallel arrays and token
+    attributes in one list per attribute name, instead of a `Token` object
+    and a `data` dict for every token. Indexing returns a lightweight
+    `TokenView`, so components using `text`, `offset`, `end`, `get` and
+    `set` work unchanged."""
+
+    __slots__ = ("texts", "offsets", "ends", "_columns")
+
+    def __init__(self, texts, offsets):  # type: (List[Text], Iterable[int]) -> None
+        self.texts = texts
+        self.offsets = array("l", offsets)
+        self.ends = array("l", (o + len(t) for t, o in zip(texts, self.offsets)))
+        self._columns = None
+
+    @classmethod
+    def from_spans(cls, spans):  # type: (Iterable[Tuple[Text, int]]) -> TokenSequence
+        spans = list(spans)
+        return cls([t for t, _ in spans], [o for _, o in spans])
+
+    def get_attribute(self, index, prop, default=None):
+        # type: (int, Text, Any) -> Any
+        if self._columns is None or prop not in self._columns:
+            return default
+
+        value = self._columns[prop][index]
+        return default if value is _MISSING else value
+
+    def set_attribute(self, index, prop, info):  # type: (int, Text, Any) -> None
+        if self._columns is None:
+            self._columns = {}
+
+        column = self._columns.get(prop)
+        if column is None:
+            column = self._columns[prop] = [_MISSING] * len(self.texts)
+
+        column[index] = info
+
+    def del_attribute(self, index, prop):  # type: (int, Text) -> bool
+        column = self._columns.get(prop) if self._columns else None
+        if column is None or column[index] is _MISSING:
+            return False
+
+        column[index] = _MISSING
+        return True
+
+    def token_props(self, index):  # type: (int) -> List[Text]
+        if self._columns is None:
+            return []
+
+        return [
+            prop
+            for prop, column in self._columns.items()
+            if column[index] is not _MISSING
+        ]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+
+        return TokenView(self, index)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class TokenCache(object):
+    """Bounded LRU cache of tokenization results.
+
+    Tokens are stored as `(text, offset)` spans and the tokenizer builds
+    new tokens from them on every hit, so components that `set` token data
+    later on never write into the cache."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[Tuple[Tuple[Text, int], ...]]:
+        with self._lock:
+            spans = self._entries.get(key)
+            if spans is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return spans
+
+    def put(self, key: Tuple, spans: Iterable[Tuple[Text, int]]) -> None:
+        spans = tuple(spans)
+
+        with self._lock:
+            self._entries[key] = spans
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[Text, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ViTokenizer(Component):  # persists only the dictionary backend
     provides = ["tokens"]
 
+    # per example outputs and inputs, see `custom_code.trainer.ViTrainer`
+    cached_attributes = ["tokens"]
+    cached_inputs = []
+
     language_list = ["vi", "vi_spacy_model", "vi_fasttext"]
 
     defaults = {
@@ -40,6 +260,22 @@ class ViTokenizer(Component):  # neednt persist
         "lowercase": True,
         "replace_tokens": False,
         "use_punctuation": False,
+        # word segmentation backend: "underthesea", "pyvi" or "dictionary"
+        # (longest match over the words of the training data)
+        "backend": "underthesea",
+        # longest word, in syllables, of the dictionary backend
+        "max_word_length": 4,
+        # number of processes used to tokenize the training examples,
+        # 1 tokenizes them in the current process
+        "num_workers": 1,
+        # number of examples sent to a worker process at once
+        "chunk_size": 64,
+        # number of tokenized messages kept in memory at runtime,
+        # 0 disables the cache
+        "cache_size": 1024,
+        # store the tokens of a message in a compact `TokenSequence`
+        # instead of a list of `Token` objects
+        "compact_tokens": False,
     }
 
     def __init__(self, component_config: Dict[Text, Any] = None) -> None:
@@ -53,62 +289,272 @@ class ViTokenizer(Component):  # neednt persist
 
         self.use_punctuation = self.component_config["use_punctuation"]
 
+        self.num_workers = self.component_config["num_workers"]
+        self.chunk_size = self.component_config["chunk_size"]
+
+        self.compact_tokens = self.component_config["compact_tokens"]
+
+        self.backend = self.component_config["backend"]
+        self.segmenter = create_segmenter(
+            self.backend, self.component_config["max_word_length"]
+        )
+
+        # json mapping or a mapping compiled by `custom_code.normalizer`
         try:
-            self.correct_mapping = json.load(
-                open(self.component_config["correct_mapping"], "r")
+            self.correct_mapping = CorrectionMapping.load(
+                self.component_config["correct_mapping"]
             )
 
         except Exception as e:
-            self.correct_mapping = {}
+            self.correct_mapping = CorrectionMapping.from_dict({})
+
+        self.normalizer = Normalizer(
+            self.correct_mapping,
+            replace_numbers=self.replace_tokens,
+            use_punctuation=self.use_punctuation,
+            replace_punctuation=self.replace_tokens,
+        )
+
+        cache_size = self.component_config["cache_size"]
+        self.cache = TokenCache(cache_size) if cache_size else None
+
+        # worker processes of `tokenize_many`, started on first use
+        self._pool = None  # type: Optional[multiprocessing.pool.Pool]
+        self._pool_workers = 0
+        self._pool_pid = None  # type: Optional[int]
+        self._pool_finalizer = None  # type: Optional[weakref.finalize]
+
+    def __getstate__(self) -> Dict[Text, Any]:
+        state = self.__dict__.copy()
+        # the workers belong to this process
+        state.update(_pool=None, _pool_workers=0, _pool_pid=None, _pool_finalizer=None)
+        return state
 
     @classmethod
     def required_packages(cls):  # type: () -> List[Text]
+        # underthesea is the default backend and builds the dictionary one
         return ["underthesea"]
 
-    def tokenize(self, text: Text) -> List[Token]:
+    def spans(self, text: Text) -> List[Tuple[Text, int]]:
         # preprocess
         # - replace any numbers by __NUMBER__ token
-        text = (
-            re.sub(u"\$?#?\d+(?:\.\d+)?%?", " __NUMBER__ ", text.strip())
-            if self.replace_tokens
-            else text.strip()
-        )
         # - correct words (by mapping)
-        text = " ".join(
-            [
-                self.correct_mapping.get(word.strip().lower(), word.strip())
-                for word in text.split(" ")
-            ]
-        )
+        text = self.normalizer.normalize(text)
         # - tokenize
-        text = word_tokenize(text, format="text")
+        text = self.segmenter.segment(text)
         # - replace any punctuation by __PUNC__ token (skip for "_")
-        if self.replace_tokens or not self.use_punctuation:
-            text = re.sub(u"\.\.\.|[][.,;\"'?():`~\-!@]", " __PUNC__ ", text)
-
-            if not self.use_punctuation:
-                text = re.sub("__PUNC__", "", text)
-
-        # - replace duplicate space
-        text = re.sub(" {2,}", " ", text.strip())
+        # - an empty text still gives a single empty token
+        words = self.normalizer.words(text) or [""]
 
-        # build tokens list
-        tokens = []
+        # build (text, offset) spans
+        spans = []
         offset = 0
-        for word in text.split(" "):
-            tokens.append(Token(word.lower() if self.lowercase else word, offset))
+        for word in words:
+            spans.append((word.lower() if self.lowercase else word, offset))
 
             offset += len(word) + 1  # space
 
+        return spans
+
+    def build_tokens(
+        self, spans: Iterable[Tuple[Text, int]]
+    ) -> Union[List[Token], TokenSequence]:
+        if self.compact_tokens:
+            return TokenSequence.from_spans(spans)
+
+        return [Token(text, offset) for text, offset in spans]
+
+    def tokenize(self, text: Text) -> Union[List[Token], TokenSequence]:
+        tokens = self.build_tokens(self.spans(text))
+
         logger.debug("tokens: {}".format(tokens))
 
         return tokens
 
+    def tokenize_many(
+        self, texts: Iterable[Text], num_workers: Optional[int] = None
+    ) -> List[Union[List[Token], TokenSequence]]:
+        """Tokenize a batch of texts, keeping their order.
+
+        With more than one worker the texts are segmented in a process
+        pool, every worker builds its own tokenizer from this component's
+        config, so the returned tokens are the same as `tokenize` gives."""
+
+        return [
+            self.build_tokens(spans) for spans in self._spans_many(texts, num_workers)
+        ]
+
+    def _spans_many(
+        self, texts: Iterable[Text], num_workers: Optional[int] = None
+    ) -> List[List[Tuple[Text, int]]]:
+        texts = list(texts)
+        num_workers = num_workers or self.num_workers or 1
+        num_workers = min(num_workers, len(texts))
+
+        if num_workers <= 1:
+            return [self.spans(text) for text in texts]
+
+        logger.debug(
+            "Tokenizing {} texts with {} worker processes"
+            "".format(len(texts), num_workers)
+        )
+        pool = self._worker_pool(max(num_workers, self._pool_workers))
+        return pool.map(_worker_spans, texts, chunksize=self.chunk_size)
+
+    def _worker_pool(self, num_workers: int) -> "multiprocessing.pool.Pool":
+        """The process pool of this component, started on first use and
+        kept until `close`, the component is collected or the process
+        exits."""
+
+        if (
+            self._pool is not None
+            and self._pool_pid == os.getpid()
+            and self._pool_workers >= num_workers
+        ):
+            return self._pool
+
+        self.close()
+        self._pool = multiprocessing.Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(self.component_config, self.segmenter),
+        )
+        self._pool_workers = num_workers
+        self._pool_pid = os.getpid()
+        self._pool_finalizer = weakref.finalize(self, _close_pool, self._pool)
+        return self._pool
+
+    def close(self) -> None:
+        """Stop the worker processes, if any were started."""
+
+        if self._pool_finalizer is not None and self._pool_pid == os.getpid():
+            self._pool_finalizer()
+        self._pool = None
+        self._pool_workers = 0
+        self._pool_pid = None
+        self._pool_finalizer = None
+
+    def fit(
+        self, training_data, cfg=None, **kwargs
+    ):  # type: (TrainingData, Optional[RasaNLUModelConfig], **Any) -> None
+        """Train the segmenter without tokenizing the training examples."""
+
+        self.segmenter.train(
+            [example.text for example in training_data.training_examples]
+        )
+
+        # tokens of the old segmenter, in the cache and in the workers
+        if self.cache is not None:
+            self.cache.clear()
+        self.close()
+
+    def fingerprint(self) -> Text:
+        """Hash of everything that changes the tokens of a text."""
+
+        return fingerprint(
+            self.component_config,
+            self.segmenter.state(),
+            self.correct_mapping.table.tobytes(),
+        )
+
+    @staticmethod
+    def cached_examples(training_data):  # type: (TrainingData) -> List[Message]
+        return training_data.training_examples
+
     def train(
         self, training_data, cfg, **kwargs
     ):  # type: (TrainingData, RasaNLUModelConfig, **Any) -> None
-        for example in training_data.training_examples:
-            example.set("tokens", self.tokenize(example.text))
+        self.fit(training_data)
+        self.process_batch(training_data.training_examples)
+
+    def process_batch(self, messages, **kwargs):  # type: (List[Message], **Any) -> None
+        """Tokenize many messages, the cached texts from the cache and the
+        others in the worker processes if there are enough of them."""
+
+        all_spans = [None] * len(messages)  # type: List[Optional[Tuple]]
+        missing = []
+        for i, message in enumerate(messages):
+            if self.cache is not None:
+                all_spans[i] = self.cache.get(self._cache_key(message.text))
+            if all_spans[i] is None:
+                missing.append(i)
+
+        # less than a chunk isn't worth sending to the workers
+        num_workers = self.num_workers if len(missing) >= self.chunk_size else 1
+        spans = self._spans_many([messages[i].text for i in missing], num_workers)
+        for i, message_spans in zip(missing, spans):
+            all_spans[i] = message_spans
+            if self.cache is not None:
+                self.cache.put(self._cache_key(messages[i].text), message_spans)
+
+        for message, message_spans in zip(messages, all_spans):
+            message.set("tokens", self.build_tokens(message_spans))
+
+    def _cache_key(self, text: Text) -> Tuple:
+        return (
+            text.strip(),
+            self.backend,
+            self.lowercase,
+            self.replace_tokens,
+            self.use_punctuation,
+        )
+
+    def cached_tokenize(self, text: Text) -> Union[List[Token], TokenSequence]:
+        if self.cache is None:
+            return self.tokenize(text)
+
+        key = self._cache_key(text)
+        spans = self.cache.get(key)
+        if spans is None:
+            spans = self.spans(text)
+            self.cache.put(key, spans)
+
+        return self.build_tokens(spans)
 
     def process(self, message, **kwargs):  # type: (Message, **Any) -> None
-        message.set("tokens", self.tokenize(message.text))
+        message.set("tokens", self.cached_tokenize(message.text))
+
+    def persist(self, file_name, model_dir):  # type: (Text, Text) -> Optional[Dict[Text, Any]]
+        if not isinstance(self.segmenter, DictionarySegmenter):
+            return None
+
+        file_name = file_name + "_vocabulary.json"
+        self.segmenter.persist(os.path.join(model_dir, file_name))
+
+        return {"vocabulary_file": file_name}
+
+    @classmethod
+    def load(
+        cls,
+        meta: Dict[Text, Any] = None,
+        model_dir: Text = None,
+        model_metadata: Metadata = None,
+        cached_component: Optional["ViTokenizer"] = None,
+        **kwargs: Any
+    ) -> "ViTokenizer":
+        if cached_component:
+            return cached_component
+
+        tokenizer = cls(meta)
+
+        vocabulary_file = meta.get("vocabulary_file")
+        if vocabulary_file and isinstance(tokenizer.segmenter, DictionarySegmenter):
+            tokenizer.segmenter.load(os.path.join(model_dir, vocabulary_file))
+
+        return tokenizer
+
+
+def _init_worker(component_config, segmenter):
+    # type: (Dict[Text, Any], Segmenter) -> None
+    global _worker_tokenizer
+    _worker_tokenizer = ViTokenizer(component_config)
+    _worker_tokenizer.segmenter = segmenter
+
+
+def _worker_spans(text):  # type: (Text) -> List[Tuple[Text, int]]
+    return _worker_tokenizer.spans(text)
+
+
+def _close_pool(pool):  # type: (multiprocessing.pool.Pool) -> None
+    pool.terminate()
+    pool.join()
@@ -0,0 +1,256 @@
+"""Sampled traces of the custom actions.
+
+A traced action records one span per run: the action, the sender, the
+intent and the top `top_k` of the intent ranking of the latest message,
+the slots its events changed (old and new value), the number of events,
+the duration and the error if it raised.
+
+Nothing is recorded unless the sampler picks the conversation, which is
+decided once per sender (a conversation is traced entirely or not at
+all). With a rate of 0, the default, a traced action costs one
+comparison. Spans are plain dicts put on a bounded queue; a background
+thread serializes them to a rotating jsonl file, spans are dropped (and
+counted) when the queue is full rather than slowing down the actions.
+
+    ACTION_TRACE_RATE=0.1 ACTION_TRACE_FILE=traces/actions.jsonl"""
+
+from __future__ import absolute_import, division, print_function
+
+import atexit
+import functools
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Text
+
+logger = logging.getLogger(__name__)
+
+
+class Sampler(object):
+    """Picks a `rate` share of the senders, always the same ones."""
+
+    def __init__(self, rate: float = 0.0) -> None:
+        self.rate = rate
+
+    def sample(self, sender_id: Optional[Text]) -> bool:
+        if self.rate <= 0.0:
+            return False
+        if self.rate >= 1.0:
+            return True
+
+        bucket = zlib.crc32((sender_id or "").encode("utf-8")) / 2.0 ** 32
+        return bucket < self.rate
+
+
+class JsonlWriter(object):
+    """Writes spans as json lines from a background thread, rotating the
+    file at `max_bytes` with `backup_count` old files (like
+    `logging.handlers.RotatingFileHandler`)."""
+
+    def __init__(
+        self,
+        path: Text,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+        queue_size: int = 10000,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._queue = queue.Queue(maxsize=queue_size)  # type: queue.Queue
+        self._thread = None  # type: Optional[threading.Thread]
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, span: Dict[Text, Any]) -> None:
+        if self._thread is None:
+            self._start()
+
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="action-traces", daemon=True
+                )
+                self._thread.start()
+
+    def _rotate(self, f: Any) -> Any:
+        f.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = "{}.{}".format(self.path, i)
+            if os.path.exists(source):
+                os.replace(source, "{}.{}".format(self.path, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+        return io.open(self.path, "a", encoding="utf-8")
+
+    def _run(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        f = io.open(self.path, "a", encoding="utf-8")
+        size = f.tell()
+        try:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+
+                line = json.dumps(span, ensure_ascii=False, default=repr) + "\n"
+                if size and size + len(line) > self.max_bytes:
+                    f = self._rotate(f)
+                    size = 0
+
+                f.write(line)
+                size += len(line)
+                self.written += 1
+
+                if self._queue.empty():
+                    f.flush()
+        except Exception:
+            logger.exception("Writing action traces to {} failed".format(self.path))
+        finally:
+            f.close()
+
+    def close(self) -> None:
+        """Write the queued spans and stop the thread."""
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+class Tracer(object):
+    def __init__(
+        self, sampler: Sampler, writer: Optional[JsonlWriter], top_k: int = 5
+    ) -> None:
+        self.sampler = sampler
+        self.writer = writer
+        self.top_k = top_k
+
+    def start(self, action: Text, tracker: Any) -> Optional[Dict[Text, Any]]:
+        """Span of an action run, None if it is not sampled."""
+
+        if self.writer is None or not self.sampler.sample(tracker.sender_id):
+            return None
+
+        message = tracker.latest_message or {}
+        intent = message.get("intent") or {}
+        return {
+            "timestamp": time.time(),
+            "action": action,
+            "sender": tracker.sender_id,
+            "intent": intent.get("name"),
+            "confidence": intent.get("confidence"),
+            "ranking": [
+                [i.get("name"), i.get("confidence")]
+                for i in (message.get("intent_ranking") or [])[: self.top_k]
+            ],
+            "slots": dict(tracker.slots),
+            "start": time.perf_counter(),
+        }
+
+    def finish(
+        self,
+        span: Dict[Text, Any],
+        events: Optional[List[Dict[Text, Any]]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        span["duration_ms"] = (time.perf_counter() - span.pop("start")) * 1000.0
+
+        slots_before = span.pop("slots")
+        changed = {}
+        for e in events or []:
+            if e.get("event") == "slot" and slots_before.get(e["name"]) != e["value"]:
+                changed[e["name"]] = [slots_before.get(e["name"]), e["value"]]
+        span["slot_changes"] = changed
+        span["events"] = len(events or [])
+
+        if error is not None:
+            span["error"] = repr(error)
+
+        self.writer.write(span)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+def tracer_from_env() -> Tracer:
+    rate = float(os.environ.get("ACTION_TRACE_RATE", 0))
+    if rate <= 0:
+        return Tracer(Sampler(0.0), None)
+
+    writer = JsonlWriter(
+        os.environ.get("ACTION_TRACE_FILE", "traces/actions.jsonl"),
+        max_bytes=int(os.environ.get("ACTION_TRACE_MAX_BYTES", 10 * 1024 * 1024)),
+    )
+    return Tracer(Sampler(rate), writer)
+
+
+# the tracer of the action server
+tracer = tracer_from_env()
+atexit.register(tracer.close)
+
+
+def traced(action_class: type) -> type:
+    """Class decorator recording a span of every run of an action, of
+    `run_async` for the async actions (their `run` calls it)."""
+
+    if hasattr(action_class, "run_async"):
+        run_async = action_class.run_async
+
+        @functools.wraps(run_async)
+        async def traced_run_async(self, dispatcher, tracker, domain):
+            span = tracer.start(self.name(), tracker)
+            if span is None:
+                return await run_async(self, dispatcher, tracker, domain)
+
+            try:
+                events = await run_async(self, dispatcher, tracker, domain)
+            except Exception as e:
+                tracer.finish(span, error=e)
+                raise
+
+            tracer.finish(span, events)
+            return events
+
+        action_class.run_async = traced_run_async
+        return action_class
+
+    run = action_class.run
+
+    @functools.wraps(run)
+    def traced_run(self, dispatcher, tracker, domain):
+        span = tracer.start(self.name(), tracker)
+        if span is None:
+            return run(self, dispatcher, tracker, domain)
+
+        try:
+            events = run(self, dispatcher, tracker, domain)
+        except Exception as e:
+            tracer.finish(span, error=e)
+            raise
+
+        tracer.finish(span, events)
+        return events
+
+    action_class.run = traced_run
+    return action_class
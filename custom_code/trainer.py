@@ -0,0 +1,297 @@
+from __future__ import absolute_import, division, print_function
+
+import copy
+import logging
+import time
+from typing import Any, Dict, List, Optional, Text
+
+import numpy as np
+import scipy.sparse
+from rasa_nlu import components
+from rasa_nlu.components import Component, ComponentBuilder
+from rasa_nlu.config import RasaNLUModelConfig
+from rasa_nlu.model import Interpreter, Trainer
+from rasa_nlu.training_data import Message, TrainingData
+
+from custom_code.feature_cache import FeatureCache, fingerprint
+from custom_code.feature_store import FeatureStore, stack_rows
+
+logger = logging.getLogger(__name__)
+
+# rasa_nlu components whose `train` runs `process` on every example:
+# the examples they set, the attributes they provide and the attributes
+# besides the text they read
+PER_EXAMPLE_COMPONENTS = {
+    "SpacyNLP": ("training_examples", ["spacy_doc"], []),
+    "SpacyFeaturizer": (
+        "intent_examples",
+        ["text_features"],
+        ["spacy_doc", "text_features"],
+    ),
+}
+
+
+class ViTrainer(Trainer):
+    """Trainer that reuses per-example outputs of earlier runs.
+
+    Components listed in `PER_EXAMPLE_COMPONENTS` and components with
+    `fit`, `fingerprint`, `cached_examples`, `cached_attributes`,
+    `cached_inputs` and `process_batch` (`ViTokenizer`,
+    `ViSpacyFeaturizer`) look up the outputs of every example in a
+    `FeatureCache` and only process the missing ones. All other
+    components are trained as usual.
+
+    The key of an example's outputs only depends on what the component
+    reads of that example: its text and the attributes in its inputs,
+    hashed by the key of the cached component that set them or by their
+    value otherwise, so editing one example only recomputes its own
+    outputs, whatever runs in between.
+
+    Featurizers get a `FeatureStore` of the intent examples as
+    `feature_store` in the context (see `custom_code.feature_store`)."""
+
+    def __init__(
+        self,
+        cfg: RasaNLUModelConfig,
+        component_builder: Optional[ComponentBuilder] = None,
+        skip_validation: bool = False,
+        cache_dir: Optional[Text] = None,
+        max_cache_size: int = 2 * 1024 ** 3,
+    ) -> None:
+        from rasa_nlu import registry
+
+        super(ViTrainer, self).__init__(cfg, component_builder, skip_validation)
+        registry.log_import_report(logging.DEBUG)
+
+        if cache_dir:
+            self.feature_cache = FeatureCache(cache_dir, max_cache_size)
+        else:
+            self.feature_cache = None
+
+    def train(self, data: TrainingData, **kwargs: Any) -> Interpreter:
+        """Trains the underlying pipeline using the provided training data."""
+
+        self.training_data = data
+
+        self.training_data.validate()
+
+        context = kwargs
+
+        for component in self.pipeline:
+            updates = component.provide_context()
+            if updates:
+                context.update(updates)
+
+        # Before the training starts: check that all arguments are provided
+        if not self.skip_validation:
+            components.validate_arguments(self.pipeline, context)
+
+        # data gets modified internally during the training - hence the copy
+        working_data = copy.deepcopy(data)
+
+        feature_store = FeatureStore(working_data.intent_examples)
+        context["feature_store"] = feature_store
+
+        # attribute -> id of an example -> cache key of the value the
+        # example got from a cached component
+        keys = {}  # type: Dict[Text, Dict[int, Text]]
+
+        for i, component in enumerate(self.pipeline):
+            if feature_store.pending and not self._uses_feature_store(component):
+                # from here on components see the features on the examples
+                feature_store.materialize()
+                keys.pop("text_features", None)
+
+            logger.info("Starting to train component {}".format(component.name))
+            component.prepare_partial_processing(self.pipeline[:i], context)
+
+            if self.feature_cache is not None and self._is_cacheable(component):
+                self._train_cached(component, working_data, context, keys)
+                updates = None
+            else:
+                updates = component.train(working_data, self.config, **context)
+                # the values may have changed, they are hashed from now on
+                for attribute in component.provides:
+                    keys.pop(attribute, None)
+
+            logger.info("Finished training component.")
+            if updates:
+                context.update(updates)
+
+        feature_store.materialize()
+        del context["feature_store"]
+
+        if self.feature_cache is not None:
+            self.feature_cache.log_report()
+
+        return Interpreter(self.pipeline, context)
+
+    @staticmethod
+    def _is_cacheable(component: Component) -> bool:
+        return component.name in PER_EXAMPLE_COMPONENTS or all(
+            hasattr(component, attr)
+            for attr in [
+                "fit",
+                "fingerprint",
+                "cached_examples",
+                "cached_attributes",
+                "cached_inputs",
+                "process_batch",
+            ]
+        )
+
+    @staticmethod
+    def _uses_feature_store(component: Component) -> bool:
+        uses_feature_store = getattr(component, "uses_feature_store", None)
+        return uses_feature_store is not None and uses_feature_store()
+
+    def _train_cached(
+        self,
+        component: Component,
+        training_data: TrainingData,
+        context: Dict[Text, Any],
+        keys: Dict[Text, Dict[int, Text]],
+    ) -> None:
+        start = time.time()
+        feature_store = context.get("feature_store")
+
+        if component.name in PER_EXAMPLE_COMPONENTS:
+            examples_attr, attributes, inputs = PER_EXAMPLE_COMPONENTS[component.name]
+            examples = getattr(training_data, examples_attr)
+            component_fingerprint = fingerprint(
+                component.name,
+                component.component_config,
+                self._library_state(component),
+            )
+
+            def process(messages):  # type: (List[Message]) -> None
+                for message in messages:
+                    component.process(message, **context)
+
+        else:
+            component.fit(training_data, self.config, **context)
+            examples = component.cached_examples(training_data)
+            attributes = component.cached_attributes
+            inputs = component.cached_inputs
+            component_fingerprint = component.fingerprint()
+
+            def process(messages):  # type: (List[Message]) -> None
+                component.process_batch(messages, **context)
+
+        example_keys = [
+            fingerprint(
+                component_fingerprint,
+                example.text,
+                *[self._input_key(example, attr, keys) for attr in inputs]
+            )
+            for example in examples
+        ]
+
+        if feature_store is not None and self._uses_feature_store(component):
+            # cache the rows of the component's own features instead
+            self._train_cached_features(
+                component, examples, example_keys, feature_store
+            )
+            self.feature_cache.add_time(component.name, time.time() - start)
+            return
+
+        missing = []
+        for key, example in zip(example_keys, examples):
+            outputs = self.feature_cache.get(key, component.name)
+            if outputs is None:
+                missing.append((key, example))
+            else:
+                for attr, value in outputs.items():
+                    example.set(attr, self._decode(attr, value, context))
+
+        if missing:
+            process([example for _, example in missing])
+
+        for key, example in missing:
+            outputs = {
+                attr: self._encode(attr, example.get(attr)) for attr in attributes
+            }
+            self.feature_cache.put(key, outputs, component.name)
+
+        for attr in attributes:
+            keys[attr] = {
+                id(example): key for key, example in zip(example_keys, examples)
+            }
+
+        self.feature_cache.add_time(component.name, time.time() - start)
+
+    def _train_cached_features(
+        self,
+        component: Component,
+        examples: List[Message],
+        example_keys: List[Text],
+        feature_store: FeatureStore,
+    ) -> None:
+        rows = []
+        missing = []
+        for i, key in enumerate(example_keys):
+            key = fingerprint(key, "features")
+            row = self.feature_cache.get(key, component.name)
+            rows.append(row)
+            if row is None:
+                missing.append((i, key))
+
+        if missing:
+            # noinspection PyPep8Naming
+            X = component.features([examples[i] for i, _ in missing])
+            for (i, key), row in zip(missing, X):
+                rows[i] = row
+                self.feature_cache.put(key, row, component.name)
+
+        feature_store.add(component.name, stack_rows(rows))
+
+    @staticmethod
+    def _input_key(
+        example: Message, attr: Text, keys: Dict[Text, Dict[int, Text]]
+    ) -> Any:
+        """Key of an attribute of an example, a hash of its value if no
+        cached component set it."""
+
+        key = keys.get(attr, {}).get(id(example))
+        if key is not None:
+            return key
+
+        value = example.get(attr)
+        if value is None:
+            return None
+        elif attr == "spacy_doc":
+            return fingerprint(value.to_bytes())
+        elif attr == "tokens":
+            return fingerprint([(t.text, t.offset) for t in value])
+        elif scipy.sparse.issparse(value):
+            value = value.tocsr()
+            return fingerprint(
+                value.shape, value.data.tobytes(), value.indices.tobytes()
+            )
+        elif isinstance(value, np.ndarray):
+            return fingerprint(value.shape, str(value.dtype), value.tobytes())
+        return fingerprint(value)
+
+    @staticmethod
+    def _library_state(component: Component) -> Any:
+        nlp = getattr(component, "nlp", None)
+        if nlp is None:
+            return None
+
+        import spacy
+
+        return [spacy.about.__version__, nlp.meta.get("name"), nlp.meta.get("version")]
+
+    @staticmethod
+    def _encode(attr: Text, value: Any) -> Any:
+        if attr == "spacy_doc" and value is not None:
+            return value.to_bytes()
+        return value
+
+    @staticmethod
+    def _decode(attr: Text, value: Any, context: Dict[Text, Any]) -> Any:
+        if attr == "spacy_doc" and value is not None:
+            from spacy.tokens import Doc
+
+            return Doc(context["spacy_nlp"].vocab).from_bytes(value)
+        return value
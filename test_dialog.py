@@ -16,17 +16,25 @@ from rasa_core import utils, train, run
 
 from rasa_core.training import interactive
 
+from custom_code.component_cache import load_interpreter
+
+
+def nlu_interpreter(model_dir):
+    # components identical to those of an already loaded model are shared
+    interpreter = RasaNLUInterpreter(model_dir, lazy_init=True)
+    interpreter.interpreter = load_interpreter(model_dir)
+    return interpreter
 
 
 def run_dialogue(serve_forever=True):
-    interpreter = RasaNLUInterpreter('./models/nlu/default/chat')
+    interpreter = nlu_interpreter('./models/nlu/default/chat')
     action_endpoint = EndpointConfig(url="http://localhost:5055/webhook")
     agent = Agent.load('./models/dialog', interpreter=interpreter, action_endpoint=action_endpoint)
     rasa_core.run.serve_application(agent, channel='cmdline')
     return agent
 
 def run_online_dialogue(serve_forever=True):
-    interpreter = RasaNLUInterpreter('./models/nlu/default/chat')
+    interpreter = nlu_interpreter('./models/nlu/default/chat')
     action_endpoint = EndpointConfig(url="http://localhost:5055/webhook")
     agent = Agent.load('./models/dialogue', interpreter=interpreter, action_endpoint=action_endpoint)
     interactive.run_interactive_learning(agent, channel='cmdline')
@@ -0,0 +1,18 @@
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+from custom_code.featurizer import StreamingTfidfVectorizer
+
+
+def test_streaming_unseen_word_without_smooth_idf():
+    vectorizer = StreamingTfidfVectorizer(
+        str.split, n_features=2 ** 10, smooth_idf=False
+    )
+    vectorizer.fit(["a b", "a c"])
+
+    X = vectorizer.transform(["a zzz"])
+
+    assert np.isfinite(X.data).all()
+    assert X.nnz == 1
+    np.testing.assert_allclose(X.toarray(), vectorizer.transform(["a"]).toarray())
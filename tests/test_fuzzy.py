@@ -0,0 +1,78 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from custom_code.fuzzy import FuzzyIndex, fold
+
+PRODUCTS = {"kế_toán": "sme", "kế_toán doanh_nghiệp": "sme", "ktdn": "sme"}
+PACKAGES = {"pro": "professional", "cơ_bản": "standard", "cao_cấp": "enterprise"}
+SCOPES = {
+    "tài_sản cố_định": "13",
+    "tiền_lương": "13",
+    "thuế": "11",
+    "kho": "11",
+}
+
+
+def test_fold():
+    assert fold("Tài_sản  Cố_Định") == "tai san co dinh"
+    assert fold("đồng") == "dong"
+
+
+def test_exact_key():
+    index = FuzzyIndex(PRODUCTS)
+    assert index.get("kế_toán") == "sme"
+    assert index["ktdn"] == "sme"
+
+
+def test_folded_key():
+    index = FuzzyIndex(PRODUCTS)
+    assert index.get("ke toan") == "sme"
+    assert index.get("Kế Toán") == "sme"
+
+
+def test_key_within_edit_distance():
+    assert FuzzyIndex(SCOPES).get("tai san co dihn") == "13"
+    assert FuzzyIndex(PACKAGES, include_values=True).get("profesional") == (
+        "professional"
+    )
+
+
+def test_no_fuzzy_match_of_short_words():
+    index = FuzzyIndex(SCOPES)
+    assert index.get("kho") == "11"
+    assert index.get("khi") is None
+    assert index.get("thie") is None
+    # one edit in a longer word is fine
+    assert index.get("tien luog") == "13"
+
+
+def test_keys_of_different_values_are_ambiguous():
+    # the same folded form
+    index = FuzzyIndex({"thuế": "11", "thuê": "16", "thuê bao": "16"})
+    assert index.get("thuế") == "11"
+    assert index.get("thuê") == "16"
+    assert index.get("thue") is None
+    assert index.get("thue bao") == "16"
+
+    # equally close keys
+    index = FuzzyIndex({"bán hàng": "11", "bán hành": "16"})
+    assert index.get("ban hanx") is None
+    # keys of the same value aren't
+    index = FuzzyIndex({"bán hàng": "11", "bán hành": "11"})
+    assert index.get("ban hanx") == "11"
+
+
+def test_unknown_and_non_string_keys():
+    index = FuzzyIndex(PRODUCTS)
+    assert index.get("phần mềm bán hàng") is None
+    assert index.get("phần mềm bán hàng", "default") == "default"
+
+    for key in [None, 13, ["kế_toán"]]:
+        assert index.get(key) is None
+        assert index.get(key, "default") == "default"
+        with pytest.raises(KeyError):
+            index[key]
+
+    with pytest.raises(KeyError):
+        index["phần mềm bán hàng"]
@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import os
+import random
+
+from custom_code.promotions import PromotionsEngine
+
+PROMOTIONS = os.path.join(
+    os.path.dirname(__file__), os.pardir, "custom_code", "promotions.json"
+)
+
+
+def test_campaign_boundaries():
+    engine = PromotionsEngine.from_json(PROMOTIONS)
+
+    def texts(*t):
+        return [c.text for c in engine.active("sme", datetime.datetime(*t))]
+
+    assert len(texts(2019, 4, 1, 0, 0)) == 3
+    assert len(texts(2019, 4, 30, 23, 59)) == 3
+    assert texts(2019, 5, 1, 0, 0) == []
+    assert texts(2019, 3, 31, 23, 59) == []
+    assert engine.active("unknown", datetime.datetime(2019, 4, 15)) == []
+
+
+def test_times_of_day():
+    engine = PromotionsEngine.from_records(
+        [
+            {
+                "product": "sme",
+                "start": "2019-04-01 08:00",
+                "end": "2019-04-01 12:00",
+                "text": "morning",
+            },
+            {
+                "product": "sme",
+                "start": "2019-04-01T12:00:00",
+                "end": "2019-04-01",
+                "text": "afternoon",
+            },
+        ]
+    )
+
+    def texts(hour, minute=0):
+        t = datetime.datetime(2019, 4, 1, hour, minute)
+        return [c.text for c in engine.active("sme", t)]
+
+    assert texts(7, 59) == []
+    assert texts(8) == ["morning"]
+    assert texts(12) == ["afternoon"]
+    assert texts(23, 59) == ["afternoon"]
+
+
+def test_overlapping_campaigns_match_a_linear_scan():
+    rng = random.Random(2019)
+    first_day = datetime.date(2019, 1, 1)
+
+    records = []
+    for i in range(500):
+        start = first_day + datetime.timedelta(days=rng.randrange(365))
+        end = start + datetime.timedelta(days=rng.randrange(-1, 60))
+        records.append(
+            {
+                "product": rng.choice(["sme", "amis"]),
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "text": "campaign {}".format(i),
+            }
+        )
+    engine = PromotionsEngine.from_records(records)
+
+    # many campaigns overlap
+    assert len(engine.active("sme", datetime.datetime(2019, 6, 1))) > 10
+
+    for _ in range(300):
+        t = datetime.datetime(2019, 1, 1) + datetime.timedelta(
+            minutes=rng.randrange(400 * 24 * 60)
+        )
+        for product in ["sme", "amis"]:
+            expected = [
+                r["text"]
+                for r in records
+                if r["product"] == product
+                and r["start"] <= t.date().isoformat() <= r["end"]
+            ]
+            # in the order of the data file
+            assert [c.text for c in engine.active(product, t)] == expected
@@ -0,0 +1,157 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from custom_code.resp_server import LocalRespServer
+from custom_code.sessions import (
+    MemorySessionStore,
+    RedisSessionStore,
+    SQLiteSessionStore,
+    create_session_store,
+)
+
+TTL = 10.0
+
+
+class Clock(object):
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float = 1.0) -> None:
+        self.now += seconds
+
+
+@pytest.fixture(scope="module")
+def resp_server():
+    server = LocalRespServer(port=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store_factory(request, tmpdir, resp_server):
+    clock = Clock()
+    stores = []
+
+    def create(max_size=100):
+        if request.param == "memory":
+            store = MemorySessionStore(TTL, max_size, clock=clock)
+        elif request.param == "sqlite":
+            store = SQLiteSessionStore(
+                tmpdir.join("sessions.db").strpath,
+                TTL,
+                max_size,
+                clock=clock,
+                sweep_every=1,
+            )
+        else:
+            # the stand-in expires the keys by the same clock
+            resp_server.database.clock = clock
+            store = RedisSessionStore(
+                TTL, max_size, port=resp_server.port, clock=clock, sweep_every=1
+            )
+        store.clear()
+        stores.append(store)
+        return store
+
+    yield create, clock
+
+    for store in stores:
+        store.close()
+
+
+def test_get_set_pop(store_factory):
+    create, _ = store_factory
+    store = create()
+
+    assert store.get("a") is None
+    assert store.get("a", "default") == "default"
+
+    store.set("a", {"pname": "sme", "pscopes": 11.0})
+    assert store.get("a") == {"pname": "sme", "pscopes": 11.0}
+    assert "a" in store
+
+    assert store.pop("a") == {"pname": "sme", "pscopes": 11.0}
+    assert store.get("a") is None
+    assert store.pop("a", "gone") == "gone"
+    assert len(store) == 0
+
+
+def test_sessions_expire_after_ttl(store_factory):
+    create, clock = store_factory
+    store = create()
+
+    store.set("a", 1)
+    clock.advance(TTL - 1)
+    store.set("b", 2)
+    # reading a session doesn't extend it
+    assert store.get("a") == 1
+
+    clock.advance(1)
+    assert store.get("a") is None
+    assert store.get("b") == 2
+    assert store.stats()["size"] == 1
+
+    clock.advance(TTL)
+    assert store.get("b") is None
+    assert store.stats()["size"] == 0
+
+
+def test_least_recently_used_sessions_are_evicted(store_factory):
+    create, clock = store_factory
+    store = create(max_size=3)
+
+    for key in ["k0", "k1", "k2"]:
+        store.set(key, key)
+        clock.advance()
+
+    assert store.get("k0") == "k0"
+    clock.advance()
+
+    for key in ["k3", "k4"]:
+        store.set(key, key)
+        clock.advance()
+
+    values = store.get_many(["k0", "k1", "k2", "k3", "k4"])
+    assert sorted(values) == ["k0", "k3", "k4"]
+    stats = store.stats()
+    assert stats["size"] == 3
+    assert stats["evictions"] == 2
+
+
+def test_batched_reads_and_writes(store_factory):
+    create, _ = store_factory
+    store = create()
+
+    store.set_many({"a": 1, "b": [2, 3], "c": {"d": 4}})
+
+    assert store.get_many(["a", "b", "c", "missing"]) == {
+        "a": 1,
+        "b": [2, 3],
+        "c": {"d": 4},
+    }
+    assert store.get_many([]) == {}
+
+    stats = store.stats()
+    assert stats["size"] == 3
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_create_session_store(tmpdir, resp_server):
+    path = tmpdir.join("sessions.db").strpath
+    for url, cls in [
+        (None, MemorySessionStore),
+        ("memory://", MemorySessionStore),
+        ("sqlite:///" + path, SQLiteSessionStore),
+        ("redis://localhost:{}/0".format(resp_server.port), RedisSessionStore),
+    ]:
+        store = create_session_store(url, TTL)
+        assert isinstance(store, cls)
+        store.close()
+
+    with pytest.raises(ValueError):
+        create_session_store("mongodb://localhost", TTL)
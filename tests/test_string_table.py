@@ -0,0 +1,30 @@
+from __future__ import absolute_import, division, print_function
+
+import struct
+
+from custom_code import string_table
+from custom_code.string_table import HEADER, StringTable
+
+WORDS = ["kế toán", "bán hàng", "nhân sự", "tài sản"]
+
+
+def test_offsets_are_little_endian():
+    data = StringTable.encode(WORDS)
+
+    _, count, blob_size = HEADER.unpack_from(data)
+    offsets = struct.unpack_from("<{}I".format(count + 1), data, HEADER.size)
+
+    assert offsets[0] == 0
+    assert offsets[-1] == blob_size
+    assert list(StringTable(data)) == sorted(WORDS, key=lambda w: w.encode("utf-8"))
+
+
+def test_tables_load_on_big_endian_hosts(monkeypatch):
+    data = StringTable.encode(WORDS)
+
+    monkeypatch.setattr(string_table, "SWAP_OFFSETS", True)
+    # as a big-endian host would write and read them, swapped twice on this one
+    assert StringTable.encode(WORDS) != data
+    table = StringTable(StringTable.encode(WORDS))
+    assert "kế toán" in table
+    assert table.first_with_prefix("tài") == "tài sản"
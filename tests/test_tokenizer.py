@@ -0,0 +1,21 @@
+from __future__ import absolute_import, division, print_function
+
+from custom_code.tokenizer import TokenSequence
+
+
+def test_token_view_data_is_live():
+    tokens = TokenSequence.from_spans([("phần_mềm", 0), ("kế_toán", 9)])
+    token = tokens[0]
+
+    token.data["pos"] = "N"
+    assert token.get("pos") == "N"
+    assert tokens[0].data == {"pos": "N"}
+    assert tokens[1].data == {}
+
+    token.set("ner", "product")
+    assert dict(token.data) == {"pos": "N", "ner": "product"}
+
+    del token.data["pos"]
+    assert token.get("pos") is None
+    assert "pos" not in token.data
+    assert len(token.data) == 1
@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function
+
+from rasa_nlu.components import Component
+from rasa_nlu.config import RasaNLUModelConfig
+from rasa_nlu.training_data import Message, TrainingData
+
+from custom_code.feature_cache import fingerprint
+from custom_code.tokenizer import ViTokenizer
+from custom_code.trainer import ViTrainer
+
+TEXTS = [
+    "xin chào shop",
+    "cho mình hỏi giá phần mềm kế toán",
+    "phần mềm quản lý bán hàng giá bao nhiêu",
+    "tạm biệt nhé",
+]
+
+
+class DatasetStats(Component):
+    """Not cacheable, its output depends on all the training data."""
+
+    provides = ["dataset_size"]
+
+    def train(self, training_data, cfg, **kwargs):
+        for example in training_data.training_examples:
+            example.set("dataset_size", len(training_data.training_examples))
+
+
+class TokenCounter(Component):
+    """Cacheable, counts the messages it processed."""
+
+    provides = ["token_count"]
+
+    cached_attributes = ["token_count"]
+    cached_inputs = ["tokens"]
+
+    def __init__(self, component_config=None):
+        super(TokenCounter, self).__init__(component_config)
+        self.processed = 0
+
+    def fit(self, training_data, cfg=None, **kwargs):
+        pass
+
+    def fingerprint(self):
+        return fingerprint(self.component_config)
+
+    @staticmethod
+    def cached_examples(training_data):
+        return training_data.training_examples
+
+    def process_batch(self, messages, **kwargs):
+        for message in messages:
+            message.set("token_count", len(message.get("tokens")))
+        self.processed += len(messages)
+
+
+def train(texts, cache_dir):
+    trainer = ViTrainer(
+        RasaNLUModelConfig({"language": "vi", "pipeline": []}),
+        skip_validation=True,
+        cache_dir=cache_dir,
+    )
+    counter = TokenCounter()
+    trainer.pipeline = [ViTokenizer(), DatasetStats(), counter]
+
+    data = TrainingData([Message(t, {"intent": "greet"}) for t in texts])
+    trainer.train(data)
+    return trainer, counter
+
+
+def test_edit_recomputes_only_the_edited_example(tmpdir):
+    cache_dir = tmpdir.strpath
+
+    _, counter = train(TEXTS, cache_dir)
+    assert counter.processed == len(TEXTS)
+
+    edited = list(TEXTS)
+    edited[1] = "cho mình hỏi giá phần mềm kế toán doanh nghiệp"
+    trainer, counter = train(edited, cache_dir)
+
+    stats = trainer.feature_cache.report()["components"]
+    assert stats[ViTokenizer().name]["misses"] == 1
+    assert stats[TokenCounter().name]["misses"] == 1
+    assert counter.processed == 1
+
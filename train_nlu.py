@@ -1,12 +1,14 @@
 from rasa_nlu import config
 from rasa_nlu.model import Interpreter
-from rasa_nlu.model import Trainer
 from rasa_nlu.training_data import load_data
 
+from custom_code.trainer import ViTrainer
+
 
 def train (data, config_file, model_dir):
     training_data = load_data(data)
-    trainer = Trainer(config.load(config_file))
+    # reuses the features of unchanged examples from earlier runs
+    trainer = ViTrainer(config.load(config_file), cache_dir='.nlu_cache')
     trainer.train(training_data,num_threads=3)
     trainer.persist(model_dir, fixed_model_name='chat')
 